@@ -1,16 +1,50 @@
-from .exp_obj import (  # noqa: F401
-    ExperimentRun,
-)
-from .contextmgr import (  # noqa: F401
-    ExperimentRunContext,
-)
-from .shared import (  # noqa: F401
-    log_df,
-    log_obj,
-    log_obj_as_text,
-)
-
-
-from ._version import get_versions
-__version__ = get_versions()['version']
-del get_versions
+"""Opinionated wrappers for the mlflow tracking API.
+
+Public names are loaded lazily, on first access, so that importing actarius
+does not import mlflow and the rest of its heavy dependencies.
+"""
+
+import importlib
+
+
+# maps each public name to the submodule defining it
+_LAZY_ATTRS = {
+    'ExperimentRun': 'exp_obj',
+    'ExperimentRunContext': 'contextmgr',
+    'AsyncExperimentRun': 'aio',
+    'AsyncExperimentRunContext': 'aio',
+    'RunBatch': 'sweep',
+    'wait_for_flushes': 'flush',
+    'load_obj': 'serialize',
+    'log_df': 'shared',
+    'log_obj': 'shared',
+    'log_obj_as_text': 'shared',
+    'CachePolicy': 'tags',
+    'register_tag_collector': 'tags',
+    'unregister_tag_collector': 'tags',
+}
+
+__all__ = list(_LAZY_ATTRS)
+
+
+def _load_attr(name):
+    if name == '__version__':
+        from ._version import get_versions
+        value = get_versions()['version']
+    else:
+        module = importlib.import_module(
+            '.' + _LAZY_ATTRS[name], __name__)
+        value = getattr(module, name)
+    globals()[name] = value
+    return value
+
+
+def __getattr__(name):
+    if name != '__version__' and name not in _LAZY_ATTRS:
+        raise AttributeError(
+            "module {!r} has no attribute {!r}".format(__name__, name))
+    return _load_attr(name)
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRS) | {'__version__'})
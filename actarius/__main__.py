@@ -0,0 +1,7 @@
+"""Runs the actarius command line interface with python -m actarius."""
+
+import sys
+
+from .cli import main
+
+sys.exit(main())
@@ -0,0 +1,188 @@
+"""asyncio-native experiment runs.
+
+Blocking MLflow and filesystem calls of async runs are run on a bounded,
+process-wide thread pool, so that a single event loop can drive many
+concurrent runs without stalling.
+"""
+
+import asyncio
+import functools
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+
+from .cfg import (
+    CFG,
+    CfgKey,
+)
+from .exp_obj import ExperimentRun
+
+
+@lru_cache(maxsize=1)
+def aio_executor():
+    """Returns the thread pool running the blocking calls of async runs."""
+    return ThreadPoolExecutor(
+        max_workers=CFG[CfgKey.AIO_WORKERS],
+        thread_name_prefix='actarius-aio',
+    )
+
+
+async def run_blocking(fn, *args, **kwargs):
+    """Runs a blocking call on the pool of async runs, and awaits it.
+
+    Parameters
+    ----------
+    fn : callable
+        The function to call.
+    *args
+        Positional arguments to call fn with.
+    **kwargs
+        Keyword arguments to call fn with.
+
+    Returns
+    -------
+    object
+        The result of fn.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        aio_executor(), functools.partial(fn, *args, **kwargs))
+
+
+class AsyncExperimentRun(object):
+    """A run of an MLflow experiment, logged into from asyncio code.
+
+    Tags, params and metrics are buffered in memory, and artifacts are
+    written on the pool of async runs, at most AIO_WORKERS at a time. The run
+    is only created in MLflow by end_run(), which reports it as an
+    ExperimentRun created with async_flush=True does.
+
+    Parameters
+    ----------
+    experiment_name : str
+        Name of experiment to be activated. In case of a databricks experiment,
+        this is the full path to the databricks experiment used to track
+        experiment results.
+    run_name : str, optional
+        Name of new run (stored as a mlflow.runName tag).
+    nested : bool, default False
+        Controls whether run is nested in parent run. True creates a nest run.
+    artifacts_dpath : str, optional
+        The path to the local filesystem directory where experiment artifacts
+        will be saved. If not given, a default one is created.
+    track_resources : bool, default False
+        If True, resource usage of the process is logged as step metrics.
+        See ExperimentRun.
+    capture_output : bool, default False
+        If True, stdout and stderr are captured into a log file uploaded with
+        the run. Off by default, as console output of concurrent runs of the
+        same event loop can not be told apart.
+    """
+
+    def __init__(
+            self, experiment_name, run_name=None, nested=False,
+            artifacts_dpath=None, track_resources=False,
+            capture_output=False,
+    ):
+        self.run = ExperimentRun(
+            experiment_name=experiment_name,
+            run_name=run_name,
+            nested=nested,
+            artifacts_dpath=artifacts_dpath,
+            async_flush=True,
+            track_resources=track_resources,
+            capture_output=capture_output,
+        )
+
+    @property
+    def run_id(self):
+        """The id of the MLflow run, once created by end_run()."""
+        return getattr(self.run, 'run_id', None)
+
+    @property
+    def running(self):
+        return self.run.running
+
+    async def set_tag(self, name, val):
+        self.run.set_tag(name, val)
+
+    async def set_tags(self, tag_dict):
+        self.run.set_tags(tag_dict)
+
+    async def log_param(self, name, val):
+        self.run.log_param(name, val)
+
+    async def log_params(self, param_dict):
+        self.run.log_params(param_dict)
+
+    async def log_metric(self, name, val, step=None, timestamp=None):
+        """Logs a metric value. See ExperimentRun.log_metric."""
+        self.run.log_metric(name, val, step=step, timestamp=timestamp)
+
+    async def log_metrics(self, metric_dict, step=None, timestamp=None):
+        """Logs multiple metric values. See ExperimentRun.log_metrics."""
+        self.run.log_metrics(metric_dict, step=step, timestamp=timestamp)
+
+    def span(self, name):
+        """Times a named span of this run. See ExperimentRun.span.
+
+        Spans opened by concurrent tasks nest independently of each other.
+        """
+        return self.run.span(name)
+
+    async def log_df(self, df, name, format=None):
+        """Logs a dataframe as an artifact. See ExperimentRun.log_df."""
+        await run_blocking(self.run.log_df, df, name, format=format)
+
+    async def log_obj(self, obj, name, compression=None, out_of_band=False):
+        """Logs a pickled object as an artifact. See ExperimentRun.log_obj."""
+        await run_blocking(
+            self.run.log_obj, obj, name,
+            compression=compression, out_of_band=out_of_band)
+
+    async def log_obj_as_text(self, obj, name):
+        """Logs the text of an object as an artifact. See ExperimentRun."""
+        await run_blocking(self.run.log_obj_as_text, obj, name)
+
+    async def end_run(
+            self, tags=None, params=None, metrics=None,
+            artifacts_dir_paths=None):
+        """Ends this run and reports it to MLflow, without blocking the loop.
+
+        Returns once the run is fully reported. See ExperimentRun.end_run for
+        the parameters.
+        """
+        future = await run_blocking(
+            self.run.end_run,
+            tags=tags,
+            params=params,
+            metrics=metrics,
+            artifacts_dir_paths=artifacts_dir_paths,
+        )
+        if future is not None:
+            await asyncio.wrap_future(future)
+
+
+class AsyncExperimentRunContext(object):
+    """An async context manager of an AsyncExperimentRun.
+
+    Parameters are those of AsyncExperimentRun.
+
+    Example
+    -------
+    >>> async def evaluate(model):  # doctest: +SKIP
+    ...     async with AsyncExperimentRunContext('eval') as run:
+    ...         await run.log_metric('accuracy', await score(model))
+    """
+
+    def __init__(self, experiment_name, **kwargs):
+        self.experiment_name = experiment_name
+        self.kwargs = kwargs
+        self.run = None
+
+    async def __aenter__(self):
+        self.run = AsyncExperimentRun(self.experiment_name, **self.kwargs)
+        return self.run
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.run.end_run()
+        return False
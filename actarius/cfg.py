@@ -7,15 +7,120 @@ import birch
 
 class CfgKey():
     PRINT_STACKTRACE = 'PRINT_STACKTRACE'
+    FLUSH_WORKERS = 'FLUSH_WORKERS'
+    FLUSH_TIMEOUT_SEC = 'FLUSH_TIMEOUT_SEC'
+    ARTIFACT_UPLOAD_WORKERS = 'ARTIFACT_UPLOAD_WORKERS'
+    METRIC_FLUSH_EVERY = 'METRIC_FLUSH_EVERY'
+    METRIC_FLUSH_INTERVAL_SEC = 'METRIC_FLUSH_INTERVAL_SEC'
+    LOG_BUFFER_SIZE = 'LOG_BUFFER_SIZE'
+    LOG_FLUSH_INTERVAL_SEC = 'LOG_FLUSH_INTERVAL_SEC'
+    LOG_STREAM_CHUNK_BYTES = 'LOG_STREAM_CHUNK_BYTES'
+    LOG_STREAM_INTERVAL_SEC = 'LOG_STREAM_INTERVAL_SEC'
+    LOG_COMPRESSION = 'LOG_COMPRESSION'
+    LOG_MAX_BYTES = 'LOG_MAX_BYTES'
+    LOG_SEGMENTS = 'LOG_SEGMENTS'
+    DF_COLUMNAR_MIN_CELLS = 'DF_COLUMNAR_MIN_CELLS'
+    IN_MEMORY_ARTIFACT_MAX_BYTES = 'IN_MEMORY_ARTIFACT_MAX_BYTES'
+    OBJ_COMPRESSION = 'OBJ_COMPRESSION'
+    TAGS_CACHE_TTL_SEC = 'TAGS_CACHE_TTL_SEC'
+    TAG_COLLECTOR_TIMEOUT_SEC = 'TAG_COLLECTOR_TIMEOUT_SEC'
+    PROFILE_TOP_N = 'PROFILE_TOP_N'
+    PROFILE_SAMPLE_INTERVAL_SEC = 'PROFILE_SAMPLE_INTERVAL_SEC'
+    RESOURCE_SAMPLE_INTERVAL_SEC = 'RESOURCE_SAMPLE_INTERVAL_SEC'
+    SPOOL_WHEN_OFFLINE = 'SPOOL_WHEN_OFFLINE'
+    SPOOL_DPATH = 'SPOOL_DPATH'
+    SPOOL_LOCK_STALE_SEC = 'SPOOL_LOCK_STALE_SEC'
+    RETRY_MAX_ATTEMPTS = 'RETRY_MAX_ATTEMPTS'
+    RETRY_BACKOFF_BASE_SEC = 'RETRY_BACKOFF_BASE_SEC'
+    RETRY_BACKOFF_MAX_SEC = 'RETRY_BACKOFF_MAX_SEC'
+    BREAKER_FAILURE_THRESHOLD = 'BREAKER_FAILURE_THRESHOLD'
+    BREAKER_RESET_SEC = 'BREAKER_RESET_SEC'
+    AIO_WORKERS = 'AIO_WORKERS'
+    SWEEP_WORKERS = 'SWEEP_WORKERS'
+    EXPERIMENT_CACHE_TTL_SEC = 'EXPERIMENT_CACHE_TTL_SEC'
+    EXPERIMENT_CACHE_ON_DISK = 'EXPERIMENT_CACHE_ON_DISK'
+    HTTP_POOLING = 'HTTP_POOLING'
+    HTTP_POOL_SIZE = 'HTTP_POOL_SIZE'
+    HTTP_CONNECT_TIMEOUT_SEC = 'HTTP_CONNECT_TIMEOUT_SEC'
+    HTTP_READ_TIMEOUT_SEC = 'HTTP_READ_TIMEOUT_SEC'
 
 
 CFG = birch.Birch(
     namespace='actarius',
     defaults={
-        CfgKey.PRINT_STACKTRACE: 'False'
+        CfgKey.PRINT_STACKTRACE: 'False',
+        CfgKey.FLUSH_WORKERS: '2',
+        CfgKey.FLUSH_TIMEOUT_SEC: '300',
+        CfgKey.ARTIFACT_UPLOAD_WORKERS: '8',
+        CfgKey.METRIC_FLUSH_EVERY: '1000',
+        CfgKey.METRIC_FLUSH_INTERVAL_SEC: '30',
+        CfgKey.LOG_BUFFER_SIZE: '1048576',
+        CfgKey.LOG_FLUSH_INTERVAL_SEC: '1',
+        CfgKey.LOG_STREAM_CHUNK_BYTES: '1048576',
+        CfgKey.LOG_STREAM_INTERVAL_SEC: '60',
+        CfgKey.LOG_COMPRESSION: '',
+        CfgKey.LOG_MAX_BYTES: '0',
+        CfgKey.LOG_SEGMENTS: '4',
+        CfgKey.DF_COLUMNAR_MIN_CELLS: '1000000',
+        CfgKey.IN_MEMORY_ARTIFACT_MAX_BYTES: '16777216',
+        CfgKey.OBJ_COMPRESSION: '',
+        CfgKey.TAGS_CACHE_TTL_SEC: '3600',
+        CfgKey.TAG_COLLECTOR_TIMEOUT_SEC: '10',
+        CfgKey.PROFILE_TOP_N: '20',
+        CfgKey.PROFILE_SAMPLE_INTERVAL_SEC: '0.01',
+        CfgKey.RESOURCE_SAMPLE_INTERVAL_SEC: '10',
+        CfgKey.SPOOL_WHEN_OFFLINE: 'True',
+        CfgKey.SPOOL_DPATH: '',
+        CfgKey.SPOOL_LOCK_STALE_SEC: '3600',
+        CfgKey.RETRY_MAX_ATTEMPTS: '5',
+        CfgKey.RETRY_BACKOFF_BASE_SEC: '0.5',
+        CfgKey.RETRY_BACKOFF_MAX_SEC: '30',
+        CfgKey.BREAKER_FAILURE_THRESHOLD: '5',
+        CfgKey.BREAKER_RESET_SEC: '60',
+        CfgKey.AIO_WORKERS: '8',
+        CfgKey.SWEEP_WORKERS: '16',
+        CfgKey.EXPERIMENT_CACHE_TTL_SEC: '3600',
+        CfgKey.EXPERIMENT_CACHE_ON_DISK: 'False',
+        CfgKey.HTTP_POOLING: 'True',
+        CfgKey.HTTP_POOL_SIZE: '32',
+        CfgKey.HTTP_CONNECT_TIMEOUT_SEC: '10',
+        CfgKey.HTTP_READ_TIMEOUT_SEC: '120',
     },
     default_casters={
         CfgKey.PRINT_STACKTRACE: birch.casters.true_false_caster,
+        CfgKey.FLUSH_WORKERS: int,
+        CfgKey.FLUSH_TIMEOUT_SEC: float,
+        CfgKey.ARTIFACT_UPLOAD_WORKERS: int,
+        CfgKey.METRIC_FLUSH_EVERY: int,
+        CfgKey.METRIC_FLUSH_INTERVAL_SEC: float,
+        CfgKey.LOG_BUFFER_SIZE: int,
+        CfgKey.LOG_FLUSH_INTERVAL_SEC: float,
+        CfgKey.LOG_STREAM_CHUNK_BYTES: int,
+        CfgKey.LOG_STREAM_INTERVAL_SEC: float,
+        CfgKey.LOG_MAX_BYTES: int,
+        CfgKey.LOG_SEGMENTS: int,
+        CfgKey.DF_COLUMNAR_MIN_CELLS: int,
+        CfgKey.IN_MEMORY_ARTIFACT_MAX_BYTES: int,
+        CfgKey.TAGS_CACHE_TTL_SEC: float,
+        CfgKey.TAG_COLLECTOR_TIMEOUT_SEC: float,
+        CfgKey.PROFILE_TOP_N: int,
+        CfgKey.PROFILE_SAMPLE_INTERVAL_SEC: float,
+        CfgKey.RESOURCE_SAMPLE_INTERVAL_SEC: float,
+        CfgKey.SPOOL_WHEN_OFFLINE: birch.casters.true_false_caster,
+        CfgKey.SPOOL_LOCK_STALE_SEC: float,
+        CfgKey.RETRY_MAX_ATTEMPTS: int,
+        CfgKey.RETRY_BACKOFF_BASE_SEC: float,
+        CfgKey.RETRY_BACKOFF_MAX_SEC: float,
+        CfgKey.BREAKER_FAILURE_THRESHOLD: int,
+        CfgKey.BREAKER_RESET_SEC: float,
+        CfgKey.AIO_WORKERS: int,
+        CfgKey.SWEEP_WORKERS: int,
+        CfgKey.EXPERIMENT_CACHE_TTL_SEC: float,
+        CfgKey.EXPERIMENT_CACHE_ON_DISK: birch.casters.true_false_caster,
+        CfgKey.HTTP_POOLING: birch.casters.true_false_caster,
+        CfgKey.HTTP_POOL_SIZE: int,
+        CfgKey.HTTP_CONNECT_TIMEOUT_SEC: float,
+        CfgKey.HTTP_READ_TIMEOUT_SEC: float,
     },
 )
 
@@ -23,4 +128,9 @@ CFG = birch.Birch(
 PRINT_STACKTRACE = CFG[CfgKey.PRINT_STACKTRACE]
 
 TEMP_DIR = CFG.xdg_cache_dpath()
-os.makedirs(TEMP_DIR, exist_ok=True)
+
+
+def temp_dir():
+    """Returns the temporary directory of actarius, creating it if needed."""
+    os.makedirs(TEMP_DIR, exist_ok=True)
+    return TEMP_DIR
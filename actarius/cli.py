@@ -0,0 +1,65 @@
+"""The actarius command line interface."""
+
+import argparse
+
+
+def _replay(args):
+    # imported here, so that the help of the CLI does not import mlflow
+    from .spool import replay_spooled_runs, spool_dpath
+    spool_dir = args.spool_dir or spool_dpath()
+    print("Replaying runs spooled in {}...".format(spool_dir))
+    run_ids, failed = replay_spooled_runs(
+        spool_dir=spool_dir,
+        include_incomplete=args.include_incomplete,
+        keep=args.keep,
+    )
+    print("Replayed {} runs; {} failed.".format(len(run_ids), len(failed)))
+    for dpath in failed:
+        print("Failed to replay {}".format(dpath))
+    return 1 if failed else 0
+
+
+def main(argv=None):
+    """Runs the actarius command line interface.
+
+    Parameters
+    ----------
+    argv : list of str, optional
+        The command line arguments. Defaults to sys.argv[1:].
+
+    Returns
+    -------
+    int
+        The exit code of the command.
+    """
+    parser = argparse.ArgumentParser(
+        prog='actarius',
+        description="Opinionated wrappers for the mlflow tracking API.",
+    )
+    subparsers = parser.add_subparsers(dest='command')
+    replay_parser = subparsers.add_parser(
+        'replay',
+        help="Report runs spooled while MLflow was unreachable.",
+    )
+    replay_parser.add_argument(
+        '--spool-dir',
+        help="The directory runs were spooled in. Defaults to the "
+             "ACTARIUS__SPOOL_DPATH configuration value.",
+    )
+    replay_parser.add_argument(
+        '--include-incomplete',
+        action='store_true',
+        help="Also replay runs that never ended, e.g. as their process "
+             "crashed, as failed runs.",
+    )
+    replay_parser.add_argument(
+        '--keep',
+        action='store_true',
+        help="Keep replayed runs in the spool.",
+    )
+    replay_parser.set_defaults(func=_replay)
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.print_help()
+        return 2
+    return args.func(args)
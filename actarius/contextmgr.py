@@ -2,6 +2,7 @@
 
 import os
 import time
+import shutil
 # import atexit
 import warnings
 import traceback
@@ -9,16 +10,39 @@ import traceback
 import mlflow
 from mlflow.exceptions import MlflowException
 # from mlflow.tracking.fluent import end_run as fluent_end_run
-from databricks_cli.utils import InvalidConfigurationError
+try:
+    from databricks_cli.utils import InvalidConfigurationError
+except ImportError:
+    from .exceptions import MockDatabricksInvalidConfigurationError as InvalidConfigurationError  # noqa: E501
 
+from . import transport
 from .shared import (
     ArgusArtifactory,
     DoubleLogger,
+    LogStreamer,
+    _spool_fallback,
+    _with_experiment_id,
+    init_tracking,
+    log_batch,
     set_shared_tags,
+    tracking_client,
 )
 from .cfg import (
-    TEMP_DIR,
+    CFG,
+    CfgKey,
     PRINT_STACKTRACE,
+    temp_dir,
+)
+from .metrics import MetricBuffer
+from .profiling import (
+    PROFILE_DNAME,
+    run_profiler,
+)
+from .telemetry import ResourceSampler
+from .spool import RunSpool
+from .spans import (
+    TRACE_FNAME,
+    SpanRecorder,
 )
 
 
@@ -39,46 +63,104 @@ class ExperimentRunContext(object):
     artifacts_dpath : str, optional
         The path to the local filesystem directory where experiment artifacts
         will be saved. If not given, a default one is created.
+    stream_log : bool, default False
+        If True, the captured console log is uploaded to the run in rolling
+        chunks while it executes, rather than in one piece at its end.
+    profile : bool or str, default False
+        If 'cprofile', or True, the body of the context is profiled with
+        cProfile, and the profiling statistics are uploaded to the profile
+        artifact directory of the run, as a pstats file, its text report and
+        collapsed stacks for flame graphs. If 'sampling', the stack of the
+        body is sampled periodically instead, which has lower overhead, and
+        only the collapsed stacks are uploaded. Either way, the self time of
+        the PROFILE_TOP_N hottest functions is logged as metrics.
+    track_resources : bool, default False
+        If True, the CPU utilization, resident memory, I/O and number of
+        threads of the process are sampled every RESOURCE_SAMPLE_INTERVAL_SEC
+        seconds and logged as step metrics, and summary metrics, like peak
+        memory and total CPU seconds, are logged when the run ends.
     """
 
     def __init__(
             self, experiment_name, run_name=None, nested=False,
-            artifacts_dpath=None
+            artifacts_dpath=None, stream_log=False, profile=False,
+            track_resources=False,
     ):
         self.experiment_name = experiment_name
         self.run_name = run_name
         self.nested = nested
+        self.stream_log = stream_log
+        self.log_streamer = None
+        self.track_resources = track_resources
+        self.spans = SpanRecorder()
+        self.resource_sampler = None
+        self.profiler = None
+        if profile:
+            self.profiler = run_profiler(
+                profile=profile,
+                top_n=CFG[CfgKey.PROFILE_TOP_N],
+                interval_sec=CFG[CfgKey.PROFILE_SAMPLE_INTERVAL_SEC],
+            )
         self.disabled = False
-        # Note: on Databricks, the experiment name passed to
-        # mlflow_set_experiment must be a valid path in the workspace
+        self.spool = None
+        init_tracking()
+        # Note: on Databricks, the experiment name must be a valid path in
+        # the workspace; it is resolved once per process, and cached, and a
+        # failure to start the run in it is handled like one to resolve it
         try:
-            mlflow.set_experiment(self.experiment_name)
-        except (MlflowException, InvalidConfigurationError):
-            warnings.warn(
-                "MLflow is badly configured! Argus is disabled.",
-                stacklevel=2,
+            self.mlflow_run = _with_experiment_id(
+                tracking_client(),
+                self.experiment_name,
+                lambda experiment_id: mlflow.start_run(
+                    experiment_id=experiment_id),
             )
+        except (MlflowException, InvalidConfigurationError,
+                transport.CircuitOpenError, OSError):
+            spooling = (
+                CFG[CfgKey.SPOOL_WHEN_OFFLINE] and self._start_spooling())
+            if spooling:
+                warnings.warn(
+                    ("MLflow is badly configured! This run is spooled to {} "
+                     "instead; run `actarius replay` to report it once "
+                     "MLflow is reachable.").format(self.spool.dpath),
+                    stacklevel=2,
+                )
+            else:
+                warnings.warn(
+                    "MLflow is badly configured! Argus is disabled.",
+                    stacklevel=2,
+                )
             if PRINT_STACKTRACE:
                 warnings.warn(
                     "Printing exception stack trace and contining to run.",
                     stacklevel=2,
                 )
                 traceback.print_stack()
-            # was not needed, eventually, but keeping this here
-            # atexit.unregister(mlflow.end_run)
-            # atexit.unregister(fluent_end_run)
-            self.disabled = True
-            try:
-                mlflow.end_run()
-            except Exception:
-                # this is meant to kill stupid mlflow errors on program end,
-                # as it seems they register end_run() to be called on program
-                # end using atexit._run_exitfuncs
-                pass
-            return
-        self.mlflow_run = mlflow.start_run()
+            if not spooling:
+                # was not needed, eventually, but keeping this here
+                # atexit.unregister(mlflow.end_run)
+                # atexit.unregister(fluent_end_run)
+                self.disabled = True
+                try:
+                    mlflow.end_run()
+                except Exception:
+                    # this is meant to kill stupid mlflow errors on program
+                    # end, as it seems they register end_run() to be called
+                    # on program end using atexit._run_exitfuncs
+                    pass
+                return
+        if self.spool is not None:
+            # the experiment was set in the file store of the spool
+            self.mlflow_run = mlflow.start_run()
         self.run_id = self.mlflow_run .info.run_id
-        self.log_fpath = f'{TEMP_DIR}/log_mlflow_run_{self.run_id}.txt'
+        if self.spool is not None:
+            self.spool.log_file_store_run(self.run_id)
+        self._metric_buffer = MetricBuffer(
+            flush_fn=self._log_metric_batch,
+            flush_every=CFG[CfgKey.METRIC_FLUSH_EVERY],
+            flush_interval_sec=CFG[CfgKey.METRIC_FLUSH_INTERVAL_SEC],
+        )
+        self.log_fpath = f'{temp_dir()}/log_mlflow_run_{self.run_id}.txt'
         os.makedirs(os.path.expanduser('~/temp'), exist_ok=True)
         self.logger = DoubleLogger(self.log_fpath)
         self.artifactory = ArgusArtifactory(
@@ -86,6 +168,25 @@ class ExperimentRunContext(object):
             artifacts_dpath=artifacts_dpath,
         )
 
+    def _start_spooling(self):
+        # points MLflow at a local file store, so that mlflow calls made in
+        # the body of the context, and by actarius, are all kept for replay
+        try:
+            self.spool = RunSpool.create(
+                experiment_name=self.experiment_name,
+                run_name=self.run_name,
+            )
+            self._archived_tracking_uri = mlflow.get_tracking_uri()
+            mlflow.set_tracking_uri(self.spool.file_store_uri)
+            mlflow.set_experiment(self.experiment_name)
+        except (MlflowException, OSError):
+            if self.spool is not None:
+                mlflow.set_tracking_uri(self._archived_tracking_uri)
+                shutil.rmtree(self.spool.dpath, ignore_errors=True)
+                self.spool = None
+            return False
+        return True
+
     def __enter__(self):
         if self.disabled:
             # this make sure that all mlflow calls inside this context will
@@ -93,11 +194,99 @@ class ExperimentRunContext(object):
             # the default location - ./mlruns
             self._archived_tracking_uri = mlflow.get_tracking_uri()
             mlflow.set_tracking_uri('')
-            return
+            return self
         self.mlflow_run.__enter__()
         self.start_time = time.time()
         # print("git version: {}".format(git_version()))
-        set_shared_tags()
+        set_shared_tags(run_id=self.run_id)
+        if self.stream_log:
+            self.log_streamer = LogStreamer(
+                logger=self.logger,
+                run_id=self.run_id,
+                chunk_bytes=CFG[CfgKey.LOG_STREAM_CHUNK_BYTES],
+                interval_sec=CFG[CfgKey.LOG_STREAM_INTERVAL_SEC],
+            )
+            self.log_streamer.start()
+        if self.track_resources:
+            self.resource_sampler = ResourceSampler(
+                log_fn=self._metric_buffer.log_dict,
+                interval_sec=CFG[CfgKey.RESOURCE_SAMPLE_INTERVAL_SEC],
+            )
+            self.resource_sampler.start()
+        if self.profiler is not None:
+            self.profiler.start()
+        return self
+
+    def span(self, name):
+        """Times a named span of this run; a context manager or a decorator.
+
+        Spans can be nested, and repeated. When the run ends, the count,
+        total, min, max, p50 and p95 of the durations of each span are logged
+        as metrics, and all spans are uploaded as a Chrome trace artifact.
+
+        Parameters
+        ----------
+        name : str
+            The name of the span.
+
+        Example
+        -------
+        >>> with run.span('load_data'):  # doctest: +SKIP
+        ...     df = load_data()
+        """
+        return self.spans.span(name)
+
+    def _log_metric_batch(self, metrics):
+        log_batch(run_id=self.run_id, metrics=metrics)
+
+    @property
+    def metrics(self):
+        """dict: The last logged value of each metric of the run."""
+        return self._metric_buffer.latest()
+
+    def log_metric(self, name, val, step=None, timestamp=None):
+        """Logs a metric value to the run, in batches.
+
+        Values are buffered and sent to MLflow in a single request once
+        enough of them were buffered, or enough time has passed since the last
+        request, and on context exit.
+
+        Parameters
+        ----------
+        name : str
+            The name of the metric.
+        val : float
+            The value of the metric.
+        step : int, optional
+            The step at which the metric was computed. Defaults to 0.
+        timestamp : int, optional
+            Time the metric was computed, in milliseconds since the UNIX
+            epoch. Defaults to the current time.
+        """
+        if self.disabled:
+            mlflow.log_metric(name, val, step=step)
+            return
+        self._metric_buffer.log(
+            name, val, step=step, timestamp=timestamp)
+
+    def log_metrics(self, metric_dict, step=None, timestamp=None):
+        """Logs multiple metric values to the run, in batches.
+
+        Parameters
+        ----------
+        metric_dict : dict
+            Dictionary of metric_name: String -> value: Float.
+        step : int, optional
+            The step at which the metrics were computed. Defaults to 0.
+        timestamp : int, optional
+            Time the metrics were computed, in milliseconds since the UNIX
+            epoch. Defaults to the current time.
+        """
+        if self.disabled:
+            mlflow.log_metrics(metric_dict, step=step)
+            return
+        self._metric_buffer.log_dict(
+            metric_dict, step=step, timestamp=timestamp)
 
     def __exit__(self, *args):
         if self.disabled:
@@ -111,12 +300,34 @@ class ExperimentRunContext(object):
                 pass
             return
         runtime = time.time() - self.start_time
-        mlflow.log_metrics({
-            'runtime_in_sec': runtime
-        })
+        if self.profiler is not None:
+            self.profiler.stop()
+            self._metric_buffer.log_dict(self.profiler.dump(os.path.join(
+                self.artifactory.artifacts_dpath, PROFILE_DNAME)))
+        if self.resource_sampler is not None:
+            self._metric_buffer.log_dict(self.resource_sampler.stop())
+        if len(self.spans):
+            self._metric_buffer.log_dict(self.spans.metrics())
+            self.spans.dump_trace(os.path.join(
+                self.artifactory.artifacts_dpath, TRACE_FNAME))
+        self._metric_buffer.log('runtime_in_sec', runtime)
+        self._metric_buffer.flush()
         self.artifactory.log_artifacts(artifacts_dir_paths=None)
         self.artifactory.close()
         self.logger.close()
-        mlflow.log_artifact(local_path=self.log_fpath)
+        if self.log_streamer is not None:
+            self.log_streamer.stop()
+        else:
+            for log_fpath in self.logger.log_fpaths:
+                transport.call(
+                    mlflow.log_artifact, local_path=log_fpath,
+                    fallback=_spool_fallback(
+                        self.run_id, 'log_files', [log_fpath]),
+                )
         self.mlflow_run.__exit__(*args)
-        os.remove(self.log_fpath)
+        if self.spool is not None:
+            failed = bool(args) and args[0] is not None
+            self.spool.end(status='FAILED' if failed else 'FINISHED')
+            mlflow.set_tracking_uri(self._archived_tracking_uri)
+            print("Run spooled to {}.".format(self.spool.dpath))
+        self.logger.remove_log_files()
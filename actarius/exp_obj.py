@@ -2,26 +2,56 @@
 
 import os
 import time
+import shutil
 import random
-import pickle
 import warnings
+import threading
 import traceback
 
 import mlflow
+from mlflow.entities import RunStatus
 from mlflow.exceptions import MlflowException
+from mlflow.tracking.context.registry import resolve_tags
+from mlflow.utils.mlflow_tags import MLFLOW_PARENT_RUN_ID, MLFLOW_RUN_NAME
 try:
     from databricks_cli.utils import InvalidConfigurationError as DatabricksInvalidConfigurationError  # noqa: E501
 except ImportError:
     from .exceptions import MockDatabricksInvalidConfigurationError as DatabricksInvalidConfigurationError  # noqa: E501
 
+from . import transport
 from .shared import (
     ArgusArtifactory,
     DoubleLogger,
-    set_shared_tags,
+    NullLogger,
+    _experiment_id,
+    _spool_fallback,
+    _with_experiment_id,
+    init_tracking,
+    log_batch,
+    shared_tags,
+    tracking_client,
+)
+from .flush import flusher
+from .serialize import (
+    dump_df,
+    dump_obj,
+    obj_artifact_name,
+    resolve_df_format,
+    resolve_obj_compression,
+)
+from .metrics import MetricBuffer
+from .telemetry import ResourceSampler
+from .spool import RunSpool
+from .proxy import RunQueueDrain
+from .spans import (
+    TRACE_FNAME,
+    SpanRecorder,
 )
 from .cfg import (
-    TEMP_DIR,
+    CFG,
+    CfgKey,
     PRINT_STACKTRACE,
+    temp_dir,
 )
 
 
@@ -42,20 +72,44 @@ class ExperimentRun(object):
     artifacts_dpath : str, optional
         The path to the local filesystem directory where experiment artifacts
         will be saved. If not given, a default one is created.
+    async_flush : bool, default False
+        If True, end_run() only creates the MLflow run and returns at once,
+        while all buffered run data is reported to MLflow by a background
+        worker. Use wait() to block until it is done.
+    track_resources : bool, default False
+        If True, the CPU utilization, resident memory, I/O and number of
+        threads of the process are sampled every RESOURCE_SAMPLE_INTERVAL_SEC
+        seconds and logged as step metrics, and summary metrics, like peak
+        memory and total CPU seconds, are logged when the run ends.
+    capture_output : bool, default True
+        If True, stdout and stderr are captured into a log file, uploaded as
+        an artifact of the run. Capturing swaps the process-wide sys.stdout
+        and sys.stderr, so it should be turned off for runs that overlap
+        other runs in the same process, other than nested ones.
+
+    Notes
+    -----
+    Runs can be logged into from many threads at once. To log into a run from
+    worker processes, pass them the handle returned by proxy().
     """
 
     def __init__(
             self, experiment_name, run_name=None, nested=False,
-            artifacts_dpath=None
+            artifacts_dpath=None, async_flush=False, track_resources=False,
+            capture_output=True,
     ):
         self.experiment_name = experiment_name
         self.run_name = run_name
         self.nested = nested
+        self.async_flush = async_flush
+        self.flush_future = None
         self.temp_run_id = random.randint(1, 999999)
         self.log_fpath = os.path.expanduser(
-            f'{TEMP_DIR}/log_mlflow_run_{self.temp_run_id}.txt')
+            f'{temp_dir()}/log_mlflow_run_{self.temp_run_id}.txt')
         os.makedirs(os.path.expanduser('~/temp'), exist_ok=True)
-        self.logger = DoubleLogger(self.log_fpath)
+        self.logger = NullLogger()
+        if capture_output:
+            self.logger = DoubleLogger(self.log_fpath)
         self.artifactory = ArgusArtifactory(
             run_id=self.temp_run_id,
             artifacts_dpath=artifacts_dpath,
@@ -65,35 +119,141 @@ class ExperimentRun(object):
         self.running = True
         self.tags = {}
         self.params = {}
-        self.metrics = {}
+        self._metric_buffer = MetricBuffer()
+        self.spans = SpanRecorder()
         self.disabled = False
+        self._lock = threading.Lock()
+        self._drain = None
+        self.resource_sampler = None
+        if track_resources:
+            self.resource_sampler = ResourceSampler(
+                log_fn=self._metric_buffer.log_dict,
+                interval_sec=CFG[CfgKey.RESOURCE_SAMPLE_INTERVAL_SEC],
+            )
+            self.resource_sampler.start()
 
     def set_tag(self, name, val):
-        self.tags[name] = val
+        with self._lock:
+            self.tags[name] = val
 
     def set_tags(self, tag_dict):
-        self.tags = {**self.tags, **tag_dict}
+        with self._lock:
+            self.tags.update(tag_dict)
 
     def log_param(self, name, val):
-        self.params[name] = val
+        with self._lock:
+            self.params[name] = val
 
     def log_params(self, param_dict):
-        self.params = {**self.params, **param_dict}
+        with self._lock:
+            self.params.update(param_dict)
 
-    def log_metric(self, name, val):
-        self.metrics[name] = val
+    @property
+    def metrics(self):
+        """dict: The last logged value of each metric of the run."""
+        return self._metric_buffer.latest()
 
-    def log_metrics(self, metric_dict):
-        self.metrics = {**self.metrics, **metric_dict}
+    def log_metric(self, name, val, step=None, timestamp=None):
+        """Logs a metric value, keeping the full history of the metric.
 
-    def log_df(self, df, name):
-        fpath = os.path.join(self.artifact_dpath, name)
-        df.to_csv(fpath)
+        Parameters
+        ----------
+        name : str
+            The name of the metric.
+        val : float
+            The value of the metric.
+        step : int, optional
+            The step at which the metric was computed. Defaults to 0.
+        timestamp : int, optional
+            Time the metric was computed, in milliseconds since the UNIX
+            epoch. Defaults to the current time.
+        """
+        self._metric_buffer.log(
+            name, val, step=step, timestamp=timestamp)
 
-    def log_obj(self, obj, name):
+    def log_metrics(self, metric_dict, step=None, timestamp=None):
+        """Logs multiple metric values, keeping the full history of each.
+
+        Parameters
+        ----------
+        metric_dict : dict
+            Dictionary of metric_name: String -> value: Float.
+        step : int, optional
+            The step at which the metrics were computed. Defaults to 0.
+        timestamp : int, optional
+            Time the metrics were computed, in milliseconds since the UNIX
+            epoch. Defaults to the current time.
+        """
+        self._metric_buffer.log_dict(
+            metric_dict, step=step, timestamp=timestamp)
+
+    def proxy(self):
+        """Returns a picklable handle logging into this run from any process.
+
+        The first call starts a multiprocessing manager process, relaying
+        everything logged through proxies into this run until it ends. All
+        worker processes must be done logging before end_run() is called.
+
+        Returns
+        -------
+        actarius.proxy.RunProxy
+            A handle with the set_tag(s), log_param(s) and log_metric(s)
+            methods of this run.
+
+        Example
+        -------
+        >>> def preprocess(shard, run_proxy):  # doctest: +SKIP
+        ...     run_proxy.log_metrics({'n_rows': len(shard)}, step=shard.id)
+        >>> with ProcessPoolExecutor() as executor:  # doctest: +SKIP
+        ...     executor.map(preprocess, shards, repeat(run.proxy()))
+        """
+        with self._lock:
+            if self._drain is None:
+                self._drain = RunQueueDrain(self)
+            return self._drain.proxy()
+
+    def span(self, name):
+        """Times a named span of this run; a context manager or a decorator.
+
+        Spans can be nested, and repeated. When the run ends, the count,
+        total, min, max, p50 and p95 of the durations of each span are logged
+        as metrics, and all spans are uploaded as a Chrome trace artifact.
+
+        Parameters
+        ----------
+        name : str
+            The name of the span.
+
+        Example
+        -------
+        >>> with run.span('load_data'):  # doctest: +SKIP
+        ...     df = load_data()
+        """
+        return self.spans.span(name)
+
+    def log_df(self, df, name, format=None):
+        """Logs the input dataframe with the given name in this experiment run.
+
+        Parameters
+        ==========
+        df : pandas.DataFrame
+            The dataframe to save as an experiment artifact.
+        name : str
+            The name to assign to the saved artifact.
+        format : str, optional
+            One of 'csv', 'csv.gz', 'parquet', 'feather' and 'pickle'. If not
+            given, the format is inferred from the extension of name, if it
+            has a known one. Otherwise, small dataframes are saved as CSV, and
+            large ones as parquet if pyarrow is installed, or pickled if it is
+            not. The extension of the format is appended to name if missing.
+        """
+        format, name = resolve_df_format(df, name, format=format)
+        dump_df(df, os.path.join(self.artifact_dpath, name), format)
+
+    def log_obj(self, obj, name, compression=None, out_of_band=False):
         """Logs the input object with the given name in the running experiment.
 
-        Pickles the input Python object.
+        Pickles the input Python object, using the highest pickle protocol.
 
         Parameters
         ==========
@@ -101,10 +261,26 @@ class ExperimentRun(object):
             A Python object to pickle.
         name : str
             The name to assign to the saved artifact.
+        compression : str, optional
+            One of 'gzip', 'lz4', 'zstd' and 'auto', with 'auto' picking the
+            best one installed. Defaults to the OBJ_COMPRESSION configuration
+            value, and to no compression if that is empty. The extension of
+            the compression is appended to name if missing.
+        out_of_band : bool, default False
+            If True, buffers of buffer-backed objects, like NumPy arrays, are
+            written out of band. The artifact must then be loaded with
+            actarius.load_obj.
         """
-        fpath = os.path.join(self.artifact_dpath, name)
-        with open(fpath, 'wb+') as f:
-            pickle.dump(obj, f)
+        if compression is None:
+            compression = CFG[CfgKey.OBJ_COMPRESSION]
+        compression = resolve_obj_compression(compression)
+        name = obj_artifact_name(name, compression)
+        dump_obj(
+            obj,
+            os.path.join(self.artifact_dpath, name),
+            compression=compression,
+            out_of_band=out_of_band,
+        )
 
     def log_obj_as_text(self, obj, name):
         """Logs the input object with the given name in the running experiment.
@@ -143,16 +319,56 @@ class ExperimentRun(object):
         artifacts_dir_paths : str or list of str, optional
             If given, all artifacts in the given directory or directories are
             uploaded to the MLflow run tracking this run.
+
+        Returns
+        -------
+        concurrent.futures.Future or None
+            If this run was created with async_flush=True, a future resolving
+            once all run data was reported to MLflow. None otherwise.
         """
+        if self._drain is not None:
+            self._drain.close()
         # init mlflow run
         runtime = time.time() - self.start_time
+        run_metrics = {'runtime_in_sec': runtime}
+        if self.resource_sampler is not None:
+            run_metrics.update(self.resource_sampler.stop())
+        if len(self.spans):
+            run_metrics.update(self.spans.metrics())
+            self.spans.dump_trace(
+                os.path.join(self.artifact_dpath, TRACE_FNAME))
+        with self._lock:
+            tags = {**self.tags, **(tags or {})}
+            params = {**self.params, **(params or {})}
+        self._metric_buffer.log_dict({**run_metrics, **(metrics or {})})
+        metrics = self._metric_buffer.pending_metrics()
+        init_tracking()
         try:
-            mlflow.set_experiment(experiment_name=self.experiment_name)
-        except (MlflowException, DatabricksInvalidConfigurationError):
-            warnings.warn(
-                "MLflow was badly configured! Argus was disabled for the run.",
-                stacklevel=2
-            )
+            # resolved once per process, and cached
+            _experiment_id(tracking_client(), self.experiment_name)
+        except (MlflowException, DatabricksInvalidConfigurationError,
+                transport.CircuitOpenError, OSError):
+            spool = None
+            if CFG[CfgKey.SPOOL_WHEN_OFFLINE]:
+                spool = self._spool(
+                    tags=tags,
+                    params=params,
+                    metrics=metrics,
+                    artifacts_dir_paths=artifacts_dir_paths,
+                )
+            if spool is not None:
+                warnings.warn(
+                    ("MLflow was badly configured! The run was spooled to {} "
+                     "instead; run `actarius replay` to report it once "
+                     "MLflow is reachable.").format(spool.dpath),
+                    stacklevel=2,
+                )
+            else:
+                warnings.warn(
+                    "MLflow was badly configured! Argus was disabled for the "
+                    "run.",
+                    stacklevel=2
+                )
             if PRINT_STACKTRACE:
                 warnings.warn(
                     "Printing exception stack trace and contining to run.",
@@ -163,6 +379,8 @@ class ExperimentRun(object):
             self.running = False
             self.artifactory.close()
             self.logger.close()
+            if spool is not None:
+                self.logger.remove_log_files()
             try:
                 mlflow.end_run()
             except Exception:
@@ -171,32 +389,124 @@ class ExperimentRun(object):
                 # end using atexit._run_exitfuncs
                 pass
             return
-        with mlflow.start_run(
-            run_name=self.run_name,
-            nested=self.nested,
-        ) as run:
-            self.run_id = run.info.run_id
-            set_shared_tags()
-            mlflow.set_tags(self.tags)
-            if tags:
-                mlflow.set_tags(tags)
-
-            # log all params
-            mlflow.log_params(self.params)
-            if params:
-                mlflow.log_params(params)
-
-            # log metrics
-            mlflow.log_metrics(self.metrics)
-            mlflow.log_metrics({
-                'runtime_in_sec': runtime
-            })
-            if metrics:
-                mlflow.log_metrics(metrics)
-            self.artifactory.log_artifacts(
-                artifacts_dir_paths=artifacts_dir_paths)
-            self.artifactory.close()
+        if self.async_flush:
+            self.run_id = self._create_run().info.run_id
             self.logger.close()
-            mlflow.log_artifact(local_path=self.log_fpath)
-            os.remove(self.log_fpath)
+            self.flush_future = flusher().submit(
+                self._flush_and_terminate,
+                tags=tags,
+                params=params,
+                metrics=metrics,
+                artifacts_dir_paths=artifacts_dir_paths,
+            )
+            self.running = False
+            return self.flush_future
+        mlflow_run = _with_experiment_id(
+            tracking_client(),
+            self.experiment_name,
+            lambda experiment_id: mlflow.start_run(
+                experiment_id=experiment_id,
+                run_name=self.run_name,
+                nested=self.nested,
+            ),
+        )
+        with mlflow_run as run:
+            self.run_id = run.info.run_id
+            self._flush(
+                tags=tags,
+                params=params,
+                metrics=metrics,
+                artifacts_dir_paths=artifacts_dir_paths,
+            )
         self.running = False
+
+    def _spool(self, tags, params, metrics, artifacts_dir_paths):
+        spool = None
+        try:
+            spool = RunSpool.create(
+                experiment_name=self.experiment_name,
+                run_name=self.run_name,
+            )
+            spool.log_tags({**shared_tags(), **tags})
+            spool.log_params(params)
+            spool.log_metrics(metrics)
+            spool.log_artifacts(self.artifact_dpath)
+            if isinstance(artifacts_dir_paths, str):
+                artifacts_dir_paths = [artifacts_dir_paths]
+            for dpath in artifacts_dir_paths or []:
+                spool.log_artifacts(dpath)
+            self.logger.close()
+            spool.log_files(self.logger.log_fpaths)
+            spool.end()
+        except OSError:
+            if spool is not None:
+                shutil.rmtree(spool.dpath, ignore_errors=True)
+            return None
+        return spool
+
+    def _create_run(self):
+        run_tags = {}
+        if self.run_name is not None:
+            run_tags[MLFLOW_RUN_NAME] = self.run_name
+        active_run = mlflow.active_run()
+        if self.nested and active_run is not None:
+            run_tags[MLFLOW_PARENT_RUN_ID] = active_run.info.run_id
+        client = tracking_client()
+        tags = resolve_tags(run_tags)
+        # a retried creation could leave a duplicate run behind
+        return _with_experiment_id(
+            client,
+            self.experiment_name,
+            lambda experiment_id: transport.call(
+                client.create_run,
+                idempotent=False,
+                experiment_id=experiment_id,
+                tags=tags,
+            ),
+        )
+
+    def _flush(self, tags, params, metrics, artifacts_dir_paths):
+        # shared tags, buffered values and overrides all go in a single
+        # batch, split only where the server limits require it
+        log_batch(
+            run_id=self.run_id,
+            tags={**shared_tags(), **tags},
+            params=params,
+            metrics=metrics,
+        )
+        self.artifactory.log_artifacts(
+            artifacts_dir_paths=artifacts_dir_paths, run_id=self.run_id)
+        self.artifactory.close()
+        self.logger.close()
+        for log_fpath in self.logger.log_fpaths:
+            transport.call(
+                tracking_client().log_artifact, self.run_id, log_fpath,
+                fallback=_spool_fallback(
+                    self.run_id, 'log_files', [log_fpath]),
+            )
+        self.logger.remove_log_files()
+
+    def _flush_and_terminate(self, **kwargs):
+        status = RunStatus.to_string(RunStatus.FAILED)
+        try:
+            self._flush(**kwargs)
+            status = RunStatus.to_string(RunStatus.FINISHED)
+        finally:
+            transport.call(
+                tracking_client().set_terminated, self.run_id, status=status,
+                fallback=_spool_fallback(self.run_id, 'end', status),
+            )
+
+    def wait(self, timeout=None):
+        """Blocks until the background flush of this run completes.
+
+        Does nothing if the run was not flushed in the background.
+
+        Parameters
+        ----------
+        timeout : float, optional
+            The maximum number of seconds to wait. Waits indefinitely if not
+            given.
+        """
+        if self.flush_future is not None:
+            self.flush_future.result(timeout=timeout)
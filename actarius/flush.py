@@ -0,0 +1,124 @@
+"""Background flushing of run data to MLflow."""
+
+import queue
+import atexit
+import threading
+from concurrent.futures import Future, wait
+
+from .cfg import (
+    CFG,
+    CfgKey,
+)
+
+
+class BackgroundFlusher(object):
+    """Runs flush jobs on a small pool of daemon worker threads.
+
+    Daemon threads are used so that a stuck tracking server can never keep
+    the interpreter alive; pending jobs are instead drained, with a timeout,
+    by an atexit hook.
+
+    Parameters
+    ----------
+    n_workers : int
+        The number of worker threads to flush with.
+    """
+
+    def __init__(self, n_workers):
+        self._jobs = queue.Queue()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._workers = []
+        for i in range(n_workers):
+            worker = threading.Thread(
+                target=self._work,
+                name='actarius-flusher-{}'.format(i),
+                daemon=True,
+            )
+            worker.start()
+            self._workers.append(worker)
+
+    def _work(self):
+        while True:
+            future, fn, args, kwargs = self._jobs.get()
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(fn(*args, **kwargs))
+                except BaseException as e:
+                    future.set_exception(e)
+            with self._lock:
+                self._pending.discard(future)
+
+    def submit(self, fn, *args, **kwargs):
+        """Schedules fn(*args, **kwargs) to be run in the background.
+
+        Returns
+        -------
+        concurrent.futures.Future
+            A future resolving to the return value of the call.
+        """
+        future = Future()
+        with self._lock:
+            self._pending.add(future)
+        self._jobs.put((future, fn, args, kwargs))
+        return future
+
+    def drain(self, timeout=None):
+        """Waits for all pending jobs to complete.
+
+        Parameters
+        ----------
+        timeout : float, optional
+            The maximum number of seconds to wait. Waits indefinitely if not
+            given.
+
+        Returns
+        -------
+        bool
+            True if all pending jobs completed, False otherwise.
+        """
+        with self._lock:
+            pending = list(self._pending)
+        _, not_done = wait(pending, timeout=timeout)
+        return not not_done
+
+
+_FLUSHER = None
+_FLUSHER_LOCK = threading.Lock()
+
+
+def flusher():
+    """Returns the process-wide background flusher, creating it if needed."""
+    global _FLUSHER
+    with _FLUSHER_LOCK:
+        if _FLUSHER is None:
+            _FLUSHER = BackgroundFlusher(
+                n_workers=CFG[CfgKey.FLUSH_WORKERS])
+            atexit.register(_drain_at_exit)
+    return _FLUSHER
+
+
+def wait_for_flushes(timeout=None):
+    """Waits for all background flushes of runs to complete.
+
+    Parameters
+    ----------
+    timeout : float, optional
+        The maximum number of seconds to wait. Waits indefinitely if not
+        given.
+
+    Returns
+    -------
+    bool
+        True if all pending flushes completed, False otherwise.
+    """
+    if _FLUSHER is None:
+        return True
+    return _FLUSHER.drain(timeout=timeout)
+
+
+def _drain_at_exit():
+    if not wait_for_flushes(timeout=CFG[CfgKey.FLUSH_TIMEOUT_SEC]):
+        print((
+            "actarius: timed out waiting for background flushes of runs to "
+            "complete; some run data was not logged to MLflow."))
@@ -0,0 +1,379 @@
+"""Git metadata of the repository a run is executed from."""
+
+import os
+import subprocess
+from collections import namedtuple
+from functools import lru_cache
+
+
+NOT_FROM_GIT_REPO = "NotFromGitRepo"
+UNKNOWN_VALUE = "UnknownValue"
+
+# a git subprocess hanging longer than this, e.g. on NFS, is killed
+CMD_TIMEOUT_SEC = 10
+
+
+class GitSnapshot(namedtuple('GitSnapshot', [
+    'repo_dpath', 'repo_name', 'branch', 'commit', 'username', 'user_email',
+])):
+    """An immutable snapshot of the git metadata of a repository.
+
+    Attributes
+    ----------
+    repo_dpath : str or None
+        The path of the working tree of the repository, or None if the
+        snapshot was taken outside of any repository.
+    repo_name : str
+        The name of the repository, as taken from the URL of its origin
+        remote.
+    branch : str
+        The name of the checked out branch.
+    commit : str
+        The checksum of the checked out commit.
+    username : str
+        The configured git user name.
+    user_email : str
+        The configured git user email.
+    """
+
+    __slots__ = ()
+
+    def as_tags(self):
+        """Returns the snapshot as a dict of MLflow run tags."""
+        return {
+            'git_repo': self.repo_name,
+            'git_branch': self.branch,
+            'git_username': self.username,
+            'git_user_email': self.user_email,
+            'git_commit_checksum': self.commit,
+        }
+
+
+# === subprocess fallback ===
+
+def _minimal_ext_cmd(cmd):
+    # construct minimal environment
+    env = {}
+    for k in ['SYSTEMROOT', 'PATH', 'HOME']:
+        v = os.environ.get(k)
+        if v is not None:
+            env[k] = v
+    # LANGUAGE is used on win32
+    env['LANGUAGE'] = 'C'
+    env['LANG'] = 'C'
+    env['LC_ALL'] = 'C'
+    out = subprocess.check_output(
+        cmd, stderr=subprocess.STDOUT, env=env, timeout=CMD_TIMEOUT_SEC)
+    return out
+
+
+def _safe_cmd_res(cmd_arry, unknown_str=UNKNOWN_VALUE):
+    try:
+        out = _minimal_ext_cmd(cmd_arry)
+        res = out.strip().decode('ascii')
+    except (subprocess.SubprocessError, OSError):
+        return unknown_str
+    if not res:
+        # this shouldn't happen but apparently can (see gh-8512)
+        return unknown_str
+    return res
+
+
+# === reading .git directly ===
+
+def _read_text(fpath):
+    try:
+        with open(fpath, 'rt') as f:
+            return f.read()
+    except (OSError, UnicodeDecodeError):
+        return None
+
+
+def _mtime_ns(fpath):
+    try:
+        return os.stat(fpath).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _find_dpaths(dpath):
+    # the worktree directory, holding the .git file or directory, and the
+    # git directory
+    dpath = os.path.abspath(dpath)
+    while True:
+        candidate = os.path.join(dpath, '.git')
+        if os.path.isdir(candidate):
+            return dpath, candidate
+        if os.path.isfile(candidate):
+            content = _read_text(candidate) or ''
+            if content.startswith('gitdir:'):
+                git_dpath = content[len('gitdir:'):].strip()
+                return dpath, os.path.normpath(os.path.join(dpath, git_dpath))
+        parent = os.path.dirname(dpath)
+        if parent == dpath:
+            return None, None
+        dpath = parent
+
+
+def find_git_dpath(dpath):
+    """Finds the git directory of the repository containing a directory.
+
+    Parameters
+    ----------
+    dpath : str
+        The directory to start searching from, upwards.
+
+    Returns
+    -------
+    str or None
+        The path to the git directory, or None if dpath is not in a git
+        repository. For worktrees and submodules this is the directory the
+        .git file points to.
+    """
+    return _find_dpaths(dpath)[1]
+
+
+def _common_dpath(git_dpath):
+    # worktrees keep refs and config in the main git directory
+    commondir = _read_text(os.path.join(git_dpath, 'commondir'))
+    if commondir is None:
+        return git_dpath
+    return os.path.normpath(os.path.join(git_dpath, commondir.strip()))
+
+
+def _head_ref(git_dpath):
+    head = (_read_text(os.path.join(git_dpath, 'HEAD')) or '').strip()
+    if head.startswith('ref:'):
+        return head[len('ref:'):].strip(), None
+    return None, head or None
+
+
+def _packed_refs(common_dpath):
+    refs = {}
+    content = _read_text(os.path.join(common_dpath, 'packed-refs')) or ''
+    for line in content.splitlines():
+        if not line or line[0] in '#^':
+            continue
+        checksum, _, ref = line.partition(' ')
+        refs[ref.strip()] = checksum
+    return refs
+
+
+def _resolve_ref(git_dpath, common_dpath, ref):
+    for dpath in (git_dpath, common_dpath):
+        checksum = _read_text(os.path.join(dpath, ref))
+        if checksum:
+            return checksum.strip()
+    return _packed_refs(common_dpath).get(ref)
+
+
+def _unquote(value):
+    res = []
+    in_quotes = False
+    chars = iter(value.strip())
+    for char in chars:
+        if char == '"':
+            in_quotes = not in_quotes
+        elif char == '\\':
+            res.append(next(chars, ''))
+        elif char in '#;' and not in_quotes:
+            break
+        else:
+            res.append(char)
+    return ''.join(res).strip()
+
+
+def parse_git_config(content):
+    """Parses the content of a git configuration file.
+
+    Only the subset of the format needed to read simple values is
+    supported; values spanning multiple lines are ignored.
+
+    Parameters
+    ----------
+    content : str
+        The content of the configuration file.
+
+    Returns
+    -------
+    dict
+        Maps 'section.key' or 'section.subsection.key' strings, with section
+        and key lowercased, to the last value set for them.
+    """
+    values = {}
+    section = ''
+    for line in content.splitlines():
+        line = line.strip()
+        if not line or line[0] in '#;':
+            continue
+        if line.startswith('['):
+            header = line[1:line.find(']')].strip()
+            name, _, subsection = header.partition(' ')
+            section = name.lower()
+            if subsection:
+                section += '.' + _unquote(subsection)
+            continue
+        key, sep, value = line.partition('=')
+        key = key.strip().lower()
+        values[section + '.' + key] = _unquote(value) if sep else 'true'
+    return values
+
+
+def _global_config_fpaths():
+    fpaths = []
+    if not os.environ.get('GIT_CONFIG_NOSYSTEM'):
+        fpaths.append('/etc/gitconfig')
+    if os.environ.get('GIT_CONFIG_GLOBAL'):
+        fpaths.append(os.environ['GIT_CONFIG_GLOBAL'])
+    else:
+        xdg_dpath = os.environ.get('XDG_CONFIG_HOME') or os.path.join(
+            os.path.expanduser('~'), '.config')
+        fpaths.append(os.path.join(xdg_dpath, 'git', 'config'))
+        fpaths.append(os.path.expanduser('~/.gitconfig'))
+    return fpaths
+
+
+def _read_config(common_dpath):
+    values = {}
+    for fpath in _global_config_fpaths() + [
+            os.path.join(common_dpath, 'config')]:
+        values.update(parse_git_config(_read_text(fpath) or ''))
+    return values
+
+
+def _has_includes(config):
+    return any(key.startswith(('include.', 'includeif.')) for key in config)
+
+
+def _repo_name(config):
+    url = config.get('remote.origin.url')
+    if not url:
+        return UNKNOWN_VALUE
+    url = url.rstrip('/')
+    if '/' in url:
+        url = url.split('/')[-1]
+    if ':' in url:
+        url = url.split(':')[-1]
+    if url.endswith('.git'):
+        url = url[:-4]  # remove .git from end of url
+    return url
+
+
+def _config_value(config, key, repo_dpath):
+    value = config.get(key)
+    if value is None and _has_includes(config):
+        # included files are only resolved by git itself
+        value = _safe_cmd_res(['git', '-C', repo_dpath, 'config', key])
+    return value or UNKNOWN_VALUE
+
+
+@lru_cache(maxsize=16)
+def _read_snapshot(repo_dpath, git_dpath, head_state):
+    common_dpath = _common_dpath(git_dpath)
+    ref, commit = _head_ref(git_dpath)
+    branch = NOT_FROM_GIT_REPO  # detached HEAD
+    if ref is not None:
+        if ref.startswith('refs/heads/'):
+            branch = ref[len('refs/heads/'):]
+        commit = _resolve_ref(git_dpath, common_dpath, ref)
+    if commit is None:
+        # e.g. a reftable repository, or a branch with no commits yet
+        commit = _safe_cmd_res(
+            cmd_arry=['git', '-C', repo_dpath, 'rev-parse', 'HEAD'],
+            unknown_str=NOT_FROM_GIT_REPO,
+        )
+    config = _read_config(common_dpath)
+    return GitSnapshot(
+        repo_dpath=repo_dpath,
+        repo_name=_repo_name(config),
+        branch=branch,
+        commit=commit,
+        username=_config_value(config, 'user.name', repo_dpath),
+        user_email=_config_value(config, 'user.email', repo_dpath),
+    )
+
+
+def _head_state(git_dpath):
+    # HEAD changes on checkout, and the ref it points to on commit
+    ref, _ = _head_ref(git_dpath)
+    state = [_mtime_ns(os.path.join(git_dpath, 'HEAD'))]
+    if ref is not None:
+        common_dpath = _common_dpath(git_dpath)
+        state.append(_mtime_ns(os.path.join(common_dpath, ref)))
+        state.append(_mtime_ns(os.path.join(common_dpath, 'packed-refs')))
+    return tuple(state)
+
+
+_NO_REPO_SNAPSHOT = GitSnapshot(
+    repo_dpath=None,
+    repo_name=NOT_FROM_GIT_REPO,
+    branch=NOT_FROM_GIT_REPO,
+    commit=NOT_FROM_GIT_REPO,
+    username=UNKNOWN_VALUE,
+    user_email=UNKNOWN_VALUE,
+)
+
+
+def git_snapshot(dpath=None):
+    """Returns a snapshot of the git metadata of the enclosing repository.
+
+    The metadata is read directly from the git directory, in a single pass,
+    with a git subprocess used only for what cannot be read from it.
+    Snapshots are cached by repository and by the modification times of HEAD
+    and of the ref it points to, so they are only read again after a
+    checkout or a commit.
+
+    Parameters
+    ----------
+    dpath : str, optional
+        A directory inside the repository. Defaults to the current working
+        directory.
+
+    Returns
+    -------
+    GitSnapshot
+        The git metadata of the repository. If dpath is not inside a git
+        repository, all its values are placeholders.
+    """
+    if dpath is None:
+        dpath = os.getcwd()
+    repo_dpath, git_dpath = _find_dpaths(dpath)
+    if git_dpath is None:
+        return _NO_REPO_SNAPSHOT
+    return _read_snapshot(repo_dpath, git_dpath, _head_state(git_dpath))
+
+
+def git_cache_key(dpath=None):
+    """Returns a key identifying the current state of the enclosing repository.
+
+    Computing the key reads no more than HEAD and the ref it points to, and
+    never forks a git subprocess.
+
+    Parameters
+    ----------
+    dpath : str, optional
+        A directory inside the repository. Defaults to the current working
+        directory.
+
+    Returns
+    -------
+    list
+        The git directory, the checked out commit, and the modification times
+        of HEAD, of the ref it points to and of the repository configuration.
+        None if dpath is not inside a git repository.
+    """
+    if dpath is None:
+        dpath = os.getcwd()
+    git_dpath = find_git_dpath(dpath)
+    if git_dpath is None:
+        return None
+    common_dpath = _common_dpath(git_dpath)
+    ref, commit = _head_ref(git_dpath)
+    if ref is not None:
+        commit = _resolve_ref(git_dpath, common_dpath, ref)
+    return [
+        git_dpath,
+        commit,
+        *_head_state(git_dpath),
+        _mtime_ns(os.path.join(common_dpath, 'config')),
+    ]
@@ -0,0 +1,167 @@
+"""Client-side buffering of metric histories."""
+
+import time
+import threading
+from array import array
+
+from mlflow.entities import Metric
+
+from .shared import _now_ms
+
+
+class MetricBuffer(object):
+    """Buffers the full history of every logged metric in typed arrays.
+
+    Values, timestamps and steps of each metric are kept in their own
+    array.array objects, so long histories cost 24 bytes per point. Points
+    not yet reported to MLflow can be flushed, in a single batch, either
+    explicitly or automatically once enough points were buffered or enough
+    time has passed since the last flush.
+
+    Parameters
+    ----------
+    flush_fn : callable, optional
+        Called with a list of mlflow.entities.Metric objects to report. If not
+        given, the buffer is never flushed automatically.
+    flush_every : int, optional
+        Automatically flush once this many points are pending.
+    flush_interval_sec : float, optional
+        Automatically flush on the first point logged this many seconds after
+        the last flush.
+    """
+
+    def __init__(self, flush_fn=None, flush_every=None,
+                 flush_interval_sec=None):
+        self.flush_fn = flush_fn
+        self.flush_every = flush_every
+        self.flush_interval_sec = flush_interval_sec
+        self._values = {}
+        self._timestamps = {}
+        self._steps = {}
+        self._n_flushed = {}
+        self._n_pending = 0
+        self._last_flush = time.monotonic()
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+
+    def log(self, key, value, step=None, timestamp=None):
+        """Buffers a single metric value.
+
+        Parameters
+        ----------
+        key : str
+            The name of the metric.
+        value : float
+            The value of the metric.
+        step : int, optional
+            The step at which the metric was computed. Defaults to 0.
+        timestamp : int, optional
+            Time the metric was computed, in milliseconds since the UNIX
+            epoch. Defaults to the current time.
+        """
+        if timestamp is None:
+            timestamp = _now_ms()
+        with self._lock:
+            values = self._values.get(key)
+            if values is None:
+                values = self._values[key] = array('d')
+                self._timestamps[key] = array('q')
+                self._steps[key] = array('q')
+                self._n_flushed[key] = 0
+            values.append(value)
+            self._timestamps[key].append(timestamp)
+            self._steps[key].append(step or 0)
+            self._n_pending += 1
+        if self._should_flush():
+            self.flush()
+
+    def log_dict(self, metric_dict, step=None, timestamp=None):
+        """Buffers all metric values in the given dict.
+
+        Parameters
+        ----------
+        metric_dict : dict
+            Dictionary of metric_name: String -> value: Float.
+        step : int, optional
+            The step at which the metrics were computed. Defaults to 0.
+        timestamp : int, optional
+            Time the metrics were computed, in milliseconds since the UNIX
+            epoch. Defaults to the current time.
+        """
+        if timestamp is None:
+            timestamp = _now_ms()
+        for key, value in metric_dict.items():
+            self.log(key, value, step=step, timestamp=timestamp)
+
+    def _should_flush(self):
+        if self.flush_fn is None or self._n_pending < 1:
+            return False
+        if self.flush_every and self._n_pending >= self.flush_every:
+            return True
+        return bool(
+            self.flush_interval_sec
+            and time.monotonic() - self._last_flush >= self.flush_interval_sec
+        )
+
+    def pending_metrics(self, mark_flushed=True):
+        """Returns all points not yet flushed as mlflow Metric entities.
+
+        Parameters
+        ----------
+        mark_flushed : bool, default True
+            If True, the returned points are no longer considered pending.
+
+        Returns
+        -------
+        list of mlflow.entities.Metric
+            The pending points of all metrics.
+        """
+        with self._lock:
+            metrics = []
+            for key, values in self._values.items():
+                timestamps = self._timestamps[key]
+                steps = self._steps[key]
+                for i in range(self._n_flushed[key], len(values)):
+                    metrics.append(
+                        Metric(key, values[i], timestamps[i], steps[i]))
+                if mark_flushed:
+                    self._n_flushed[key] = len(values)
+            if mark_flushed:
+                self._n_pending = 0
+        return metrics
+
+    def flush(self):
+        """Reports all pending points using the configured flush function."""
+        with self._flush_lock:
+            metrics = self.pending_metrics()
+            self._last_flush = time.monotonic()
+            if metrics and self.flush_fn is not None:
+                self.flush_fn(metrics)
+
+    def history(self, key):
+        """Returns the (step, timestamp, value) history of a metric.
+
+        Parameters
+        ----------
+        key : str
+            The name of the metric.
+
+        Returns
+        -------
+        list of tuple
+            All (step, timestamp, value) triplets logged for the metric.
+        """
+        with self._lock:
+            return list(zip(
+                self._steps[key], self._timestamps[key], self._values[key]))
+
+    def latest(self):
+        """Returns a dict mapping each metric to its last logged value."""
+        with self._lock:
+            return {key: values[-1] for key, values in self._values.items()}
+
+    def __contains__(self, key):
+        return key in self._values
+
+    def __len__(self):
+        return len(self._values)
@@ -0,0 +1,231 @@
+"""Profiling of the code executed in an experiment run."""
+
+import os
+import re
+import sys
+import pstats
+import cProfile
+import threading
+from collections import Counter
+
+
+PROFILE_DNAME = 'profile'
+PSTATS_FNAME = 'profile.pstats'
+STATS_FNAME = 'profile_stats.txt'
+COLLAPSED_FNAME = 'profile_collapsed.txt'
+METRIC_PREFIX = 'profile_self_sec/'
+
+_INVALID_METRIC_CHARS = re.compile(r'[^\w\-. /]')
+
+
+def func_label(func):
+    """Returns a readable label for a (filename, lineno, funcname) triplet."""
+    fpath, lineno, funcname = func
+    if fpath == '~':
+        # built-in functions, like <method 'sort' of 'list' objects>
+        return funcname
+    return '{}:{}({})'.format(os.path.basename(fpath), lineno, funcname)
+
+
+def _metric_name(label):
+    # mlflow metric names are limited to a small set of characters
+    return METRIC_PREFIX + _INVALID_METRIC_CHARS.sub('_', label)[:200]
+
+
+def collapsed_stacks_from_stats(stats):
+    """Derives collapsed stacks, for flame graphs, from cProfile statistics.
+
+    cProfile only records caller-callee edges, and not full call stacks, so
+    each stack is a single edge: the self time of each function is split
+    between its callers, in proportion to the time spent under each of them,
+    and reported under a two-frame caller;callee stack. Functions with no
+    known caller are reported on their own. Unlike expanding every call path,
+    this takes time linear in the number of edges. Use the sampling profiler
+    for full call stacks.
+
+    Parameters
+    ----------
+    stats : pstats.Stats
+        The profiling statistics.
+
+    Returns
+    -------
+    collections.Counter
+        Maps each collapsed stack, a string of ';'-separated function labels,
+        to the number of microseconds spent in it.
+    """
+    stacks = Counter()
+    for func, (_, _, tottime, _, callers) in stats.stats.items():
+        if tottime <= 0:
+            continue
+        label = func_label(func)
+        edge_cumtimes = {
+            caller: edge[3] for caller, edge in callers.items()}
+        total = sum(edge_cumtimes.values())
+        if total <= 0:
+            stacks[label] += int(tottime * 1e6)
+            continue
+        for caller, edge_cumtime in edge_cumtimes.items():
+            stack = func_label(caller) + ';' + label
+            stacks[stack] += int(tottime * edge_cumtime / total * 1e6)
+    return stacks
+
+
+def _write_collapsed(stacks, fpath):
+    with open(fpath, 'wt') as f:
+        for stack, value in sorted(stacks.items()):
+            if value > 0:
+                f.write('{} {}\n'.format(stack, value))
+
+
+class CProfileRunProfiler(object):
+    """Profiles the thread it was started from with cProfile.
+
+    Parameters
+    ----------
+    top_n : int
+        The number of hottest functions to report as metrics.
+    """
+
+    def __init__(self, top_n):
+        self.top_n = top_n
+        self._profile = cProfile.Profile()
+
+    def start(self):
+        self._profile.enable()
+
+    def stop(self):
+        self._profile.disable()
+
+    def dump(self, dpath):
+        """Writes profiling results into the given directory.
+
+        Writes a pstats file, its text report sorted by cumulative time, and
+        a collapsed-stack file that flame graph tools can read.
+
+        Parameters
+        ----------
+        dpath : str
+            The directory to write results into. Created if missing.
+
+        Returns
+        -------
+        dict
+            Maps a metric name for each of the top_n functions with the most
+            self time to that self time, in seconds.
+        """
+        os.makedirs(dpath, exist_ok=True)
+        self._profile.dump_stats(os.path.join(dpath, PSTATS_FNAME))
+        with open(os.path.join(dpath, STATS_FNAME), 'wt') as f:
+            stats = pstats.Stats(self._profile, stream=f)
+            stats.sort_stats('cumulative').print_stats()
+        _write_collapsed(
+            collapsed_stacks_from_stats(stats),
+            os.path.join(dpath, COLLAPSED_FNAME),
+        )
+        hottest = sorted(
+            stats.stats.items(), key=lambda item: item[1][2], reverse=True)
+        return {
+            _metric_name(func_label(func)): func_stats[2]
+            for func, func_stats in hottest[:self.top_n]
+        }
+
+
+class SamplingRunProfiler(object):
+    """Profiles the thread it was started from by sampling its stack.
+
+    A daemon thread periodically records the full stack of the profiled
+    thread, so overhead is low and independent of the number of calls made.
+
+    Parameters
+    ----------
+    top_n : int
+        The number of hottest functions to report as metrics.
+    interval_sec : float
+        The time between consecutive samples, in seconds.
+    """
+
+    def __init__(self, top_n, interval_sec):
+        self.top_n = top_n
+        self.interval_sec = interval_sec
+        self.stacks = Counter()
+        self.n_samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self._thread_id = None
+
+    def start(self):
+        self._thread_id = threading.get_ident()
+        self._thread = threading.Thread(
+            target=self._sample_periodically,
+            name='actarius-profiler',
+            daemon=True,
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _sample_periodically(self):
+        while not self._stop.wait(self.interval_sec):
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(func_label(
+                    (code.co_filename, code.co_firstlineno, code.co_name)))
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+            self.n_samples += 1
+
+    def dump(self, dpath):
+        """Writes the sampled stacks into the given directory.
+
+        Parameters
+        ----------
+        dpath : str
+            The directory to write results into. Created if missing.
+
+        Returns
+        -------
+        dict
+            Maps a metric name for each of the top_n functions most often
+            on top of the stack to their estimated self time, in seconds.
+        """
+        os.makedirs(dpath, exist_ok=True)
+        _write_collapsed(self.stacks, os.path.join(dpath, COLLAPSED_FNAME))
+        self_samples = Counter()
+        for stack, n_samples in self.stacks.items():
+            self_samples[stack.rsplit(';', 1)[-1]] += n_samples
+        return {
+            _metric_name(label): n_samples * self.interval_sec
+            for label, n_samples in self_samples.most_common(self.top_n)
+        }
+
+
+def run_profiler(profile, top_n, interval_sec):
+    """Returns a run profiler of the given kind.
+
+    Parameters
+    ----------
+    profile : bool or str
+        Either 'cprofile' or 'sampling'. True means 'cprofile'.
+    top_n : int
+        The number of hottest functions to report as metrics.
+    interval_sec : float
+        The sampling interval of the sampling profiler, in seconds.
+
+    Returns
+    -------
+    CProfileRunProfiler or SamplingRunProfiler
+        A profiler, not started yet.
+    """
+    if profile is True or profile == 'cprofile':
+        return CProfileRunProfiler(top_n=top_n)
+    if profile == 'sampling':
+        return SamplingRunProfiler(top_n=top_n, interval_sec=interval_sec)
+    raise ValueError(
+        "profile must be one of True, 'cprofile' and 'sampling', not "
+        "{!r}.".format(profile))
@@ -0,0 +1,138 @@
+"""Logging into a single experiment run from many processes."""
+
+import warnings
+import threading
+import multiprocessing
+
+from .shared import _now_ms
+
+
+# put on the queue to stop draining it
+_STOP = None
+
+
+class RunProxy(object):
+    """A picklable handle logging into an ExperimentRun from other processes.
+
+    Every call sends a single message, through a multiprocessing manager
+    queue, to the process holding the run, where it is applied to the run.
+    A proxy can be passed as an argument to ProcessPoolExecutor and
+    multiprocessing.Pool tasks. Use log_metrics() and set_tags() to send many
+    values in one message.
+
+    Parameters
+    ----------
+    queue : multiprocessing.managers.BaseProxy
+        A proxy of the queue of the run.
+    """
+
+    def __init__(self, queue):
+        self._queue = queue
+
+    def set_tag(self, name, val):
+        self._queue.put(('tags', {name: val}))
+
+    def set_tags(self, tag_dict):
+        self._queue.put(('tags', dict(tag_dict)))
+
+    def log_param(self, name, val):
+        self._queue.put(('params', {name: val}))
+
+    def log_params(self, param_dict):
+        self._queue.put(('params', dict(param_dict)))
+
+    def log_metric(self, name, val, step=None, timestamp=None):
+        """Logs a metric value into the run.
+
+        Parameters
+        ----------
+        name : str
+            The name of the metric.
+        val : float
+            The value of the metric.
+        step : int, optional
+            The step at which the metric was computed. Defaults to 0.
+        timestamp : int, optional
+            Time the metric was computed, in milliseconds since the UNIX
+            epoch. Defaults to the current time, in the calling process.
+        """
+        self.log_metrics({name: val}, step=step, timestamp=timestamp)
+
+    def log_metrics(self, metric_dict, step=None, timestamp=None):
+        """Logs multiple metric values into the run, in a single message.
+
+        Parameters
+        ----------
+        metric_dict : dict
+            Dictionary of metric_name: String -> value: Float.
+        step : int, optional
+            The step at which the metrics were computed. Defaults to 0.
+        timestamp : int, optional
+            Time the metrics were computed, in milliseconds since the UNIX
+            epoch. Defaults to the current time, in the calling process.
+        """
+        if timestamp is None:
+            timestamp = _now_ms()
+        self._queue.put(('metrics', dict(metric_dict), step, timestamp))
+
+
+class RunQueueDrain(object):
+    """Applies the messages of RunProxy objects to a run, on a daemon thread.
+
+    Starts a multiprocessing manager process, owning the queue all proxies
+    send messages to.
+
+    Parameters
+    ----------
+    run : ExperimentRun
+        The run to apply messages to.
+    """
+
+    def __init__(self, run):
+        self.run = run
+        self._manager = multiprocessing.Manager()
+        self.queue = self._manager.Queue()
+        self._thread = threading.Thread(
+            target=self._drain,
+            name='actarius-run-drain',
+            daemon=True,
+        )
+        self._thread.start()
+
+    def proxy(self):
+        """Returns a new proxy sending messages to this drain."""
+        return RunProxy(self.queue)
+
+    def _drain(self):
+        while True:
+            message = self.queue.get()
+            if message is _STOP:
+                return
+            try:
+                self._apply(message)
+            except Exception as e:
+                warnings.warn(
+                    "Failed to log {!r} from a worker process: {!r}".format(
+                        message, e),
+                    stacklevel=2,
+                )
+
+    def _apply(self, message):
+        kind = message[0]
+        if kind == 'tags':
+            self.run.set_tags(message[1])
+        elif kind == 'params':
+            self.run.log_params(message[1])
+        else:
+            _, metric_dict, step, timestamp = message
+            self.run.log_metrics(metric_dict, step=step, timestamp=timestamp)
+
+    def close(self):
+        """Applies all messages sent so far, and stops the manager process.
+
+        Messages sent by proxies after this call are lost, so all worker
+        processes should be done logging before it is called.
+        """
+        self.queue.put(_STOP)
+        self._thread.join()
+        self._manager.shutdown()
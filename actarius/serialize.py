@@ -0,0 +1,447 @@
+"""Serialization of objects logged as artifacts."""
+
+import io
+import os
+import gzip
+import pickle
+import struct
+
+from .cfg import (
+    CFG,
+    CfgKey,
+)
+
+
+# === Artifact buffering ===
+
+class SpooledArtifact(io.RawIOBase):
+    """A binary file-like buffer for an artifact, spilling to disk when large.
+
+    Content is kept in memory until it grows beyond max_memory_bytes, at
+    which point it is moved into a file, and all further writes go there.
+
+    Parameters
+    ----------
+    name : str
+        The name of the artifact.
+    max_memory_bytes : int
+        The maximum number of bytes to keep in memory.
+    spill_dpath : str
+        The directory in which to create the spill file.
+    """
+
+    def __init__(self, name, max_memory_bytes, spill_dpath):
+        self.name = name
+        self.max_memory_bytes = max_memory_bytes
+        self.spill_dpath = spill_dpath
+        self.fpath = None
+        self._file = io.BytesIO()
+
+    @property
+    def in_memory(self):
+        """Whether the content is still held in memory."""
+        return self.fpath is None
+
+    def _spill(self):
+        self.fpath = os.path.join(self.spill_dpath, self.name)
+        spill_file = open(self.fpath, 'wb')
+        spill_file.write(self._file.getbuffer())
+        self._file = spill_file
+
+    def write(self, data):
+        if self.in_memory and (
+                self._file.tell() + len(data) > self.max_memory_bytes):
+            self._spill()
+        return self._file.write(data)
+
+    def readable(self):
+        return False
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def tell(self):
+        return self._file.tell()
+
+    def flush(self):
+        self._file.flush()
+
+    @property
+    def closed(self):
+        return self._file.closed
+
+    def close(self):
+        """Ends writing. In-memory content remains available via getbuffer."""
+        if not self.in_memory:
+            self._file.close()
+
+    def getbuffer(self):
+        """Returns a memoryview of the content, if it is held in memory."""
+        return self._file.getbuffer()
+
+    def discard(self):
+        """Frees the content, removing the spill file, if any."""
+        if self.in_memory:
+            self._file = io.BytesIO()
+        else:
+            self._file.close()
+            if os.path.exists(self.fpath):
+                os.remove(self.fpath)
+
+
+# === DataFrame serialization ===
+
+DF_FORMAT_EXTENSIONS = {
+    'csv': '.csv',
+    'csv.gz': '.csv.gz',
+    'parquet': '.parquet',
+    'feather': '.feather',
+    'pickle': '.pkl',
+}
+COLUMNAR_DF_FORMATS = ('parquet', 'feather')
+
+
+def _has_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _df_format_by_extension(name):
+    # longer extensions first, so that .csv.gz is not taken for .gz
+    for df_format, ext in sorted(
+            DF_FORMAT_EXTENSIONS.items(), key=lambda item: -len(item[1])):
+        if name.endswith(ext):
+            return df_format
+    return None
+
+
+def _auto_df_format(df):
+    n_cells = df.shape[0] * df.shape[1]
+    if n_cells < CFG[CfgKey.DF_COLUMNAR_MIN_CELLS]:
+        return 'csv'
+    if _has_pyarrow() and all(isinstance(col, str) for col in df.columns):
+        return 'parquet'
+    return 'pickle'
+
+
+def resolve_df_format(df, name, format=None):
+    """Resolves the format to save a dataframe in, and its file name.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        The dataframe to save.
+    name : str
+        The name of the saved artifact.
+    format : str, optional
+        One of 'csv', 'csv.gz', 'parquet', 'feather' and 'pickle'. If not
+        given, the format is inferred from the extension of name, if it has
+        a known one. Otherwise, small dataframes are saved as CSV, and large
+        ones as parquet if pyarrow is installed, or pickled if it is not.
+
+    Returns
+    -------
+    format : str
+        The format to save the dataframe in.
+    name : str
+        The given name, with the extension of the format appended if it
+        does not already end with it.
+    """
+    if format is None:
+        format = _df_format_by_extension(name)
+    if format is None:
+        format = _auto_df_format(df)
+    if format not in DF_FORMAT_EXTENSIONS:
+        raise ValueError("Unsupported dataframe format: {}".format(format))
+    if format in COLUMNAR_DF_FORMATS and not _has_pyarrow():
+        raise ImportError(
+            "pyarrow is required to save dataframes as {}.".format(format))
+    ext = DF_FORMAT_EXTENSIONS[format]
+    if not name.endswith(ext):
+        name += ext
+    return format, name
+
+
+def dump_df(df, file, format):
+    """Saves a dataframe in the given format.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        The dataframe to save.
+    file : str or file-like object
+        The path of the file to save the dataframe to, or a binary file-like
+        object to write it into.
+    format : str
+        One of 'csv', 'csv.gz', 'parquet', 'feather' and 'pickle'.
+    """
+    if format not in DF_FORMAT_EXTENSIONS:
+        raise ValueError("Unsupported dataframe format: {}".format(format))
+    if isinstance(file, str):
+        with open(file, 'wb') as f:
+            dump_df(df, f, format)
+        return
+    if format == 'csv':
+        _dump_df_as_csv(df, file)
+    elif format == 'csv.gz':
+        with gzip.GzipFile(fileobj=file, mode='wb') as gzip_file:
+            _dump_df_as_csv(df, gzip_file)
+    elif format == 'parquet':
+        df.to_parquet(file)
+    elif format == 'feather':
+        # feather does not support indexes, so the index is kept as columns
+        df.reset_index().to_feather(file)
+    elif format == 'pickle':
+        pickle.dump(df, file, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _dump_df_as_csv(df, binary_file):
+    text_file = io.TextIOWrapper(binary_file, encoding='utf-8', newline='')
+    df.to_csv(text_file)
+    text_file.flush()
+    # detaching keeps the wrapper from closing the underlying file
+    text_file.detach()
+
+
+# === Object serialization ===
+
+PICKLE_PROTOCOL = pickle.HIGHEST_PROTOCOL
+OBJ_COMPRESSION_EXTENSIONS = {
+    'gzip': '.gz',
+    'lz4': '.lz4',
+    'zstd': '.zst',
+}
+# marks files holding a pickle with its out-of-band buffers
+OUT_OF_BAND_MAGIC = b'ACTARIUS-PKL5\n'
+_UINT64 = struct.Struct('<Q')
+
+
+def _compression_available(compression):
+    try:
+        if compression == 'lz4':
+            import lz4.frame  # noqa: F401
+        elif compression == 'zstd':
+            import zstandard  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def resolve_obj_compression(compression):
+    """Resolves the compression to pickle objects with.
+
+    Parameters
+    ----------
+    compression : str, optional
+        One of 'gzip', 'lz4', 'zstd' and 'auto'. 'auto' picks zstd, lz4 or
+        gzip, in this order, according to which of them is installed.
+
+    Returns
+    -------
+    str or None
+        The compression to use, or None for no compression.
+    """
+    if not compression:
+        return None
+    if compression == 'auto':
+        for candidate in ('zstd', 'lz4'):
+            if _compression_available(candidate):
+                return candidate
+        return 'gzip'
+    if compression not in OBJ_COMPRESSION_EXTENSIONS:
+        raise ValueError("Unsupported compression: {}".format(compression))
+    if not _compression_available(compression):
+        raise ImportError("{} is not installed.".format(compression))
+    return compression
+
+
+def obj_artifact_name(name, compression):
+    """Appends the extension of the given compression to name if missing."""
+    ext = OBJ_COMPRESSION_EXTENSIONS.get(compression, '')
+    if not name.endswith(ext):
+        name += ext
+    return name
+
+
+def _compressed_writer(file, compression):
+    if compression == 'gzip':
+        return gzip.GzipFile(fileobj=file, mode='wb', compresslevel=6)
+    if compression == 'lz4':
+        import lz4.frame
+        return lz4.frame.LZ4FrameFile(file, mode='wb')
+    import zstandard
+    return zstandard.ZstdCompressor().stream_writer(file, closefd=False)
+
+
+def _compressed_reader(file, compression):
+    if compression == 'gzip':
+        return gzip.GzipFile(fileobj=file, mode='rb')
+    if compression == 'lz4':
+        import lz4.frame
+        return lz4.frame.LZ4FrameFile(file, mode='rb')
+    import zstandard
+    return zstandard.ZstdDecompressor().stream_reader(file, closefd=False)
+
+
+def _dump_out_of_band(obj, file):
+    buffers = []
+
+    def _collect_buffer(pickle_buffer):
+        try:
+            buffers.append(pickle_buffer.raw())
+        except BufferError:
+            # non-contiguous buffers are serialized in-band
+            return True
+        return False
+
+    # with the large buffers out of band, the pickle stream itself is small
+    stream = io.BytesIO()
+    pickle.dump(
+        obj, stream, protocol=PICKLE_PROTOCOL, buffer_callback=_collect_buffer)
+    file.write(OUT_OF_BAND_MAGIC)
+    file.write(_UINT64.pack(stream.tell()))
+    file.write(stream.getbuffer())
+    file.write(_UINT64.pack(len(buffers)))
+    for buffer in buffers:
+        file.write(_UINT64.pack(buffer.nbytes))
+        file.write(buffer)
+
+
+def dump_obj(obj, file, compression=None, out_of_band=False):
+    """Pickles an object, streaming it into a file.
+
+    Objects are pickled with the highest protocol available, so that
+    buffer-backed objects, like NumPy arrays, are written without being
+    copied, and are never fully buffered in memory.
+
+    Parameters
+    ----------
+    obj : object
+        A Python object to pickle.
+    file : str or file-like object
+        The path of the file to pickle the object into, or a binary
+        file-like object to write it into.
+    compression : str, optional
+        One of 'gzip', 'lz4' and 'zstd'. Not compressed if not given.
+    out_of_band : bool, default False
+        If True, buffers of buffer-backed objects are written out of band,
+        after the pickle stream, using pickle protocol 5. Objects dumped this
+        way must be loaded with load_obj.
+    """
+    if out_of_band and PICKLE_PROTOCOL < 5:
+        raise ValueError("Out-of-band pickling requires Python 3.8 or above.")
+    if isinstance(file, str):
+        with open(file, 'wb') as f:
+            dump_obj(obj, f, compression=compression, out_of_band=out_of_band)
+        return
+    writer = file
+    if compression is not None:
+        writer = _compressed_writer(file, compression)
+    try:
+        if out_of_band:
+            _dump_out_of_band(obj, writer)
+        else:
+            pickle.dump(obj, writer, protocol=PICKLE_PROTOCOL)
+    finally:
+        if writer is not file:
+            writer.close()
+
+
+class _PrefixedReader(object):
+    """Reads the given prefix bytes, then the rest of the given file."""
+
+    def __init__(self, prefix, file):
+        self._prefix = io.BytesIO(prefix)
+        self._file = file
+
+    def read(self, size=-1):
+        data = self._prefix.read(size)
+        if size < 0:
+            return data + self._file.read()
+        if len(data) < size:
+            data += self._file.read(size - len(data))
+        return data
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def readline(self):
+        line = self._prefix.readline()
+        if not line.endswith(b'\n'):
+            line += self._file.readline()
+        return line
+
+
+def _read_exactly(file, size):
+    chunks = []
+    while size > 0:
+        chunk = file.read(size)
+        if not chunk:
+            raise EOFError("Truncated out-of-band pickle file.")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def _load_out_of_band(file):
+    stream_size, = _UINT64.unpack(_read_exactly(file, _UINT64.size))
+    stream = _read_exactly(file, stream_size)
+    n_buffers, = _UINT64.unpack(_read_exactly(file, _UINT64.size))
+    buffers = []
+    for _ in range(n_buffers):
+        size, = _UINT64.unpack(_read_exactly(file, _UINT64.size))
+        buffer = bytearray(size)
+        view = memoryview(buffer)
+        n_read = 0
+        while n_read < size:
+            n_chunk = file.readinto(view[n_read:])
+            if not n_chunk:
+                raise EOFError("Truncated out-of-band pickle file.")
+            n_read += n_chunk
+        buffers.append(buffer)
+    return pickle.loads(stream, buffers=buffers)
+
+
+def load_obj(file, compression=None):
+    """Loads an object pickled by dump_obj, log_obj or ExperimentRun.log_obj.
+
+    Parameters
+    ----------
+    file : str or file-like object
+        The path of the file to load the object from, or a binary file-like
+        object to read it from.
+    compression : str, optional
+        One of 'gzip', 'lz4' and 'zstd'. If not given and file is a path,
+        it is inferred from the file extension.
+
+    Returns
+    -------
+    object
+        The unpickled object.
+    """
+    if isinstance(file, str):
+        if compression is None:
+            for candidate, ext in OBJ_COMPRESSION_EXTENSIONS.items():
+                if file.endswith(ext):
+                    compression = candidate
+        with open(file, 'rb') as f:
+            return load_obj(f, compression=compression)
+    reader = file
+    if compression is not None:
+        reader = _compressed_reader(file, compression)
+    try:
+        prefix = reader.read(len(OUT_OF_BAND_MAGIC))
+        if prefix == OUT_OF_BAND_MAGIC:
+            return _load_out_of_band(reader)
+        return pickle.load(_PrefixedReader(prefix, reader))
+    finally:
+        if reader is not file:
+            reader.close()
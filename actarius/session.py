@@ -0,0 +1,127 @@
+"""Pooling of the HTTP connections to the tracking server."""
+
+import warnings
+import importlib
+import threading
+from functools import lru_cache, wraps
+
+from requests.adapters import HTTPAdapter
+
+from .cfg import (
+    CFG,
+    CfgKey,
+)
+
+
+# modules of the MLflow client getting their HTTP session from a
+# _get_request_session function; which exist depends on the MLflow version
+MLFLOW_SESSION_MODULES = [
+    'mlflow.utils.request_utils',
+    'mlflow.utils.rest_utils',
+]
+
+_POOLING_LOCK = threading.Lock()
+
+
+class PooledAdapter(HTTPAdapter):
+    """A keep-alive HTTP adapter, with bounded connection pools.
+
+    Up to pool_size connections to each host are kept alive and reused by
+    all threads, so that requests skip the TCP and TLS handshakes, and do not
+    leave behind a socket in TIME_WAIT each.
+
+    Parameters
+    ----------
+    pool_size : int
+        The maximum number of connections kept alive per host.
+    connect_timeout_sec : float
+        The time to wait for a connection to be established, in seconds.
+    read_timeout_sec : float
+        The time to wait for the server to send data, in seconds.
+    max_retries : urllib3.util.Retry or int, default 0
+        The retry policy of requests sent through the adapter.
+    """
+
+    def __init__(self, pool_size, connect_timeout_sec, read_timeout_sec,
+                 max_retries=0):
+        super().__init__(pool_maxsize=pool_size, max_retries=max_retries)
+        self.timeout = (connect_timeout_sec, read_timeout_sec)
+
+    def send(self, request, **kwargs):
+        kwargs['timeout'] = self.timeout
+        return super().send(request, **kwargs)
+
+
+def pool_connections(session):
+    """Mounts pooled adapters on a requests session, in place of its own.
+
+    The retry policy of each replaced adapter is kept, e.g. the retries of
+    MLflow on throttling and unavailability, honoring Retry-After headers.
+
+    Parameters
+    ----------
+    session : requests.Session
+        The session to pool the connections of.
+
+    Returns
+    -------
+    requests.Session
+        The given session.
+    """
+    with _POOLING_LOCK:
+        for prefix, adapter in list(session.adapters.items()):
+            if isinstance(adapter, PooledAdapter):
+                continue
+            session.mount(prefix, PooledAdapter(
+                pool_size=CFG[CfgKey.HTTP_POOL_SIZE],
+                connect_timeout_sec=CFG[CfgKey.HTTP_CONNECT_TIMEOUT_SEC],
+                read_timeout_sec=CFG[CfgKey.HTTP_READ_TIMEOUT_SEC],
+                max_retries=adapter.max_retries,
+            ))
+    return session
+
+
+def _pooled(get_request_session):
+    # MLflow caches a session per retry policy; each is pooled once
+    @wraps(get_request_session)
+    def get_pooled_request_session(*args, **kwargs):
+        return pool_connections(get_request_session(*args, **kwargs))
+
+    get_pooled_request_session.actarius_pooled = True
+    return get_pooled_request_session
+
+
+@lru_cache(maxsize=1)
+def install_http_session():
+    """Pools the connections of the HTTP sessions of the MLflow client.
+
+    Sessions are still made, cached and retried by MLflow, and only get
+    pooled adapters, as with pool_connections(). Does nothing if the
+    HTTP_POOLING configuration value is False.
+
+    Returns
+    -------
+    bool
+        True if the sessions of MLflow are pooled.
+    """
+    if not CFG[CfgKey.HTTP_POOLING]:
+        return False
+    installed = False
+    for module_name in MLFLOW_SESSION_MODULES:
+        try:
+            module = importlib.import_module(module_name)
+        except ImportError:
+            continue
+        get_request_session = getattr(module, '_get_request_session', None)
+        if get_request_session is None:
+            continue
+        if not getattr(get_request_session, 'actarius_pooled', False):
+            module._get_request_session = _pooled(get_request_session)
+        installed = True
+    if not installed:
+        warnings.warn(
+            "The installed version of mlflow does not use a shared HTTP "
+            "session; actarius can not pool its connections.",
+            stacklevel=2,
+        )
+    return installed
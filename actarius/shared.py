@@ -1,32 +1,412 @@
 """Shared code for actarius."""
 
+import io
 import os
 import sys
+import gzip
 import json
-import pickle
+import lzma
+import zlib
+import time
+import atexit
 import shutil
-import subprocess
+import tempfile
+import warnings
+import threading
 from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 
-import git
 import mlflow
-
-from .cfg import CFG
+from mlflow.entities import Metric, Param, RunTag
+from mlflow.exceptions import MlflowException
+from mlflow.protos.databricks_pb2 import (
+    INVALID_PARAMETER_VALUE,
+    RESOURCE_ALREADY_EXISTS,
+    RESOURCE_DOES_NOT_EXIST,
+    ErrorCode,
+)
+from mlflow.tracking import MlflowClient
+from mlflow.store.artifact.artifact_repository_registry import (
+    get_artifact_repository,
+)
+
+from .cfg import (
+    CFG,
+    CfgKey,
+    TEMP_DIR,
+    temp_dir,
+)
+from .serialize import (
+    SpooledArtifact,
+    dump_df,
+    dump_obj,
+    obj_artifact_name,
+    resolve_df_format,
+    resolve_obj_compression,
+)
+from . import transport
+from .gitinfo import git_snapshot
+from .tagcache import TagCache
+from .session import install_http_session
+from .tags import (  # noqa: F401
+    sagemaker_instance_name,
+    shared_tags,
+)
 
 
 # MLflow setup
 REMOTE_SERVER_URI = "databricks"  # set to your server URI
-mlflow.set_tracking_uri(REMOTE_SERVER_URI)
 
 
 ART_DNAME_TEMPLATE = "mlflow_artifacts_{}"
 
-CACHE_DPATH = CFG.xdg_cache_dpath()
-os.makedirs(CACHE_DPATH, exist_ok=True)
+# a RAM-backed directory, on Linux
+MEMORY_DPATH = "/dev/shm"
+
+CACHE_DPATH = TEMP_DIR
+
+
+# === Tracking client code ===
+
+def _is_tracking_uri_set():
+    try:
+        from mlflow.tracking._tracking_service.utils import (
+            is_tracking_uri_set,
+        )
+    except ImportError:
+        from mlflow.tracking.utils import is_tracking_uri_set
+    return is_tracking_uri_set()
+
+
+@lru_cache(maxsize=1)
+def init_tracking():
+    """Points MLflow at REMOTE_SERVER_URI, unless a tracking URI is set.
+
+    This is done on first use rather than on import, so that importing
+    actarius stays cheap. A tracking URI set explicitly, either with
+    mlflow.set_tracking_uri or through the MLFLOW_TRACKING_URI environment
+    variable, is left untouched. All HTTP requests of the MLflow client are
+    routed through the shared, pooled session of actarius.session.
+    """
+    if not _is_tracking_uri_set():
+        mlflow.set_tracking_uri(REMOTE_SERVER_URI)
+    install_http_session()
+
+
+@lru_cache(maxsize=4)
+def _tracking_client(tracking_uri):
+    return MlflowClient(tracking_uri=tracking_uri)
+
+
+def tracking_client():
+    """Returns the MlflowClient used for the current tracking URI."""
+    init_tracking()
+    return _tracking_client(mlflow.get_tracking_uri())
+
+
+def active_run_id():
+    """Returns the id of the active MLflow run."""
+    return mlflow.active_run().info.run_id
+
+
+# MLflow per-request limits for the log-batch REST endpoint
+MAX_METRICS_PER_BATCH = 1000
+MAX_PARAMS_PER_BATCH = 100
+MAX_TAGS_PER_BATCH = 100
+MAX_ENTITIES_PER_BATCH = 1000
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+def _split_batches(metrics, params, tags):
+    """Yields (metrics, params, tags) triplets within server limits."""
+    i_m, i_p, i_t = 0, 0, 0
+    while i_m < len(metrics) or i_p < len(params) or i_t < len(tags):
+        n_p = min(len(params) - i_p, MAX_PARAMS_PER_BATCH)
+        n_t = min(len(tags) - i_t, MAX_TAGS_PER_BATCH)
+        n_m = min(
+            len(metrics) - i_m,
+            MAX_METRICS_PER_BATCH,
+            MAX_ENTITIES_PER_BATCH - n_p - n_t,
+        )
+        yield (
+            metrics[i_m:i_m + n_m],
+            params[i_p:i_p + n_p],
+            tags[i_t:i_t + n_t],
+        )
+        i_m, i_p, i_t = i_m + n_m, i_p + n_p, i_t + n_t
+
+
+# === Experiment resolution code ===
+
+# maps (tracking URI, experiment name) keys to (id, expiry time) pairs
+_EXPERIMENT_IDS = {}
+_EXPERIMENT_IDS_LOCK = threading.Lock()
+# per-key locks, so that each experiment is resolved by one thread at a time
+_EXPERIMENT_ID_LOCKS = {}
+
+# error codes of run creation in a deleted or missing experiment; MLflow
+# exceptions are raised with proto codes, but hold their names
+_STALE_EXPERIMENT_ERROR_CODES = frozenset([
+    ErrorCode.Name(RESOURCE_DOES_NOT_EXIST),
+    ErrorCode.Name(INVALID_PARAMETER_VALUE),
+])
+
+
+@lru_cache(maxsize=1)
+def host_experiment_cache():
+    """Returns the on-disk cache of experiment ids shared by a host."""
+    ttl_sec = 0
+    if CFG[CfgKey.EXPERIMENT_CACHE_ON_DISK]:
+        ttl_sec = CFG[CfgKey.EXPERIMENT_CACHE_TTL_SEC]
+    return TagCache(
+        dpath=os.path.join(TEMP_DIR, 'experiment_ids'),
+        ttl_sec=ttl_sec,
+    )
+
+
+def _experiment_cache_key(experiment_name):
+    return json.dumps([mlflow.get_tracking_uri(), experiment_name])
+
+
+def _resolve_experiment_id(client, experiment_name):
+    experiment = transport.call(
+        client.get_experiment_by_name, experiment_name)
+    if experiment is None:
+        try:
+            return transport.call(
+                client.create_experiment, experiment_name, idempotent=False)
+        except MlflowException as e:
+            if e.error_code != ErrorCode.Name(RESOURCE_ALREADY_EXISTS):
+                raise
+        # created by another process since it was looked up
+        experiment = transport.call(
+            client.get_experiment_by_name, experiment_name)
+    if getattr(experiment, 'lifecycle_stage', None) == 'deleted':
+        raise MlflowException(
+            "Experiment {} is deleted; restore it, or permanently delete "
+            "it, to log runs to it.".format(experiment_name),
+            error_code=INVALID_PARAMETER_VALUE,
+        )
+    return experiment.experiment_id
+
+
+def _cached_experiment_id(key, now):
+    with _EXPERIMENT_IDS_LOCK:
+        cached = _EXPERIMENT_IDS.get(key)
+    if cached is not None and now < cached[1]:
+        return cached[0]
+    return None
+
+
+def _experiment_id_lock(key):
+    with _EXPERIMENT_IDS_LOCK:
+        return _EXPERIMENT_ID_LOCKS.setdefault(key, threading.Lock())
+
+
+def _experiment_id(client, experiment_name):
+    """Returns the id of the named experiment, creating it if needed.
+
+    Ids are cached in memory, and on disk if EXPERIMENT_CACHE_ON_DISK is set,
+    for EXPERIMENT_CACHE_TTL_SEC seconds, so that runs of the same experiment
+    do not look it up again. Threads resolving the same experiment wait for
+    the first of them, so that it is created at most once.
+    """
+    key = _experiment_cache_key(experiment_name)
+    experiment_id = _cached_experiment_id(key, time.monotonic())
+    if experiment_id is not None:
+        return experiment_id
+    with _experiment_id_lock(key):
+        now = time.monotonic()
+        experiment_id = _cached_experiment_id(key, now)
+        if experiment_id is not None:
+            return experiment_id
+        host_cache = host_experiment_cache()
+        entry = host_cache.get(key)
+        if entry is not None:
+            experiment_id = entry['experiment_id']
+        else:
+            experiment_id = _resolve_experiment_id(client, experiment_name)
+            host_cache.put(key, {'experiment_id': experiment_id})
+        ttl_sec = CFG[CfgKey.EXPERIMENT_CACHE_TTL_SEC]
+        if ttl_sec > 0:
+            with _EXPERIMENT_IDS_LOCK:
+                _EXPERIMENT_IDS[key] = (experiment_id, now + ttl_sec)
+    return experiment_id
+
+
+def invalidate_experiment_id(experiment_name):
+    """Drops the cached id of the named experiment, if any.
+
+    Parameters
+    ----------
+    experiment_name : str
+        The name of the experiment.
+    """
+    key = _experiment_cache_key(experiment_name)
+    with _EXPERIMENT_IDS_LOCK:
+        _EXPERIMENT_IDS.pop(key, None)
+    host_experiment_cache().remove(key)
+
+
+def _with_experiment_id(client, experiment_name, fn):
+    """Calls fn with the id of the named experiment, and returns its result.
+
+    If fn fails as the cached id is of an experiment deleted since, it is
+    called again with a freshly resolved id.
+    """
+    try:
+        return fn(_experiment_id(client, experiment_name))
+    except MlflowException as e:
+        if e.error_code not in _STALE_EXPERIMENT_ERROR_CODES:
+            raise
+        invalidate_experiment_id(experiment_name)
+        return fn(_experiment_id(client, experiment_name))
+
+
+def _spool_fallback(run_id, method_name, *args):
+    """Returns a fallback call logging to the fallback spool of a run."""
+    def fallback():
+        from .spool import fallback_spool
+        getattr(fallback_spool(run_id), method_name)(*args)
+    return fallback
+
+
+def log_batch(run_id, tags=None, params=None, metrics=None,
+              spool_on_failure=True):
+    """Logs the given tags, params and metrics to a run in few requests.
+
+    Everything is sent through MlflowClient.log_batch, split into as few
+    requests as the per-request limits of the tracking server allow. Batches
+    that fail to reach the tracking server are spooled for a later replay.
+
+    Parameters
+    ----------
+    run_id : str
+        The id of the MLflow run to log to.
+    tags : dict, optional
+        Dictionary of tag_name: String -> value: (String, but will be
+        string-ified if not).
+    params : dict, optional
+        Dictionary of param_name: String -> value: (String, but will be
+        string-ified if not).
+    metrics : dict or list of mlflow.entities.Metric, optional
+        Dictionary of metric_name: String -> value: Float, or a list of
+        already constructed Metric entities.
+    spool_on_failure : bool, default True
+        If False, a failure to reach the tracking server is raised instead.
+
+    Returns
+    -------
+    int
+        The number of requests made.
+    """
+    tags = [RunTag(key, str(val)) for key, val in (tags or {}).items()]
+    params = [Param(key, str(val)) for key, val in (params or {}).items()]
+    metrics = metrics or []
+    if isinstance(metrics, dict):
+        timestamp = _now_ms()
+        metrics = [
+            Metric(key, float(val), timestamp, 0)
+            for key, val in metrics.items()
+        ]
+    else:
+        metrics = list(metrics)
+    n_requests = 0
+    client = tracking_client()
+    for b_metrics, b_params, b_tags in _split_batches(metrics, params, tags):
+        fallback = None
+        if spool_on_failure:
+            fallback = _spool_fallback(
+                run_id, 'log_batch', b_tags, b_params, b_metrics)
+        # metrics carry their timestamps, so a repeated batch is harmless
+        transport.call(
+            client.log_batch, fallback=fallback,
+            run_id=run_id, metrics=b_metrics, params=b_params, tags=b_tags)
+        n_requests += 1
+    return n_requests
 
 
 # === Artifact-related code ===
 
+def _artifact_files(dpath):
+    """Yields (file path, artifact path) pairs for all files in a directory.
+
+    The artifact path of each file is its directory relative to dpath, so
+    that the directory structure is kept under the artifact root.
+    """
+    for root, _, fnames in os.walk(dpath):
+        artifact_path = os.path.relpath(root, dpath)
+        if artifact_path == os.curdir:
+            artifact_path = None
+        else:
+            artifact_path = artifact_path.replace(os.sep, '/')
+        for fname in sorted(fnames):
+            yield os.path.join(root, fname), artifact_path
+
+
+def log_artifact_files(run_id, artifact_files, spool_on_failure=True,
+                       artifact_uri=None):
+    """Uploads the given files to the given run on a bounded thread pool.
+
+    Files that fail to reach the artifact store are spooled for a later
+    replay.
+
+    Parameters
+    ----------
+    run_id : str
+        The id of the MLflow run to log the files to.
+    artifact_files : list of tuple
+        A list of (file path, artifact path) pairs. The artifact path is the
+        directory under the artifact root to upload the file to, or None to
+        upload it to the artifact root itself.
+    spool_on_failure : bool, default True
+        If False, a failure to reach the artifact store is raised instead.
+    artifact_uri : str, optional
+        The artifact root of the run, if known, saving a request to get it.
+    """
+    if not artifact_files:
+        return
+
+    def upload(fpath, artifact_path):
+        fallback = None
+        if spool_on_failure:
+            fallback = _spool_fallback(
+                run_id, 'log_files', [fpath], artifact_path)
+        transport.call(
+            repo.log_artifact, fpath, artifact_path, fallback=fallback)
+
+    # resolve the artifact repository once, instead of once per file
+    if artifact_uri is None:
+        run = transport.call(
+            tracking_client().get_run, run_id,
+            fallback=(lambda: None) if spool_on_failure else None)
+        if run is None:
+            for fpath, artifact_path in artifact_files:
+                _spool_fallback(
+                    run_id, 'log_files', [fpath], artifact_path)()
+            return
+        artifact_uri = run.info.artifact_uri
+    repo = get_artifact_repository(artifact_uri)
+    n_workers = min(CFG[CfgKey.ARTIFACT_UPLOAD_WORKERS], len(artifact_files))
+    if n_workers <= 1:
+        for fpath, artifact_path in artifact_files:
+            upload(fpath, artifact_path)
+        return
+    with ThreadPoolExecutor(
+        max_workers=n_workers,
+        thread_name_prefix='actarius-upload',
+    ) as executor:
+        futures = [
+            executor.submit(upload, fpath, artifact_path)
+            for fpath, artifact_path in artifact_files
+        ]
+        for future in futures:
+            future.result()
+
+
 class ArgusArtifactory(object):
 
     def __init__(self, run_id, artifacts_dpath=None):
@@ -40,7 +420,7 @@ class ArgusArtifactory(object):
         print("Artifact directory for current run: {}".format(
             self.artifacts_dpath))
 
-    def log_artifacts(self, artifacts_dir_paths=None):
+    def log_artifacts(self, artifacts_dir_paths=None, run_id=None):
         """Logs all artifacts in all configured artifact directories to MLflow.
 
         Parameters
@@ -48,21 +428,32 @@ class ArgusArtifactory(object):
         artifacts_dir_paths : str or list of str, optional
             If given, all artifacts in the given directory or directories are
             uploaded to the MLflow run tracking this run.
+        run_id : str, optional
+            The id of the MLflow run to log artifacts to. Defaults to the
+            active run.
         """
+        if run_id is None:
+            run_id = active_run_id()
+        dpaths = [self.artifacts_dpath]
+        if artifacts_dir_paths is not None:
+            if isinstance(artifacts_dir_paths, str):
+                dpaths.append(artifacts_dir_paths)
+            else:
+                dpaths.extend(artifacts_dir_paths)
         print("Logging artifacts for run {}...".format(self.run_id))
-        print("Logging artifacts in {}...".format(self.artifacts_dpath))
+        for dpath in dpaths:
+            print("Logging artifacts in {}...".format(dpath))
         if self._closed:
             print(("ArgusArtifactory is alreaady closed! Artifacts logging "
                    "skipped!."))
-        mlflow.log_artifacts(self.artifacts_dpath)
-        if artifacts_dir_paths is not None:
-            if isinstance(artifacts_dir_paths, str):
-                print("Logging artifacts in {}...".format(artifacts_dir_paths))
-                mlflow.log_artifacts(artifacts_dir_paths)
-            else:
-                for path in artifacts_dir_paths:
-                    print("Logging artifacts in {}...".format(path))
-                    mlflow.log_artifacts(path)
+        log_artifact_files(
+            run_id=run_id,
+            artifact_files=[
+                fpath_pair
+                for dpath in dpaths
+                for fpath_pair in _artifact_files(dpath)
+            ],
+        )
         print("Done logging artifacts.")
 
     def close(self):
@@ -71,10 +462,96 @@ class ArgusArtifactory(object):
         shutil.rmtree(self.artifacts_dpath)
 
 
-def log_df(df, name):
-    """Logs the input dataframe with the given name in the running experiment.
+def _staging_dpath():
+    """Returns the directory to stage in-memory artifacts for upload in.
 
-    The dataframe is saved as a csv file.
+    MLflow artifact repositories only upload files, so small artifacts are
+    staged in a RAM-backed directory when one is available.
+    """
+    if os.path.isdir(MEMORY_DPATH) and os.access(MEMORY_DPATH, os.W_OK):
+        return MEMORY_DPATH
+    return temp_dir()
+
+
+def _write_staged(data, name, staging_dpath):
+    dpath = tempfile.mkdtemp(dir=staging_dpath)
+    try:
+        with open(os.path.join(dpath, name), 'wb') as f:
+            f.write(data)
+    except OSError:
+        shutil.rmtree(dpath, ignore_errors=True)
+        raise
+    return dpath
+
+
+def _stage_bytes(data, name):
+    """Writes the given bytes into a file with the given name, for upload.
+
+    The file is written into a new temporary directory, whose path is
+    returned, under _staging_dpath(), or under temp_dir() if that fails,
+    e.g. as the RAM-backed directory is full.
+    """
+    staging_dpath = _staging_dpath()
+    try:
+        return _write_staged(data, name, staging_dpath)
+    except OSError:
+        if staging_dpath == temp_dir():
+            raise
+        return _write_staged(data, name, temp_dir())
+
+
+def log_artifact_bytes(data, name, run_id=None):
+    """Logs the given bytes as an artifact with the given name.
+
+    Parameters
+    ----------
+    data : bytes-like object
+        The content of the artifact.
+    name : str
+        The name to assign to the artifact.
+    run_id : str, optional
+        The id of the MLflow run to log the artifact to. Defaults to the
+        active run.
+    """
+    if run_id is None:
+        run_id = active_run_id()
+    dpath = _stage_bytes(data, name)
+    try:
+        fpath = os.path.join(dpath, name)
+        transport.call(
+            tracking_client().log_artifact, run_id, fpath,
+            fallback=_spool_fallback(run_id, 'log_files', [fpath]))
+    finally:
+        shutil.rmtree(dpath, ignore_errors=True)
+
+
+def _log_serialized_artifact(name, dump_fn):
+    """Logs the artifact dump_fn writes into a binary file object.
+
+    The artifact is serialized into memory, and only spills to a file in
+    CACHE_DPATH if it grows beyond IN_MEMORY_ARTIFACT_MAX_BYTES.
+    """
+    spool = SpooledArtifact(
+        name=name,
+        max_memory_bytes=CFG[CfgKey.IN_MEMORY_ARTIFACT_MAX_BYTES],
+        spill_dpath=temp_dir(),
+    )
+    try:
+        dump_fn(spool)
+        spool.close()
+        if spool.in_memory:
+            log_artifact_bytes(spool.getbuffer(), name)
+        else:
+            run_id = active_run_id()
+            transport.call(
+                tracking_client().log_artifact, run_id, spool.fpath,
+                fallback=_spool_fallback(run_id, 'log_files', [spool.fpath]))
+    finally:
+        spool.discard()
+
+
+def log_df(df, name, format=None):
+    """Logs the input dataframe with the given name in the running experiment.
 
     Parameters
     ==========
@@ -82,17 +559,21 @@ def log_df(df, name):
         The dataframe to save as an experiment artifact.
     name : str
         The name to assign to the saved artifact.
+    format : str, optional
+        One of 'csv', 'csv.gz', 'parquet', 'feather' and 'pickle'. If not
+        given, the format is inferred from the extension of name, if it has
+        a known one. Otherwise, small dataframes are saved as CSV, and large
+        ones as parquet if pyarrow is installed, or pickled if it is not. The
+        extension of the format is appended to name if missing.
     """
-    fpath = os.path.join(CACHE_DPATH, name)
-    df.to_csv(fpath)
-    mlflow.log_artifact(fpath)
-    os.remove(fpath)
+    format, name = resolve_df_format(df, name, format=format)
+    _log_serialized_artifact(name, lambda f: dump_df(df, f, format))
 
 
-def log_obj(obj, name):
+def log_obj(obj, name, compression=None, out_of_band=False):
     """Logs the input object with the given name in the running experiment.
 
-    Pickles the input Python object.
+    Pickles the input Python object, using the highest pickle protocol.
 
     Parameters
     ==========
@@ -100,12 +581,22 @@ def log_obj(obj, name):
         A Python object to pickle.
     name : str
         The name to assign to the saved artifact.
+    compression : str, optional
+        One of 'gzip', 'lz4', 'zstd' and 'auto', with 'auto' picking the
+        best one installed. Defaults to the OBJ_COMPRESSION configuration
+        value, and to no compression if that is empty. The extension of the
+        compression is appended to name if missing.
+    out_of_band : bool, default False
+        If True, buffers of buffer-backed objects, like NumPy arrays, are
+        written out of band. The artifact must then be loaded with
+        actarius.load_obj.
     """
-    fpath = os.path.join(CACHE_DPATH, name)
-    with open(fpath, 'wb+') as f:
-        pickle.dump(obj, f)
-    mlflow.log_artifact(fpath)
-    os.remove(fpath)
+    if compression is None:
+        compression = CFG[CfgKey.OBJ_COMPRESSION]
+    compression = resolve_obj_compression(compression)
+    name = obj_artifact_name(name, compression)
+    _log_serialized_artifact(name, lambda f: dump_obj(
+        obj, f, compression=compression, out_of_band=out_of_band))
 
 
 def log_obj_as_text(obj, name):
@@ -120,23 +611,162 @@ def log_obj_as_text(obj, name):
     name : str
         The name to assign to the saved artifact.
     """
-    fpath = os.path.join(CACHE_DPATH, name)
-    with open(fpath, 'wt+') as f:
-        f.write(str(obj))
-    mlflow.log_artifact(fpath)
-    os.remove(fpath)
+    _log_serialized_artifact(name, lambda f: f.write(str(obj).encode()))
 
 
 # === Logging-related code ===
 
+class LogFile(object):
+    """A buffered text log file, optionally compressed and size-capped.
+
+    The file is written through a large write buffer, so small writes only
+    reach the OS in big batches. It can be compressed while it is written,
+    and capped in size by splitting it into segments: once more than
+    n_segments segments were written, the oldest one after the first is
+    deleted, so that both the head and the tail of the log are kept.
+
+    Parameters
+    ----------
+    fpath : str
+        The path of the (first segment of the) log file, without the
+        extension of the compression, if any.
+    buffer_size : int
+        The size of the write buffer, in bytes.
+    compression : str, optional
+        Either 'gzip' or 'lzma'. The log file is not compressed if not given.
+    max_bytes : int, optional
+        The maximum number of uncompressed characters to keep. Not capped if
+        not given.
+    n_segments : int, default 4
+        The number of segments to split the log into when it is capped.
+    flush_interval_sec : float, default 0
+        The minimum time, in seconds, between two flushes made by
+        flush_if_due().
+    """
+
+    COMPRESSION_EXTENSIONS = {
+        'gzip': '.gz',
+        'lzma': '.xz',
+    }
+    COMPRESSION_OPENERS = {
+        'gzip': gzip.GzipFile,
+        'lzma': lzma.LZMAFile,
+    }
+
+    def __init__(self, fpath, buffer_size, compression=None, max_bytes=None,
+                 n_segments=4, flush_interval_sec=0):
+        if compression is not None and (
+                compression not in self.COMPRESSION_EXTENSIONS):
+            raise ValueError("Unsupported log compression: {}".format(
+                compression))
+        self.base_fpath = fpath
+        self.buffer_size = buffer_size
+        self.compression = compression
+        self.n_segments = max(n_segments, 2)
+        self.segment_bytes = None
+        if max_bytes:
+            self.segment_bytes = max(max_bytes // self.n_segments, 1)
+        self.n_truncated = 0
+        self.flush_interval_sec = flush_interval_sec
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self._open_segment(1)
+
+    def segment_fpath(self, index):
+        """Returns the path of the segment with the given 1-based index."""
+        fpath = self.base_fpath
+        if index > 1:
+            root, ext = os.path.splitext(fpath)
+            fpath = "{}.part{:04d}{}".format(root, index, ext)
+        return fpath + self.COMPRESSION_EXTENSIONS.get(self.compression, '')
+
+    @property
+    def fpaths(self):
+        """The paths of all segments of this log file still on disk."""
+        return [
+            self.segment_fpath(index)
+            for index in range(1, self.segment_index + 1)
+            if os.path.exists(self.segment_fpath(index))
+        ]
+
+    def _open_segment(self, index):
+        fpath = self.segment_fpath(index)
+        if self.compression is None:
+            self._compressed = None
+            self.file = open(fpath, "a", buffering=self.buffer_size)
+        else:
+            opener = self.COMPRESSION_OPENERS[self.compression]
+            self._compressed = opener(fpath, "ab")
+            self.file = io.TextIOWrapper(
+                io.BufferedWriter(self._compressed, self.buffer_size),
+                encoding='utf-8',
+            )
+        self.segment_index = index
+        self._segment_size = 0
+        if self.segment_bytes is None and self.compression is None:
+            # binding the write method directly spares a call on every write
+            self.write = self.file.write
+        else:
+            # compressed streams must not be written to while being flushed
+            self.write = self._locked_write
+
+    def _locked_write(self, message):
+        with self._lock:
+            # rotating only before a write never leaves an empty last segment
+            if self.segment_bytes is not None:
+                if self._segment_size >= self.segment_bytes:
+                    self._rotate()
+                self._segment_size += len(message)
+            self.file.write(message)
+
+    def _rotate(self):
+        self.file.close()
+        index = self.segment_index + 1
+        # keep the first segment and the last n_segments - 1 ones
+        dropped_index = index - self.n_segments + 1
+        if dropped_index > 1:
+            os.remove(self.segment_fpath(dropped_index))
+            self.n_truncated += 1
+        self._open_segment(index)
+        if self.n_truncated:
+            self.file.write((
+                "[actarius: log segment {}; {} earlier segment(s) were "
+                "truncated]\n").format(index, self.n_truncated))
+
+    @property
+    def closed(self):
+        return self.file.closed
+
+    def flush(self):
+        with self._lock:
+            if self.file.closed:
+                return
+            self.file.flush()
+            if self._compressed is not None:
+                # for gzip, this also makes all data written so far
+                # decompressable by readers of the file
+                self._compressed.flush()
+            self._last_flush = time.monotonic()
+
+    def flush_if_due(self):
+        """Flushes the file if it was not flushed in flush_interval_sec."""
+        if time.monotonic() - self._last_flush >= self.flush_interval_sec:
+            self.flush()
+
+    def close(self):
+        with self._lock:
+            self.file.close()
+
+
 class Logger(object):
     def __init__(self, stream, log_file):
         self.stream = stream
         self.log_file = log_file
 
     def write(self, message):
-        self.log_file.write(message)
+        # the console is written to first, so it keeps its latency
         self.stream.write(message)
+        self.log_file.write(message)
 
     def __getattr__(self, attr):
         return getattr(self.stream, attr)
@@ -145,131 +775,285 @@ class Logger(object):
         pass
 
     def flush(self):
-        self.log_file.flush()
+        # the logging module, tqdm and print(flush=True) all flush after
+        # every line, so the log file is only flushed once in a while, still
+        # reaching the OS before the process is killed, e.g. on OOM
         self.stream.flush()
+        self.log_file.flush_if_due()
+
+
+def _none_if_empty(value):
+    return value or None
 
 
 class DoubleLogger(object):
-    def __init__(self, log_fpath):
+    """Tees stdout and stderr into a log file.
+
+    The log file is flushed on flush() and close(), and at interpreter exit,
+    so its content survives unhandled exceptions. Flushes of stdout and
+    stderr also flush it, at most once every LOG_FLUSH_INTERVAL_SEC seconds,
+    so the log survives the process being killed too.
+
+    Parameters
+    ----------
+    log_fpath : str
+        The path of the log file to append to, without the extension of the
+        compression, if any.
+    compression : str, optional
+        Either 'gzip' or 'lzma'. Defaults to the LOG_COMPRESSION configuration
+        value, and to no compression if that is empty.
+    max_bytes : int, optional
+        The maximum number of uncompressed characters to keep, keeping both
+        the head and the tail of the log. Defaults to the LOG_MAX_BYTES
+        configuration value, and to no cap if that is 0.
+    """
+
+    def __init__(self, log_fpath, compression=None, max_bytes=None):
         self.prev_stdout = sys.stdout
         self.prev_stderr = sys.stderr
-        self.log_file = open(log_fpath, "a")
+        if compression is None:
+            compression = _none_if_empty(CFG[CfgKey.LOG_COMPRESSION])
+        if max_bytes is None:
+            max_bytes = _none_if_empty(CFG[CfgKey.LOG_MAX_BYTES])
+        self.log_file = LogFile(
+            log_fpath,
+            buffer_size=CFG[CfgKey.LOG_BUFFER_SIZE],
+            compression=compression,
+            max_bytes=max_bytes,
+            n_segments=CFG[CfgKey.LOG_SEGMENTS],
+            flush_interval_sec=CFG[CfgKey.LOG_FLUSH_INTERVAL_SEC],
+        )
         # init stdout logging
         self.stdout_logger = Logger(self.prev_stdout, self.log_file)
         sys.stdout = self.stdout_logger
         # init stderr logging
         self.stderr_logger = Logger(self.prev_stderr, self.log_file)
         sys.stderr = self.stderr_logger
+        self._closed = False
+        atexit.register(self.flush)
+
+    @property
+    def log_fpaths(self):
+        """The paths of all log files to upload."""
+        return self.log_file.fpaths
+
+    def flush(self):
+        if not self._closed:
+            self.log_file.flush()
 
     def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        atexit.unregister(self.flush)
         self.log_file.close()
         sys.stdout = self.prev_stdout
         sys.stderr = self.prev_stderr
 
+    def remove_log_files(self):
+        """Removes all log files from disk."""
+        for fpath in self.log_fpaths:
+            os.remove(fpath)
 
-# === git-related tags ===
 
-@lru_cache(maxsize=1)
-def _git_repo():
-    return git.Repo(os.getcwd(), search_parent_directories=True)
+class NullLogger(object):
+    """Stands in for a DoubleLogger, for runs not capturing console output."""
 
+    log_fpaths = ()
 
-@lru_cache(maxsize=1)
-def _git_conf_reader():
-    return _git_repo().config_reader()
+    def flush(self):
+        pass
 
+    def close(self):
+        pass
 
-# @lru_cache(maxsize=1)
-# def git_username():
-#     _git_conf_reader().get_value("user", "name")
+    def remove_log_files(self):
+        pass
 
 
-# @lru_cache(maxsize=1)
-# def git_user_email():
-#     _git_conf_reader().get_value("user", "email")
+_DECOMPRESSORS = {
+    'gzip': lambda: zlib.decompressobj(16 + zlib.MAX_WBITS),
+    'lzma': lzma.LZMADecompressor,
+}
+_COMPRESSORS = {
+    'gzip': gzip.compress,
+    'lzma': lzma.compress,
+}
 
 
-@lru_cache(maxsize=1)
+class LogStreamer(object):
+    """Uploads a growing log to an MLflow run in rolling chunks.
+
+    A background thread uploads everything written to the log since the
+    last upload as a new log_parts/log_part_NNNN.txt artifact, once
+    chunk_bytes were written or interval_sec seconds have passed. Chunks are
+    cut at line ends whenever possible, and compressed like the log file.
+
+    Parameters
+    ----------
+    logger : DoubleLogger
+        The logger writing the log to stream.
+    run_id : str
+        The id of the MLflow run to upload log parts to.
+    chunk_bytes : int
+        Upload a new part once this many bytes were written.
+    interval_sec : float
+        Upload a new part, if anything was written, this many seconds after
+        the last upload.
+    """
+
+    PART_FNAME_TEMPLATE = "log_part_{:04d}.txt"
+    ARTIFACT_PATH = "log_parts"
+
+    def __init__(self, logger, run_id, chunk_bytes, interval_sec):
+        self.logger = logger
+        self.log_file = logger.log_file
+        self.run_id = run_id
+        self.chunk_bytes = chunk_bytes
+        self.interval_sec = interval_sec
+        self.parts_dpath = os.path.join(
+            CACHE_DPATH, "log_parts_{}".format(run_id))
+        os.makedirs(self.parts_dpath, exist_ok=True)
+        self.n_parts = 0
+        self._segment = 1
+        self._offset = 0
+        self._decompressor = self._new_decompressor()
+        self._pending = b''
+        self._last_upload = time.monotonic()
+        self._stop = threading.Event()
+        self._warned = False
+        self._thread = threading.Thread(
+            target=self._run, name='actarius-log-streamer', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def _run(self):
+        poll_sec = min(self.interval_sec, 1)
+        while not self._stop.wait(poll_sec):
+            self.logger.flush()
+            try:
+                self._upload_new_content(final=False)
+            except Exception as e:
+                if not self._warned:
+                    self._warned = True
+                    warnings.warn("Failed streaming log to MLflow: {}".format(
+                        e))
+
+    def _new_decompressor(self):
+        decompressor = _DECOMPRESSORS.get(self.log_file.compression)
+        if decompressor is None:
+            return None
+        return decompressor()
+
+    def _read_new_content(self):
+        content = []
+        while True:
+            # segments before the current one are complete once we read them
+            current_segment = self.log_file.segment_index
+            fpath = self.log_file.segment_fpath(self._segment)
+            if os.path.exists(fpath):
+                with open(fpath, 'rb') as f:
+                    f.seek(self._offset)
+                    raw = f.read()
+                self._offset += len(raw)
+                if self._decompressor is not None:
+                    raw = self._decompressor.decompress(raw)
+                content.append(raw)
+            if self._segment >= current_segment:
+                return b''.join(content)
+            # move on to the next segment; truncated ones are simply skipped
+            self._segment += 1
+            self._offset = 0
+            self._decompressor = self._new_decompressor()
+
+    def _upload_new_content(self, final):
+        self._pending += self._read_new_content()
+        content = self._pending
+        if not content:
+            return
+        if not final:
+            interval_passed = (
+                time.monotonic() - self._last_upload >= self.interval_sec)
+            if len(content) < self.chunk_bytes and not interval_passed:
+                return
+            # cut at the last line end, unless a single line fills a chunk
+            last_line_end = content.rfind(b'\n')
+            if last_line_end != -1:
+                content = content[:last_line_end + 1]
+            elif len(content) < self.chunk_bytes:
+                return
+        self.n_parts += 1
+        part_fname = self.PART_FNAME_TEMPLATE.format(self.n_parts)
+        part_content = content
+        compression = self.log_file.compression
+        if compression is not None:
+            part_fname += LogFile.COMPRESSION_EXTENSIONS[compression]
+            part_content = _COMPRESSORS[compression](content)
+        part_fpath = os.path.join(self.parts_dpath, part_fname)
+        with open(part_fpath, 'wb') as f:
+            f.write(part_content)
+        # unsent content is kept, and sent with a later part, unless final
+        fallback = None
+        if final:
+            fallback = _spool_fallback(
+                self.run_id, 'log_files', [part_fpath], self.ARTIFACT_PATH)
+        try:
+            transport.call(
+                tracking_client().log_artifact,
+                self.run_id, part_fpath, self.ARTIFACT_PATH,
+                fallback=fallback)
+        except Exception:
+            self.n_parts -= 1
+            raise
+        finally:
+            os.remove(part_fpath)
+        self._pending = self._pending[len(content):]
+        self._last_upload = time.monotonic()
+
+    def stop(self):
+        """Stops streaming and uploads all remaining log content.
+
+        Should be called after the logger is closed, so that nothing is
+        written to the log after the final part.
+        """
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        self._upload_new_content(final=True)
+        shutil.rmtree(self.parts_dpath, ignore_errors=True)
+
+
+# === git-related tags ===
+
 def git_repo_name():
-    try:
-        url = _git_repo().remotes.origin.url
-        if '/' in url:
-            url = url.split('/')[-1]
-        if url.endswith('.git'):
-            url = url[:-4]  # remove .git from end of url
-        return url
-    except git.exc.InvalidGitRepositoryError:
-        return "NotFromGitRepo"
+    return git_snapshot().repo_name
 
 
-@lru_cache(maxsize=1)
 def git_branch():
-    try:
-        return _git_repo().active_branch.name
-    except (git.exc.InvalidGitRepositoryError, TypeError):
-        return "NotFromGitRepo"
-
-
-def _minimal_ext_cmd(cmd):
-    # construct minimal environment
-    env = {}
-    for k in ['SYSTEMROOT', 'PATH', 'HOME']:
-        v = os.environ.get(k)
-        if v is not None:
-            env[k] = v
-    # LANGUAGE is used on win32
-    env['LANGUAGE'] = 'C'
-    env['LANG'] = 'C'
-    env['LC_ALL'] = 'C'
-    out = subprocess.check_output(cmd, stderr=subprocess.STDOUT, env=env)
-    return out
-
-
-def _safe_cmd_res(cmd_arry, unknown_str="UnknownValue"):
-    try:
-        out = _minimal_ext_cmd(cmd_arry)
-        res = out.strip().decode('ascii')
-    except (subprocess.SubprocessError, OSError):
-        return unknown_str
-    if not res:
-        # this shouldn't happen but apparently can (see gh-8512)
-        return unknown_str
-    return res
+    return git_snapshot().branch
 
 
-@lru_cache(maxsize=1)
 def git_commit_checksum():
-    return _safe_cmd_res(
-        cmd_arry=['git', 'rev-parse', 'HEAD'],
-        unknown_str="NotFromGitRepo",
-    )
+    return git_snapshot().commit
 
 
-@lru_cache(maxsize=1)
 def git_username():
-    return _safe_cmd_res(['git', 'config', 'user.name'])
+    return git_snapshot().username
 
 
-@lru_cache(maxsize=1)
 def git_user_email():
-    return _safe_cmd_res(['git', 'config', 'user.email'])
+    return git_snapshot().user_email
 
 
-@lru_cache(maxsize=1)
-def sagemaker_instance_name():
-    log_path = '/opt/ml/metadata/resource-metadata.json'
-    try:
-        with open(log_path, 'r') as logs:
-            _logs = json.load(logs)
-        return _logs['ResourceName']
-    except FileNotFoundError:
-        return "NotFromSageMaker"
-
-
-def set_shared_tags():
-    mlflow.set_tag('git_repo', git_repo_name())
-    mlflow.set_tag('git_branch', git_branch())
-    mlflow.set_tag('git_username', git_username())
-    mlflow.set_tag('git_user_email', git_user_email())
-    mlflow.set_tag('git_commit_checksum', git_commit_checksum())
-    mlflow.set_tag('sagemaker_instance_name', sagemaker_instance_name())
+def set_shared_tags(run_id=None):
+    """Sets all shared tags on the given run in a single request.
+
+    Parameters
+    ----------
+    run_id : str, optional
+        The id of the MLflow run to tag. Defaults to the active run.
+    """
+    if run_id is None:
+        run_id = active_run_id()
+    log_batch(run_id=run_id, tags=shared_tags())
@@ -0,0 +1,174 @@
+"""Named timing spans within experiment runs."""
+
+import os
+import re
+import json
+import time
+import threading
+from array import array
+from contextlib import ContextDecorator
+from contextvars import ContextVar
+
+
+METRIC_PREFIX = 'span/'
+TRACE_FNAME = 'spans_trace.json'
+
+_INVALID_METRIC_CHARS = re.compile(r'[^\w\-. /]')
+
+
+def _metric_name(path, stat_name):
+    # mlflow metric names are limited to a small set of characters
+    return '{}{}/{}'.format(
+        METRIC_PREFIX, _INVALID_METRIC_CHARS.sub('_', path)[:200], stat_name)
+
+
+def _percentile(sorted_values, q):
+    # nearest-rank percentile
+    index = max(0, -(-len(sorted_values) * q // 100) - 1)
+    return sorted_values[int(index)]
+
+
+class _Span(ContextDecorator):
+
+    def __init__(self, recorder, name):
+        self.recorder = recorder
+        self.name = name
+
+    def __enter__(self):
+        self.recorder._enter(self.name)
+        return self
+
+    def __exit__(self, *args):
+        self.recorder._exit()
+        return False
+
+
+class SpanRecorder(object):
+    """Records the durations of named, possibly nested, timing spans.
+
+    Spans nest per thread, and per asyncio task: a span opened while another
+    is open is recorded under the path of its parent, as in
+    'train/epoch/forward'. Durations of
+    all spans with the same path are aggregated, and each span is also kept
+    as an event of a Chrome trace, viewable in chrome://tracing or Perfetto.
+
+    Parameters
+    ----------
+    max_trace_events : int, default 100000
+        Spans beyond this many are still aggregated, but are left out of the
+        trace, to bound its memory use.
+    """
+
+    def __init__(self, max_trace_events=100000):
+        self.max_trace_events = max_trace_events
+        self.n_dropped_events = 0
+        self._origin_ns = time.perf_counter_ns()
+        self._durations = {}
+        self._events = []
+        # each thread and asyncio task sees its own stack of open spans
+        self._stack = ContextVar('actarius_span_stack', default=())
+        self._lock = threading.Lock()
+
+    def span(self, name):
+        """Returns a context manager, also a decorator, timing a span.
+
+        Parameters
+        ----------
+        name : str
+            The name of the span.
+
+        Returns
+        -------
+        contextlib.ContextDecorator
+            Times the span it wraps on each use.
+        """
+        return _Span(self, name)
+
+    def _enter(self, name):
+        stack = self._stack.get()
+        path = stack[-1][0] + '/' + name if stack else name
+        self._stack.set(stack + ((path, name, time.perf_counter_ns()),))
+
+    def _exit(self):
+        end_ns = time.perf_counter_ns()
+        stack = self._stack.get()
+        self._stack.set(stack[:-1])
+        path, name, start_ns = stack[-1]
+        duration_ns = end_ns - start_ns
+        with self._lock:
+            durations = self._durations.get(path)
+            if durations is None:
+                durations = self._durations[path] = array('q')
+            durations.append(duration_ns)
+            if len(self._events) < self.max_trace_events:
+                self._events.append((
+                    name, path, start_ns - self._origin_ns, duration_ns,
+                    threading.get_ident(),
+                ))
+            else:
+                self.n_dropped_events += 1
+
+    def __len__(self):
+        return len(self._durations)
+
+    def stats(self):
+        """Returns aggregate statistics of all recorded spans.
+
+        Returns
+        -------
+        dict
+            Maps the path of each span to a dict with its count, and the
+            total, min, max, p50 and p95 of its durations, in seconds.
+        """
+        with self._lock:
+            all_durations = {
+                path: sorted(durations)
+                for path, durations in self._durations.items()
+            }
+        return {
+            path: {
+                'count': len(durations),
+                'total_sec': sum(durations) / 1e9,
+                'min_sec': durations[0] / 1e9,
+                'max_sec': durations[-1] / 1e9,
+                'p50_sec': _percentile(durations, 50) / 1e9,
+                'p95_sec': _percentile(durations, 95) / 1e9,
+            }
+            for path, durations in all_durations.items()
+        }
+
+    def metrics(self):
+        """Returns aggregate statistics of all spans as a dict of metrics."""
+        return {
+            _metric_name(path, stat_name): value
+            for path, path_stats in self.stats().items()
+            for stat_name, value in path_stats.items()
+        }
+
+    def dump_trace(self, fpath):
+        """Writes all recorded spans into a Chrome trace JSON file.
+
+        Parameters
+        ----------
+        fpath : str
+            The path of the file to write.
+        """
+        pid = os.getpid()
+        with self._lock:
+            events = list(self._events)
+        trace_events = [
+            {
+                'name': name,
+                'cat': 'span',
+                'ph': 'X',
+                'ts': start_ns / 1000,
+                'dur': duration_ns / 1000,
+                'pid': pid,
+                'tid': tid,
+                'args': {'path': path},
+            }
+            for name, path, start_ns, duration_ns, tid in events
+        ]
+        with open(fpath, 'wt') as f:
+            json.dump(
+                {'traceEvents': trace_events, 'displayTimeUnit': 'ms'}, f)
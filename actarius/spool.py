@@ -0,0 +1,518 @@
+"""A durable local spool of runs that could not be reported to MLflow."""
+
+import os
+import json
+import time
+import uuid
+import atexit
+import shutil
+import socket
+import warnings
+import threading
+from urllib.parse import urlparse, unquote
+from urllib.request import url2pathname
+
+from mlflow.entities import Metric, RunStatus
+from mlflow.tracking import MlflowClient
+from mlflow.utils.mlflow_tags import MLFLOW_RUN_NAME
+
+from .cfg import (
+    CFG,
+    CfgKey,
+    TEMP_DIR,
+)
+from .shared import (
+    _artifact_files,
+    _experiment_id,
+    log_artifact_files,
+    log_batch,
+    tracking_client,
+)
+
+
+SPOOL_DPATH = os.path.join(TEMP_DIR, 'spool')
+JOURNAL_FNAME = 'journal.jsonl'
+ARTIFACTS_DNAME = 'artifacts'
+FILE_STORE_DNAME = 'mlruns'
+LOCK_FNAME = 'replay.lock'
+
+
+def spool_dpath():
+    """Returns the directory runs are spooled in."""
+    return CFG[CfgKey.SPOOL_DPATH] or SPOOL_DPATH
+
+
+class RunSpool(object):
+    """An append-only journal of a single run, kept on the local disk.
+
+    Each record is a JSON object on its own line, and is flushed to disk as
+    it is written, so a journal survives the process that writes it. Records
+    hold tags, params, metrics, references to spooled artifacts, or a local
+    MLflow file store run to import, and a final record marks the run as
+    ended. Replays journal their progress as well, so that a failed replay
+    is resumed, and does not report the run twice.
+
+    Parameters
+    ----------
+    dpath : str
+        The directory of the spooled run. Created if missing.
+    """
+
+    def __init__(self, dpath):
+        self.dpath = dpath
+        os.makedirs(self.dpath, exist_ok=True)
+        self.journal_fpath = os.path.join(self.dpath, JOURNAL_FNAME)
+        self._lock = threading.RLock()
+
+    @classmethod
+    def create(cls, experiment_name=None, run_name=None, run_id=None,
+               spool_dir=None, start_time=None):
+        """Creates the spool of a run.
+
+        Parameters
+        ----------
+        experiment_name : str, optional
+            The name of the experiment a new run belongs to.
+        run_name : str, optional
+            The name of a new run.
+        run_id : str, optional
+            The id of an existing MLflow run, to spool data of instead of
+            that of a new run.
+        spool_dir : str, optional
+            The directory to spool the run under. Defaults to spool_dpath().
+        start_time : int, optional
+            Start time of a new run, in milliseconds since the UNIX epoch.
+            Defaults to the current time.
+
+        Returns
+        -------
+        RunSpool
+            The spool of the run.
+        """
+        dname = '{}_{}_{}'.format(
+            time.strftime('%Y%m%d-%H%M%S'), os.getpid(), uuid.uuid4().hex[:8])
+        spool = cls(os.path.join(spool_dir or spool_dpath(), dname))
+        spool.append(
+            'run',
+            experiment_name=experiment_name,
+            run_name=run_name,
+            run_id=run_id,
+            start_time=(
+                int(time.time() * 1000) if start_time is None else start_time),
+        )
+        return spool
+
+    @property
+    def file_store_uri(self):
+        """The URI of a local MLflow file store, owned by this spool."""
+        return 'file://' + os.path.join(
+            os.path.abspath(self.dpath), FILE_STORE_DNAME)
+
+    def append(self, record_type, **fields):
+        """Appends a record to the journal and flushes it to disk.
+
+        Parameters
+        ----------
+        record_type : str
+            The type of the record.
+        **fields
+            The JSON-serializable fields of the record.
+        """
+        line = json.dumps({'type': record_type, **fields}) + '\n'
+        with self._lock, open(self.journal_fpath, 'a+b') as f:
+            if f.tell() > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    # a line cut short by a crash
+                    line = '\n' + line
+            f.write(line.encode('utf-8'))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def log_tags(self, tags):
+        self.append('tags', tags={k: str(v) for k, v in tags.items()})
+
+    def log_params(self, params):
+        self.append('params', params={k: str(v) for k, v in params.items()})
+
+    def log_metrics(self, metrics):
+        """Journals a list of mlflow.entities.Metric objects."""
+        self.append('metrics', metrics=[
+            [m.key, m.value, m.timestamp, m.step] for m in metrics])
+
+    def log_batch(self, tags, params, metrics):
+        """Journals lists of RunTag, Param and Metric entities."""
+        if tags:
+            self.log_tags({tag.key: tag.value for tag in tags})
+        if params:
+            self.log_params({param.key: param.value for param in params})
+        if metrics:
+            self.log_metrics(metrics)
+
+    def log_artifacts(self, dpath, artifact_path=None):
+        """Copies all files in a directory into the spool, and journals them.
+
+        Parameters
+        ----------
+        dpath : str
+            The directory to copy.
+        artifact_path : str, optional
+            The directory under the artifact root to upload the files to.
+        """
+        if not os.path.isdir(dpath):
+            return
+        with self._lock:
+            dname = 'dir_{:03d}'.format(len(self._artifact_dnames()))
+            shutil.copytree(
+                dpath, os.path.join(self.dpath, ARTIFACTS_DNAME, dname))
+            self.append(
+                'artifacts', dname=dname, artifact_path=artifact_path)
+
+    def log_files(self, fpaths, artifact_path=None):
+        """Copies the given files into the spool, and journals them.
+
+        Parameters
+        ----------
+        fpaths : list of str
+            The paths of the files to copy.
+        artifact_path : str, optional
+            The directory under the artifact root to upload the files to.
+        """
+        if not fpaths:
+            return
+        with self._lock:
+            dname = 'dir_{:03d}'.format(len(self._artifact_dnames()))
+            dpath = os.path.join(self.dpath, ARTIFACTS_DNAME, dname)
+            os.makedirs(dpath)
+            for fpath in fpaths:
+                shutil.copy2(fpath, dpath)
+            self.append(
+                'artifacts', dname=dname, artifact_path=artifact_path)
+
+    def _artifact_dnames(self):
+        try:
+            return os.listdir(os.path.join(self.dpath, ARTIFACTS_DNAME))
+        except OSError:
+            return []
+
+    def log_file_store_run(self, run_id):
+        """Journals a run of the local file store of this spool, to import."""
+        self.append('file_store_run', run_id=run_id)
+
+    def end(self, status='FINISHED', end_time=None):
+        """Marks the journal as complete, and the run as terminated.
+
+        Parameters
+        ----------
+        status : str or None, default 'FINISHED'
+            The status to terminate the run with, or None to only mark the
+            journal as complete, leaving the run as is.
+        end_time : int, optional
+            End time of the run, in milliseconds since the UNIX epoch.
+            Defaults to the current time.
+        """
+        if end_time is None:
+            end_time = int(time.time() * 1000)
+        self.append('end', status=status, end_time=end_time)
+
+    def records(self):
+        """Returns all records of the journal, in order.
+
+        Partially written lines, left by a crash, are skipped.
+        """
+        records = []
+        with open(self.journal_fpath, 'rt') as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+        return records
+
+    def is_ended(self):
+        return any(record['type'] == 'end' for record in self.records())
+
+
+_FALLBACK_SPOOLS = {}
+_FALLBACK_SPOOLS_LOCK = threading.Lock()
+
+
+def fallback_spool(run_id):
+    """Returns the spool of data that failed to reach an existing MLflow run.
+
+    A single spool is created per run and process, and is marked complete,
+    and so ready for replay, when the process exits.
+
+    Parameters
+    ----------
+    run_id : str
+        The id of the MLflow run.
+
+    Returns
+    -------
+    RunSpool
+        The fallback spool of the run.
+    """
+    with _FALLBACK_SPOOLS_LOCK:
+        spool = _FALLBACK_SPOOLS.get(run_id)
+        if spool is None:
+            spool = _FALLBACK_SPOOLS[run_id] = RunSpool.create(run_id=run_id)
+            warnings.warn(
+                ("MLflow is unreachable! Data of run {} is spooled to {}; "
+                 "run `actarius replay` to report it once MLflow is "
+                 "reachable.").format(run_id, spool.dpath),
+                stacklevel=3,
+            )
+        return spool
+
+
+@atexit.register
+def _end_fallback_spools():
+    with _FALLBACK_SPOOLS_LOCK:
+        for spool in _FALLBACK_SPOOLS.values():
+            if not spool.is_ended():
+                spool.end(status=None)
+        _FALLBACK_SPOOLS.clear()
+
+
+def _local_path(uri):
+    parsed = urlparse(uri)
+    return url2pathname(unquote(parsed.path))
+
+
+def _read_file_store_run(file_store_uri, local_run_id):
+    # reads a run of a local file store, without reaching MLflow
+    local_client = MlflowClient(tracking_uri=file_store_uri)
+    local_run = local_client.get_run(local_run_id)
+    metrics = []
+    for key in local_run.data.metrics:
+        metrics.extend(local_client.get_metric_history(local_run_id, key))
+    artifacts_dpath = _local_path(local_run.info.artifact_uri)
+    return (
+        local_run.info, local_run.data.tags, local_run.data.params, metrics,
+        list(_artifact_files(artifacts_dpath)),
+    )
+
+
+def replay_run(spool):
+    """Reports a spooled run to MLflow.
+
+    Parameters
+    ----------
+    spool : RunSpool
+        The spool of the run.
+
+    Returns
+    -------
+    str
+        The id of the MLflow run reported to.
+    """
+    records = spool.records()
+    run_record = records[0]
+    replays = [record for record in records if record['type'] == 'replay']
+    client = tracking_client()
+    run_tags = {}
+    if run_record.get('run_name') is not None:
+        run_tags[MLFLOW_RUN_NAME] = run_record['run_name']
+    run_id = run_record.get('run_id')
+    if run_id is None and replays:
+        # created by an earlier replay, which failed
+        run_id = replays[-1]['run_id']
+    if run_id is None:
+        run_id = client.create_run(
+            experiment_id=_experiment_id(
+                client, run_record['experiment_name']),
+            start_time=run_record['start_time'],
+            tags=run_tags,
+        ).info.run_id
+        spool.append('replay', run_id=run_id, logged=False)
+    # runs created elsewhere are only terminated by an explicit end record
+    status = RunStatus.to_string(RunStatus.FAILED)
+    if run_record.get('run_id') is not None:
+        status = None
+    end_time = None
+    tags, params, metrics, artifact_files = {}, {}, [], []
+    for record in records[1:]:
+        if record['type'] == 'tags':
+            tags.update(record['tags'])
+        elif record['type'] == 'params':
+            params.update(record['params'])
+        elif record['type'] == 'metrics':
+            metrics.extend(Metric(*metric) for metric in record['metrics'])
+        elif record['type'] == 'artifacts':
+            dpath = os.path.join(spool.dpath, ARTIFACTS_DNAME, record['dname'])
+            for fpath, artifact_path in _artifact_files(dpath):
+                if record['artifact_path'] is not None:
+                    artifact_path = '/'.join(
+                        [record['artifact_path']] + (
+                            [artifact_path] if artifact_path else []))
+                artifact_files.append((fpath, artifact_path))
+        elif record['type'] == 'file_store_run':
+            info, local_tags, local_params, local_metrics, local_files = (
+                _read_file_store_run(spool.file_store_uri, record['run_id']))
+            tags.update(local_tags)
+            params.update(local_params)
+            metrics.extend(local_metrics)
+            artifact_files.extend(local_files)
+            if info.end_time:
+                status, end_time = info.status, info.end_time
+        elif record['type'] == 'end':
+            status, end_time = record['status'], record['end_time']
+    if not any(replay['logged'] for replay in replays):
+        # the run name given to actarius beats any set by a file store run
+        tags.update(run_tags)
+        log_batch(
+            run_id=run_id, tags=tags, params=params, metrics=metrics,
+            spool_on_failure=False)
+        log_artifact_files(run_id, artifact_files, spool_on_failure=False)
+        spool.append('replay', run_id=run_id, logged=True)
+    if status is not None:
+        client.set_terminated(run_id, status=status, end_time=end_time)
+    return run_id
+
+
+def spooled_runs(spool_dir=None):
+    """Returns the spools of all runs spooled in the given directory.
+
+    Parameters
+    ----------
+    spool_dir : str, optional
+        The directory runs are spooled in. Defaults to spool_dpath().
+
+    Returns
+    -------
+    list of RunSpool
+        The spools of all runs, oldest first.
+    """
+    spool_dir = spool_dir or spool_dpath()
+    try:
+        dnames = sorted(os.listdir(spool_dir))
+    except OSError:
+        return []
+    return [
+        RunSpool(os.path.join(spool_dir, dname))
+        for dname in dnames
+        if os.path.isfile(os.path.join(spool_dir, dname, JOURNAL_FNAME))
+    ]
+
+
+def _read_lock(lock_fpath):
+    try:
+        with open(lock_fpath, 'rt') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _is_stale(lock_fpath, lock):
+    if lock is not None and lock.get('host') == socket.gethostname():
+        # the replay holding it runs on this host; stale only if it died
+        try:
+            os.kill(lock['pid'], 0)
+        except ProcessLookupError:
+            return True
+        except OSError:
+            pass  # alive, but of another user
+        return False
+    if lock is not None:
+        locked_at = lock['time']
+    else:
+        # crashed before writing the lock
+        try:
+            locked_at = os.path.getmtime(lock_fpath)
+        except OSError:
+            return False
+    return time.time() - locked_at > CFG[CfgKey.SPOOL_LOCK_STALE_SEC]
+
+
+def _break_stale_lock(lock_fpath):
+    lock = _read_lock(lock_fpath)
+    if not _is_stale(lock_fpath, lock):
+        return False
+    # renaming is atomic, so a lock is broken by a single replay
+    broken_fpath = '{}.{}'.format(lock_fpath, uuid.uuid4().hex[:8])
+    try:
+        os.rename(lock_fpath, broken_fpath)
+    except OSError:
+        return False
+    if _read_lock(broken_fpath) != lock:
+        # a fresh lock, taken since the stale one was read; put it back
+        try:
+            os.link(broken_fpath, lock_fpath)
+        except OSError:
+            pass
+        os.remove(broken_fpath)
+        return False
+    os.remove(broken_fpath)
+    return True
+
+
+def _claim(spool):
+    # the lock holds the host, pid and time of the replay taking it, so
+    # that the locks of dead replays can be broken
+    lock_fpath = os.path.join(spool.dpath, LOCK_FNAME)
+    for _ in range(2):
+        try:
+            fd = os.open(lock_fpath, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            if not _break_stale_lock(lock_fpath):
+                return False
+            continue
+        except OSError:
+            return False
+        with os.fdopen(fd, 'wt') as f:
+            json.dump({
+                'host': socket.gethostname(),
+                'pid': os.getpid(),
+                'time': time.time(),
+            }, f)
+        return True
+    return False
+
+
+def replay_spooled_runs(spool_dir=None, include_incomplete=False, keep=False):
+    """Reports all spooled runs to MLflow.
+
+    Each spooled run is first claimed with a lock file, so several replays
+    can safely run at once. The locks of replays that died, or that are
+    older than SPOOL_LOCK_STALE_SEC, are broken. Runs that fail to replay
+    are left in the spool, to be retried later.
+
+    Parameters
+    ----------
+    spool_dir : str, optional
+        The directory runs are spooled in. Defaults to spool_dpath().
+    include_incomplete : bool, default False
+        If True, runs whose journal was never ended, e.g. as their process
+        crashed or still runs, are replayed as well, as failed runs.
+    keep : bool, default False
+        If True, replayed runs are kept in the spool.
+
+    Returns
+    -------
+    tuple of list
+        The ids of the MLflow runs created, and the directories of the
+        spooled runs that failed to replay.
+    """
+    run_ids, failed = [], []
+    for spool in spooled_runs(spool_dir):
+        if not include_incomplete and not spool.is_ended():
+            continue
+        if not _claim(spool):
+            continue  # claimed by another replay
+        keep_spool = keep
+        try:
+            run_ids.append(replay_run(spool))
+        except Exception as e:
+            warnings.warn(
+                "Failed to replay the run spooled in {}: {!r}".format(
+                    spool.dpath, e),
+                stacklevel=2,
+            )
+            failed.append(spool.dpath)
+            keep_spool = True
+        if keep_spool:
+            os.remove(os.path.join(spool.dpath, LOCK_FNAME))
+        else:
+            shutil.rmtree(spool.dpath, ignore_errors=True)
+    return run_ids, failed
@@ -0,0 +1,280 @@
+"""Bulk logging of many completed runs, e.g. of hyperparameter sweeps."""
+
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+from mlflow.entities import Metric, RunStatus
+from mlflow.tracking.context.registry import resolve_tags
+from mlflow.utils.mlflow_tags import MLFLOW_PARENT_RUN_ID, MLFLOW_RUN_NAME
+
+from . import transport
+from .cfg import (
+    CFG,
+    CfgKey,
+)
+from .shared import (
+    _artifact_files,
+    _experiment_id,
+    _now_ms,
+    _spool_fallback,
+    init_tracking,
+    log_artifact_files,
+    log_batch,
+    shared_tags,
+    tracking_client,
+)
+from .spool import (
+    RunSpool,
+    spool_dpath,
+)
+
+
+def _spoolable(error):
+    # MLflow being unreachable, with spooling enabled
+    return CFG[CfgKey.SPOOL_WHEN_OFFLINE] and (
+        isinstance(error, transport.CircuitOpenError)
+        or transport.is_transient(error))
+
+
+class _Trial(object):
+
+    __slots__ = (
+        'params', 'metrics', 'tags', 'run_name', 'artifacts', 'status',
+        'start_time', 'end_time', 'run',
+    )
+
+    def __init__(self, params, metrics, tags, run_name, artifacts, status,
+                 start_time, end_time):
+        self.params = params
+        self.metrics = metrics
+        self.tags = tags
+        self.run_name = run_name
+        self.artifacts = artifacts
+        self.status = status
+        self.start_time = start_time
+        self.end_time = end_time
+        # the MLflow run created for the trial, by an earlier failed log()
+        self.run = None
+
+    def artifact_files(self):
+        if self.artifacts is None:
+            return []
+        if isinstance(self.artifacts, str):
+            return list(_artifact_files(self.artifacts))
+        return [(fpath, None) for fpath in self.artifacts]
+
+
+class RunBatch(object):
+    """Logs many completed runs of an experiment at once.
+
+    The experiment is resolved, and the shared and context tags of the
+    process are collected, once for the whole batch. Each run then takes
+    three requests, or four with artifacts: its creation, with all its tags,
+    a single batch of its params and metrics, which is split only where the
+    server limits require it, and its termination. Up to SWEEP_WORKERS runs
+    are logged concurrently.
+
+    Parameters
+    ----------
+    experiment_name : str
+        Name of the experiment to log all runs to. In case of a databricks
+        experiment, this is the full path to the databricks experiment.
+    parent_run_id : str, optional
+        If given, all runs are nested under the run with this id, e.g. the
+        run of the sweep itself.
+
+    Example
+    -------
+    >>> batch = RunBatch('my_sweep')  # doctest: +SKIP
+    >>> for alpha, auc in results:  # doctest: +SKIP
+    ...     batch.add(params={'alpha': alpha}, metrics={'auc': auc})
+    >>> run_ids = batch.log()  # doctest: +SKIP
+    """
+
+    def __init__(self, experiment_name, parent_run_id=None):
+        self.experiment_name = experiment_name
+        self.parent_run_id = parent_run_id
+        self.trials = []
+
+    def add(self, params=None, metrics=None, tags=None, run_name=None,
+            artifacts=None, status='FINISHED', start_time=None,
+            end_time=None):
+        """Adds a completed run to the batch.
+
+        Parameters
+        ----------
+        params : dict, optional
+            Dictionary of param_name: String -> value: (String, but will be
+            string-ified if not).
+        metrics : dict or list of mlflow.entities.Metric, optional
+            Dictionary of metric_name: String -> value: Float, or a list of
+            Metric entities, to log full metric histories.
+        tags : dict, optional
+            Dictionary of tag_name: String -> value: (String, but will be
+            string-ified if not).
+        run_name : str, optional
+            The name of the run.
+        artifacts : str or list of str, optional
+            The path of a directory whose files are uploaded as artifacts of
+            the run, keeping their relative paths, or a list of paths of
+            files to upload into the artifact root of the run.
+        status : str, default 'FINISHED'
+            The status to terminate the run with, e.g. 'FAILED'.
+        start_time : int, optional
+            Start time of the run, in milliseconds since the UNIX epoch.
+            Defaults to the time of this call.
+        end_time : int, optional
+            End time of the run, in milliseconds since the UNIX epoch.
+            Defaults to the time of this call.
+
+        Returns
+        -------
+        int
+            The index of the run in the batch.
+        """
+        RunStatus.from_string(status)  # raises on unknown statuses
+        now = _now_ms()
+        if end_time is None:
+            end_time = now
+        metrics = metrics or []
+        if isinstance(metrics, dict):
+            metrics = [
+                Metric(key, float(val), end_time, 0)
+                for key, val in metrics.items()
+            ]
+        self.trials.append(_Trial(
+            params=params or {},
+            metrics=metrics,
+            tags=tags or {},
+            run_name=run_name,
+            artifacts=artifacts,
+            status=status,
+            start_time=now if start_time is None else start_time,
+            end_time=end_time,
+        ))
+        return len(self.trials) - 1
+
+    def __len__(self):
+        return len(self.trials)
+
+    def log(self, max_workers=None):
+        """Logs all runs in the batch to MLflow, and empties it.
+
+        Runs that could not be created, as MLflow is unreachable, are
+        spooled instead, if SPOOL_WHEN_OFFLINE is set, to be reported by
+        `actarius replay`. Runs that failed to be logged otherwise are kept
+        in the batch, and the first of their errors is raised, so that they
+        can be logged by calling log() again.
+
+        Parameters
+        ----------
+        max_workers : int, optional
+            The maximum number of runs to log concurrently. Defaults to the
+            SWEEP_WORKERS configuration value.
+
+        Returns
+        -------
+        list of str
+            The ids of the MLflow runs created, in the order they were added,
+            with None for runs that were spooled.
+        """
+        trials = list(self.trials)
+        if not trials:
+            return []
+        init_tracking()
+        client = tracking_client()
+        base_tags = {**shared_tags(), **resolve_tags()}
+        if self.parent_run_id is not None:
+            base_tags[MLFLOW_PARENT_RUN_ID] = self.parent_run_id
+        try:
+            experiment_id = _experiment_id(client, self.experiment_name)
+        except Exception as e:
+            if not _spoolable(e):
+                raise
+            experiment_id = None
+        if max_workers is None:
+            max_workers = CFG[CfgKey.SWEEP_WORKERS]
+        n_workers = min(max_workers, len(trials))
+
+        def log_trial(trial):
+            try:
+                return self._log_trial(
+                    client, experiment_id, base_tags, trial), None
+            except Exception as e:
+                return None, e
+
+        if n_workers <= 1:
+            results = [log_trial(trial) for trial in trials]
+        else:
+            with ThreadPoolExecutor(
+                max_workers=n_workers,
+                thread_name_prefix='actarius-sweep',
+            ) as executor:
+                results = list(executor.map(log_trial, trials))
+        logged = {
+            id(trial)
+            for trial, (_, error) in zip(trials, results)
+            if error is None
+        }
+        self.trials = [
+            trial for trial in self.trials if id(trial) not in logged]
+        run_ids = [run_id for run_id, _ in results]
+        n_spooled = sum(
+            run_id is None and error is None for run_id, error in results)
+        if n_spooled:
+            warnings.warn(
+                ("MLflow is unreachable! {} of {} runs were spooled to {}; "
+                 "run `actarius replay` to report them once MLflow is "
+                 "reachable.").format(n_spooled, len(trials), spool_dpath()),
+                stacklevel=2,
+            )
+        errors = [error for _, error in results if error is not None]
+        if errors:
+            raise errors[0]
+        return run_ids
+
+    def _log_trial(self, client, experiment_id, base_tags, trial):
+        tags = {**base_tags, **trial.tags}
+        if trial.run_name is not None:
+            tags[MLFLOW_RUN_NAME] = trial.run_name
+        if trial.run is None and experiment_id is not None:
+            try:
+                # a retried creation could leave a duplicate run behind
+                trial.run = transport.call(
+                    client.create_run,
+                    idempotent=False,
+                    experiment_id=experiment_id,
+                    start_time=trial.start_time,
+                    tags={key: str(val) for key, val in tags.items()},
+                )
+            except Exception as e:
+                if not _spoolable(e):
+                    raise
+        if trial.run is None:
+            self._spool_trial(tags, trial)
+            return None
+        run_id = trial.run.info.run_id
+        log_batch(run_id=run_id, params=trial.params, metrics=trial.metrics)
+        log_artifact_files(
+            run_id, trial.artifact_files(),
+            artifact_uri=trial.run.info.artifact_uri)
+        transport.call(
+            client.set_terminated, run_id,
+            status=trial.status, end_time=trial.end_time,
+            fallback=_spool_fallback(
+                run_id, 'end', trial.status, trial.end_time),
+        )
+        return run_id
+
+    def _spool_trial(self, tags, trial):
+        spool = RunSpool.create(
+            experiment_name=self.experiment_name,
+            run_name=trial.run_name,
+            start_time=trial.start_time,
+        )
+        spool.log_tags(tags)
+        spool.log_params(trial.params)
+        spool.log_metrics(trial.metrics)
+        for fpath, artifact_path in trial.artifact_files():
+            spool.log_files([fpath], artifact_path)
+        spool.end(status=trial.status, end_time=trial.end_time)
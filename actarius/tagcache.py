@@ -0,0 +1,121 @@
+"""An on-disk cache of run tags, shared by all processes on a host."""
+
+import os
+import json
+import time
+import hashlib
+import tempfile
+
+
+class TagCache(object):
+    """Caches dicts of tags as JSON files in a directory, with a TTL.
+
+    Entries are written atomically, so any number of processes can share a
+    cache directory, and the first process to collect a set of tags saves
+    all others the trouble.
+
+    Parameters
+    ----------
+    dpath : str
+        The directory to keep cache entries in. Created on first write.
+    ttl_sec : float
+        Entries older than this many seconds are ignored, and evicted on the
+        next write. A non-positive value disables the cache.
+    """
+
+    SUFFIX = '.json'
+
+    def __init__(self, dpath, ttl_sec):
+        self.dpath = dpath
+        self.ttl_sec = ttl_sec
+
+    @property
+    def enabled(self):
+        return self.ttl_sec > 0
+
+    def _fpath(self, key):
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.dpath, digest + self.SUFFIX)
+
+    def _expired(self, fpath, now):
+        try:
+            return now - os.stat(fpath).st_mtime >= self.ttl_sec
+        except OSError:
+            return True
+
+    def get(self, key):
+        """Returns the tags cached under the given key.
+
+        Parameters
+        ----------
+        key : str
+            The cache key.
+
+        Returns
+        -------
+        dict or None
+            The cached tags, or None if none are cached under the given key,
+            or if they expired.
+        """
+        if not self.enabled:
+            return None
+        fpath = self._fpath(key)
+        if self._expired(fpath, time.time()):
+            return None
+        try:
+            with open(fpath, 'rt') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # guard against hash collisions
+        if entry.get('key') != key:
+            return None
+        return entry['tags']
+
+    def put(self, key, tags):
+        """Caches tags under the given key, evicting expired entries.
+
+        Parameters
+        ----------
+        key : str
+            The cache key.
+        tags : dict
+            The tags to cache. Values must be JSON-serializable.
+        """
+        if not self.enabled:
+            return
+        try:
+            os.makedirs(self.dpath, exist_ok=True)
+            fd, temp_fpath = tempfile.mkstemp(
+                dir=self.dpath, suffix='.tmp')
+            with os.fdopen(fd, 'wt') as f:
+                json.dump({'key': key, 'tags': tags}, f)
+            os.replace(temp_fpath, self._fpath(key))
+        except OSError:
+            # caching is an optimization; failing to cache is not an error
+            return
+        self.evict()
+
+    def remove(self, key):
+        """Removes the entry cached under the given key, if any."""
+        try:
+            os.remove(self._fpath(key))
+        except OSError:
+            pass
+
+    def evict(self):
+        """Removes all expired entries from the cache directory."""
+        now = time.time()
+        try:
+            fnames = os.listdir(self.dpath)
+        except OSError:
+            return
+        for fname in fnames:
+            if not fname.endswith((self.SUFFIX, '.tmp')):
+                continue
+            fpath = os.path.join(self.dpath, fname)
+            if self._expired(fpath, now):
+                try:
+                    os.remove(fpath)
+                except OSError:
+                    pass
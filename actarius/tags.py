@@ -0,0 +1,286 @@
+"""Pluggable collection of the environment tags shared by all runs."""
+
+import os
+import json
+import time
+import warnings
+import threading
+from concurrent.futures import Future, TimeoutError
+from functools import lru_cache
+
+from .cfg import (
+    CFG,
+    CfgKey,
+    TEMP_DIR,
+)
+from .gitinfo import (
+    git_cache_key,
+    git_snapshot,
+)
+from .tagcache import TagCache
+
+
+class CachePolicy(object):
+    """How long the tags returned by a collector may be reused for.
+
+    NONE tags are collected anew for every run, PROCESS tags once per
+    process, and HOST tags once per host, by caching them on disk for
+    TAGS_CACHE_TTL_SEC seconds.
+    """
+    NONE = 'none'
+    PROCESS = 'process'
+    HOST = 'host'
+
+
+class TagCollector(object):
+    """Collects a group of tags to set on every run.
+
+    Parameters
+    ----------
+    name : str
+        A unique name for the collector.
+    collect : callable
+        Called with no arguments, it returns a dict of tag names to values.
+    timeout_sec : float, optional
+        The tags of the collector are skipped if it does not return within
+        this many seconds. Defaults to the TAG_COLLECTOR_TIMEOUT_SEC
+        configuration value.
+    cache_policy : str, default CachePolicy.PROCESS
+        One of the values of CachePolicy.
+    cache_key : callable, optional
+        Called with no arguments, it returns a JSON-serializable value
+        identifying the state the tags are collected from; cached tags are
+        only reused while it does not change. It must be quick to compute.
+    """
+
+    def __init__(
+            self, name, collect, timeout_sec=None,
+            cache_policy=CachePolicy.PROCESS, cache_key=None,
+    ):
+        if cache_policy not in (
+                CachePolicy.NONE, CachePolicy.PROCESS, CachePolicy.HOST):
+            raise ValueError(
+                "Unknown cache policy {!r}.".format(cache_policy))
+        self.name = name
+        self.collect = collect
+        self.timeout_sec = timeout_sec
+        self.cache_policy = cache_policy
+        self.cache_key = cache_key
+
+    def key(self):
+        """Returns the key the tags of this collector are cached under."""
+        if self.cache_key is None:
+            return json.dumps([self.name])
+        return json.dumps([self.name, self.cache_key()])
+
+
+_COLLECTORS = {}
+_COLLECTORS_LOCK = threading.Lock()
+_PROCESS_CACHE = {}
+
+
+def register_tag_collector(
+        name, collect, timeout_sec=None, cache_policy=CachePolicy.PROCESS,
+        cache_key=None,
+):
+    """Registers a collector of tags to set on every run.
+
+    Registering a collector under the name of an existing one replaces it.
+    See TagCollector for a description of all parameters.
+
+    Returns
+    -------
+    TagCollector
+        The registered collector.
+    """
+    collector = TagCollector(
+        name=name,
+        collect=collect,
+        timeout_sec=timeout_sec,
+        cache_policy=cache_policy,
+        cache_key=cache_key,
+    )
+    with _COLLECTORS_LOCK:
+        _COLLECTORS[name] = collector
+    return collector
+
+
+def unregister_tag_collector(name):
+    """Unregisters the tag collector with the given name, if there is one.
+
+    Parameters
+    ----------
+    name : str
+        The name of the collector.
+    """
+    with _COLLECTORS_LOCK:
+        _COLLECTORS.pop(name, None)
+
+
+def tag_collectors():
+    """Returns a list of all registered tag collectors, in order."""
+    with _COLLECTORS_LOCK:
+        return list(_COLLECTORS.values())
+
+
+@lru_cache(maxsize=1)
+def host_tag_cache():
+    """Returns the on-disk cache of tags shared by all processes on a host."""
+    return TagCache(
+        dpath=os.path.join(TEMP_DIR, 'shared_tags'),
+        ttl_sec=CFG[CfgKey.TAGS_CACHE_TTL_SEC],
+    )
+
+
+def _cached_tags(collector, key):
+    if collector.cache_policy == CachePolicy.NONE:
+        return None
+    tags = _PROCESS_CACHE.get(key)
+    if tags is None and collector.cache_policy == CachePolicy.HOST:
+        tags = host_tag_cache().get(key)
+        if tags is not None:
+            _PROCESS_CACHE[key] = tags
+    return tags
+
+
+def _cache_tags(collector, key, tags):
+    if collector.cache_policy == CachePolicy.NONE:
+        return
+    _PROCESS_CACHE[key] = tags
+    if collector.cache_policy == CachePolicy.HOST:
+        host_tag_cache().put(key, tags)
+
+
+def _start_daemon_thread(fn):
+    # daemon threads, so a hanging collector can never block the exit of
+    # the interpreter, as it would in a ThreadPoolExecutor
+    future = Future()
+
+    def _run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(fn())
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(
+        target=_run, name='actarius-tag-collector', daemon=True).start()
+    return future
+
+
+def collect_tags(collectors=None):
+    """Collects tags from the given collectors, concurrently.
+
+    Cached tags are used where the cache policy of a collector allows it.
+    All other collectors run concurrently, each on its own daemon thread. The
+    tags of a collector that fails, or does not return before its deadline,
+    are skipped with a warning; it is then abandoned, and left to finish in
+    the background.
+
+    Parameters
+    ----------
+    collectors : list of TagCollector, optional
+        The collectors to collect tags from. Defaults to all registered
+        collectors.
+
+    Returns
+    -------
+    dict
+        The tags of all collectors, merged in order.
+    """
+    if collectors is None:
+        collectors = tag_collectors()
+    default_timeout_sec = CFG[CfgKey.TAG_COLLECTOR_TIMEOUT_SEC]
+    results = []
+    for collector in collectors:
+        key = collector.key()
+        tags = _cached_tags(collector, key)
+        future = None
+        if tags is None:
+            future = _start_daemon_thread(collector.collect)
+        results.append((collector, key, tags, future))
+    start = time.monotonic()
+    merged = {}
+    for collector, key, tags, future in results:
+        if future is not None:
+            timeout_sec = collector.timeout_sec
+            if timeout_sec is None:
+                timeout_sec = default_timeout_sec
+            try:
+                tags = future.result(
+                    timeout=max(0, start + timeout_sec - time.monotonic()))
+            except TimeoutError:
+                warnings.warn(
+                    "Tag collector {} timed out after {} seconds; its tags "
+                    "were skipped.".format(collector.name, timeout_sec),
+                    stacklevel=2,
+                )
+                continue
+            except Exception as e:
+                warnings.warn(
+                    "Tag collector {} failed with {!r}; its tags were "
+                    "skipped.".format(collector.name, e),
+                    stacklevel=2,
+                )
+                continue
+            _cache_tags(collector, key, tags)
+        merged.update(tags)
+    return merged
+
+
+def shared_tags():
+    """Returns a dict of all the tags shared by all runs."""
+    return collect_tags()
+
+
+# === built-in collectors ===
+
+SAGEMAKER_METADATA_FPATH = '/opt/ml/metadata/resource-metadata.json'
+
+
+def _mtime_ns(fpath):
+    try:
+        return os.stat(fpath).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _git_tags():
+    return git_snapshot().as_tags()
+
+
+def _git_tags_cache_key():
+    cwd = os.getcwd()
+    return [cwd, git_cache_key(cwd)]
+
+
+def sagemaker_instance_name():
+    try:
+        with open(SAGEMAKER_METADATA_FPATH, 'r') as logs:
+            _logs = json.load(logs)
+        return _logs['ResourceName']
+    except FileNotFoundError:
+        return "NotFromSageMaker"
+
+
+def _sagemaker_tags():
+    return {'sagemaker_instance_name': sagemaker_instance_name()}
+
+
+def _sagemaker_tags_cache_key():
+    return _mtime_ns(SAGEMAKER_METADATA_FPATH)
+
+
+register_tag_collector(
+    name='git',
+    collect=_git_tags,
+    cache_policy=CachePolicy.HOST,
+    cache_key=_git_tags_cache_key,
+)
+register_tag_collector(
+    name='sagemaker',
+    collect=_sagemaker_tags,
+    cache_policy=CachePolicy.HOST,
+    cache_key=_sagemaker_tags_cache_key,
+)
@@ -0,0 +1,166 @@
+"""Resource usage telemetry of experiment runs."""
+
+import os
+import sys
+import time
+import threading
+
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    resource = None  # not available on Windows
+
+
+METRIC_PREFIX = 'resource/'
+_MB = 1024 * 1024
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def _read_proc_file(fname):
+    try:
+        with open(os.path.join('/proc/self', fname), 'rb') as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _rusage():
+    if resource is None:  # pragma: no cover
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF)
+
+
+def _peak_rss_bytes(rusage):
+    if rusage is None:  # pragma: no cover
+        return 0
+    # ru_maxrss is in kilobytes on Linux, but in bytes on macOS
+    if sys.platform == 'darwin':  # pragma: no cover
+        return rusage.ru_maxrss
+    return rusage.ru_maxrss * 1024
+
+
+def _rss_bytes_and_n_threads():
+    stat = _read_proc_file('stat')
+    if stat is None:  # pragma: no cover
+        return _peak_rss_bytes(_rusage()), threading.active_count()
+    # the executable name, in parentheses, can contain spaces
+    fields = stat[stat.rindex(b')') + 2:].split()
+    # num_threads and rss are fields 20 and 24 of proc(5), 1-based
+    return int(fields[21]) * _PAGE_SIZE, int(fields[17])
+
+
+def _io_bytes():
+    content = _read_proc_file('io')
+    if content is not None:
+        io_fields = dict(
+            line.split(b': ') for line in content.splitlines() if line)
+        return int(io_fields[b'read_bytes']), int(io_fields[b'write_bytes'])
+    rusage = _rusage()
+    if rusage is None:
+        return 0, 0
+    # block operations, of 512 bytes each
+    return rusage.ru_inblock * 512, rusage.ru_oublock * 512
+
+
+def _cpu_sec():
+    times = os.times()
+    return times.user + times.system
+
+
+class ResourceSampler(object):
+    """Samples the resource usage of the current process on a daemon thread.
+
+    Every interval_sec seconds, the CPU utilization, resident memory, bytes
+    read and written since the sampler started, and number of threads of the
+    process are logged as step metrics. Usage is read from /proc on Linux,
+    and from getrusage elsewhere, so a sample takes tens of microseconds.
+
+    Parameters
+    ----------
+    log_fn : callable
+        Called with a dict of metric names to values and a step keyword
+        argument, e.g. MetricBuffer.log_dict.
+    interval_sec : float
+        The time between consecutive samples, in seconds.
+    """
+
+    def __init__(self, log_fn, interval_sec):
+        self.log_fn = log_fn
+        self.interval_sec = interval_sec
+        self.n_samples = 0
+        self.sampling_sec = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Starts sampling."""
+        self._start_wall = self._last_wall = time.monotonic()
+        self._start_cpu = self._last_cpu = _cpu_sec()
+        self._start_io = _io_bytes()
+        self._start_rusage = _rusage()
+        self._thread = threading.Thread(
+            target=self._sample_periodically,
+            name='actarius-resource-sampler',
+            daemon=True,
+        )
+        self._thread.start()
+
+    def _sample_periodically(self):
+        while not self._stop.wait(self.interval_sec):
+            step = self.n_samples
+            self.log_fn(self.sample(), step=step)
+
+    def sample(self):
+        """Returns the current resource usage as a dict of metrics."""
+        start = time.perf_counter()
+        wall, cpu = time.monotonic(), _cpu_sec()
+        rss_bytes, n_threads = _rss_bytes_and_n_threads()
+        read_bytes, write_bytes = _io_bytes()
+        elapsed = wall - self._last_wall
+        cpu_percent = 0.0
+        if elapsed > 0:
+            cpu_percent = 100 * (cpu - self._last_cpu) / elapsed
+        self._last_wall, self._last_cpu = wall, cpu
+        self.n_samples += 1
+        self.sampling_sec += time.perf_counter() - start
+        return {
+            METRIC_PREFIX + 'cpu_percent': cpu_percent,
+            METRIC_PREFIX + 'rss_mb': rss_bytes / _MB,
+            METRIC_PREFIX + 'read_mb': (read_bytes - self._start_io[0]) / _MB,
+            METRIC_PREFIX + 'write_mb': (
+                write_bytes - self._start_io[1]) / _MB,
+            METRIC_PREFIX + 'n_threads': n_threads,
+        }
+
+    def stop(self):
+        """Stops sampling and returns summary metrics of the sampled period.
+
+        Returns
+        -------
+        dict
+            Peak resident memory, total CPU seconds, bytes read and written,
+            context switches and the share of time spent sampling.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        wall_sec = time.monotonic() - self._start_wall
+        read_bytes, write_bytes = _io_bytes()
+        rusage = _rusage()
+        summary = {
+            METRIC_PREFIX + 'peak_rss_mb': _peak_rss_bytes(rusage) / _MB,
+            METRIC_PREFIX + 'cpu_sec': _cpu_sec() - self._start_cpu,
+            METRIC_PREFIX + 'total_read_mb': (
+                read_bytes - self._start_io[0]) / _MB,
+            METRIC_PREFIX + 'total_write_mb': (
+                write_bytes - self._start_io[1]) / _MB,
+        }
+        if rusage is not None:
+            summary[METRIC_PREFIX + 'ctx_switches'] = (
+                rusage.ru_nvcsw + rusage.ru_nivcsw
+                - self._start_rusage.ru_nvcsw - self._start_rusage.ru_nivcsw
+            )
+        if wall_sec > 0:
+            summary[METRIC_PREFIX + 'sampling_overhead_percent'] = (
+                100 * self.sampling_sec / wall_sec)
+        return summary
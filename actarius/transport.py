@@ -0,0 +1,227 @@
+"""Resilient transport of tracking and artifact calls to MLflow.
+
+All calls to the tracking server go through call(), which retries failures
+that are likely transient with jittered exponential backoff, and goes
+through a process-wide circuit breaker. Once the breaker opens, calls are
+routed to their local fallback, usually the offline spool, without reaching
+the server at all, until a single probe call shows the server recovered.
+"""
+
+import time
+import random
+import socket
+import threading
+from functools import lru_cache
+
+import requests
+
+from .cfg import (
+    CFG,
+    CfgKey,
+)
+
+
+# MLflow error codes of server overload; INTERNAL_ERROR is left out, as it is
+# the default code of every MlflowException, including configuration errors
+# and other local failures. 5xx responses are retried by the HTTP sessions
+# of MLflow themselves, as set up by actarius.session.
+TRANSIENT_ERROR_CODES = frozenset([
+    'TEMPORARILY_UNAVAILABLE',
+    'REQUEST_LIMIT_EXCEEDED',
+    'RESOURCE_EXHAUSTED',
+    'DEADLINE_EXCEEDED',
+])
+
+# network errors, as opposed to other OS errors, like a full disk
+NETWORK_ERRORS = (
+    ConnectionError,
+    TimeoutError,
+    socket.timeout,
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+)
+
+
+class CircuitOpenError(Exception):
+    """Raised for calls made while the tracking server is considered down."""
+
+
+def is_transient(error):
+    """Returns True if the given error is likely to go away on a retry.
+
+    Parameters
+    ----------
+    error : Exception
+        An error raised by a tracking or artifact call.
+
+    Returns
+    -------
+    bool
+        True for network errors, including those of requests, and for MLflow
+        errors of server overload or unavailability.
+    """
+    if isinstance(error, NETWORK_ERRORS):
+        return True
+    return getattr(error, 'error_code', None) in TRANSIENT_ERROR_CODES
+
+
+class CircuitBreaker(object):
+    """A thread-safe circuit breaker.
+
+    The breaker opens after failure_threshold consecutive failures. While it
+    is open, no call is allowed. Once reset_timeout_sec seconds pass, a
+    single probe call is allowed: it closes the breaker if it succeeds, and
+    opens it again if it fails.
+
+    Parameters
+    ----------
+    failure_threshold : int
+        The number of consecutive failures that opens the breaker.
+    reset_timeout_sec : float
+        The time, in seconds, to wait before probing an open breaker.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold, reset_timeout_sec):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_sec = reset_timeout_sec
+        self.state = self.CLOSED
+        self.n_failures = 0
+        self.n_opened = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Returns True if a call may be made now."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                open_sec = time.monotonic() - self._opened_at
+                if open_sec < self.reset_timeout_sec:
+                    return False
+                self.state = self.HALF_OPEN
+                self._probing = False
+            if self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.n_failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.n_failures += 1
+            if (self.state == self.HALF_OPEN
+                    or self.n_failures >= self.failure_threshold):
+                if self.state != self.OPEN:
+                    self.n_opened += 1
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+
+@lru_cache(maxsize=1)
+def circuit_breaker():
+    """Returns the circuit breaker shared by all tracking calls."""
+    return CircuitBreaker(
+        failure_threshold=CFG[CfgKey.BREAKER_FAILURE_THRESHOLD],
+        reset_timeout_sec=CFG[CfgKey.BREAKER_RESET_SEC],
+    )
+
+
+def backoff_sec(attempt):
+    """Returns the time to wait before the given retry attempt.
+
+    Uses full jitter, drawing uniformly from zero up to an exponentially
+    growing cap, so that the retries of many concurrent runs spread out
+    instead of hitting the server in synchronized waves.
+
+    Parameters
+    ----------
+    attempt : int
+        The number of attempts made so far, starting at 1.
+
+    Returns
+    -------
+    float
+        The time to wait, in seconds.
+    """
+    cap = min(
+        CFG[CfgKey.RETRY_BACKOFF_MAX_SEC],
+        CFG[CfgKey.RETRY_BACKOFF_BASE_SEC] * 2 ** (attempt - 1),
+    )
+    return random.uniform(0, cap)
+
+
+def call(fn, *args, idempotent=True, max_attempts=None, fallback=None,
+         **kwargs):
+    """Calls a tracking or artifact function, retrying transient failures.
+
+    Parameters
+    ----------
+    fn : callable
+        The function to call.
+    *args
+        Positional arguments to call fn with.
+    idempotent : bool, default True
+        Only idempotent calls are retried, as a call that failed on the
+        client side might still have succeeded on the server.
+    max_attempts : int, optional
+        The maximum number of attempts to make. Defaults to the
+        RETRY_MAX_ATTEMPTS configuration value.
+    fallback : callable, optional
+        Called with no arguments, and its result returned, if the circuit
+        breaker is open or all attempts failed.
+    **kwargs
+        Keyword arguments to call fn with.
+
+    Returns
+    -------
+    object
+        The result of fn, or of fallback.
+
+    Raises
+    ------
+    CircuitOpenError
+        If the circuit breaker is open and no fallback was given.
+    """
+    breaker = circuit_breaker()
+    if max_attempts is None:
+        max_attempts = CFG[CfgKey.RETRY_MAX_ATTEMPTS]
+    if not idempotent:
+        max_attempts = 1
+    attempt = 0
+    while True:
+        if not breaker.allow():
+            if fallback is not None:
+                return fallback()
+            raise CircuitOpenError(
+                "The MLflow tracking server failed {} times in a row; calls "
+                "to it are suspended for {} seconds.".format(
+                    breaker.n_failures, breaker.reset_timeout_sec))
+        try:
+            res = fn(*args, **kwargs)
+        except Exception as e:
+            if not is_transient(e):
+                # the server answered, or the call failed locally
+                breaker.record_success()
+                raise
+            breaker.record_failure()
+            attempt += 1
+            if attempt >= max_attempts:
+                if fallback is not None:
+                    return fallback()
+                raise
+            time.sleep(backoff_sec(attempt))
+            continue
+        breaker.record_success()
+        return res
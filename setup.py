@@ -9,8 +9,8 @@ import versioneer
 
 INSTALL_REQUIRES = [
     'mlflow>=1.8.0',
-    'gitpython',
     'birch>=0.0.31',
+    'requests',
 ]
 TEST_REQUIRES = [
     'pandas', 'databricks-cli',
@@ -35,13 +35,18 @@ setuptools.setup(
     url='https://github.com/shaypal5/actarius',
     packages=setuptools.find_packages(),
     include_package_data=True,
-    python_requires=">=3.6",
+    python_requires=">=3.7",
     install_requires=[
         INSTALL_REQUIRES
     ],
     extras_require={
         'test': TEST_REQUIRES + INSTALL_REQUIRES,
     },
+    entry_points={
+        'console_scripts': [
+            'actarius=actarius.cli:main',
+        ],
+    },
     platforms=['linux', 'osx', 'windows'],
     keywords=['ml', 'mlflow', 'experiments'],
     classifiers=[
@@ -51,8 +56,6 @@ setuptools.setup(
         'License :: OSI Approved :: MIT License',
         'Programming Language :: Python',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.5',
-        'Programming Language :: Python :: 3.6',
         'Programming Language :: Python :: 3.7',
         'Programming Language :: Python :: 3.8',
         'Topic :: Software Development :: Libraries',
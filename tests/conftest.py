@@ -2,8 +2,11 @@
 
 import os
 
+import mlflow
 import pytest
 
+from actarius import cfg, shared, spool, tags, transport
+
 try:
     from.temp_env_var import TEMP_ENV_VARS, ENV_VARS_TO_SUSPEND
 except ImportError:
@@ -23,3 +26,66 @@ def tests_setup_and_teardown():
     # Will be executed after the last test
     os.environ.clear()
     os.environ.update(old_environ)
+
+
+def _reset_process_state():
+    transport.circuit_breaker.cache_clear()
+    with shared._EXPERIMENT_IDS_LOCK:
+        shared._EXPERIMENT_IDS.clear()
+        shared._EXPERIMENT_ID_LOCKS.clear()
+    tags._PROCESS_CACHE.clear()
+    with spool._FALLBACK_SPOOLS_LOCK:
+        spool._FALLBACK_SPOOLS.clear()
+
+
+@pytest.fixture(autouse=True)
+def reset_process_state():
+    # process-wide state of actarius, which would otherwise leak from one
+    # test into the next, e.g. a circuit breaker opened by a failing test
+    _reset_process_state()
+    yield
+    _reset_process_state()
+
+
+def _clear_host_caches():
+    shared.host_experiment_cache.cache_clear()
+    tags.host_tag_cache.cache_clear()
+
+
+@pytest.fixture(autouse=True)
+def cache_dpath(tmp_path, monkeypatch):
+    # keeps the cache of actarius, and the runs it spools, out of the home
+    # directory of the user running the tests
+    dpath = str(tmp_path / 'actarius_cache')
+    for module in (cfg, shared, tags):
+        monkeypatch.setattr(module, 'TEMP_DIR', dpath)
+    monkeypatch.setattr(shared, 'CACHE_DPATH', dpath)
+    monkeypatch.setattr(spool, 'SPOOL_DPATH', os.path.join(dpath, 'spool'))
+    _clear_host_caches()
+    yield dpath
+    _clear_host_caches()
+
+
+@pytest.fixture(autouse=True)
+def run_in_tmp_path(tmp_path, monkeypatch):
+    # runs write their artifacts to mlflow_artifacts_* directories under the
+    # working directory, which must not be the root of the repository
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def file_store(tmp_path, monkeypatch):
+    """Points MLflow at a local file store, so runs are reported to MLflow.
+
+    Without it, tests run against the default, unconfigured tracking URI,
+    and their runs are spooled instead.
+    """
+    uri = (tmp_path / 'mlruns').as_uri()
+    previous_uri = None
+    if shared._is_tracking_uri_set():
+        previous_uri = mlflow.get_tracking_uri()
+    monkeypatch.setenv('MLFLOW_TRACKING_URI', uri)
+    mlflow.set_tracking_uri(uri)
+    yield uri
+    mlflow.set_tracking_uri(previous_uri)
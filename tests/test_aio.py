@@ -0,0 +1,58 @@
+"""Testing the asyncio-native runs of the actarius package."""
+
+import asyncio
+
+from actarius import AsyncExperimentRun, AsyncExperimentRunContext
+from actarius.spans import SpanRecorder
+
+
+TEST_EXP_PATH = "/Shared/Tests/actarius_test_basic"
+
+
+async def _evaluate(run, i):
+    await run.set_tag('test', 'aio')
+    await run.log_param('i', i)
+    for step in range(5):
+        await run.log_metric('loss', 1 / (step + 1), step=step)
+        await asyncio.sleep(0)
+    await run.log_obj_as_text([1, 3, 5], 'int_list.txt')
+
+
+def test_async_runs(file_store):
+    async def main():
+        runs = [AsyncExperimentRun(TEST_EXP_PATH) for _ in range(4)]
+        await asyncio.gather(*[
+            _evaluate(run, i) for i, run in enumerate(runs)])
+        await asyncio.gather(*[run.end_run() for run in runs])
+        return runs
+
+    runs = asyncio.run(main())
+    assert not any(run.running for run in runs)
+    assert len({run.run_id for run in runs}) == 4
+
+
+def test_async_run_context(file_store):
+    async def main():
+        async with AsyncExperimentRunContext(TEST_EXP_PATH) as run:
+            await _evaluate(run, 0)
+        return run
+
+    run = asyncio.run(main())
+    assert not run.running
+    assert run.run_id is not None
+
+
+def test_spans_nest_per_task():
+    recorder = SpanRecorder()
+
+    async def task(name):
+        with recorder.span(name):
+            await asyncio.sleep(0.01)
+            with recorder.span('inner'):
+                await asyncio.sleep(0.01)
+
+    async def main():
+        await asyncio.gather(task('a'), task('b'))
+
+    asyncio.run(main())
+    assert set(recorder.stats()) == {'a', 'a/inner', 'b', 'b/inner'}
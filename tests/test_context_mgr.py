@@ -18,7 +18,7 @@ TEST_EXP_PATH = "/Shared/Tests/actarius_test_basic"
 
 
 def test_experiment_run_context():
-    with ExperimentRunContext(TEST_EXP_PATH):
+    with ExperimentRunContext(TEST_EXP_PATH) as run:
         mlflow.set_tags({
             'test': 'contextmgr',
             'key': 'value',
@@ -61,3 +61,13 @@ def test_experiment_run_context():
         print("Logged an int list as a text file!")
 
         mlflow.log_metric("sum", a + b)
+
+        print("Now timing some nested spans...")
+        for _ in range(3):
+            with run.span("outer"):
+                with run.span("inner"):
+                    sum(range(1000))
+
+        print("Now logging a per-step metric...")
+        for step in range(100):
+            run.log_metric("loss", 1 / (step + 1), step=step)
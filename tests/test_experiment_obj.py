@@ -1,6 +1,8 @@
 """Testing the actarius package."""
 
 import time
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from random import (
     random,
     randint,
@@ -8,7 +10,7 @@ from random import (
 
 import pandas as pd
 
-from actarius import ExperimentRun
+from actarius import ExperimentRun, wait_for_flushes
 
 from .shared import CustomClass
 
@@ -61,3 +63,62 @@ def test_experiment_obj():
 
     exp.log_metric("sum", a + b)
     exp.end_run()
+
+
+def test_experiment_obj_async_flush(file_store):
+    exp = ExperimentRun(TEST_EXP_PATH, async_flush=True)
+    exp.set_tags({
+        'test': 'exp_obj_async_flush',
+        'key': 'value',
+    })
+    exp.log_param("a", randint(0, 4))
+    exp.log_obj_as_text([1, 3, 5], 'int_list.txt')
+    future = exp.end_run(metrics={'some_metric': random()})
+    assert not exp.running
+    exp.wait(timeout=120)
+    assert future.done()
+    assert wait_for_flushes(timeout=1)
+
+
+def test_experiment_obj_track_resources():
+    exp = ExperimentRun(TEST_EXP_PATH, track_resources=True)
+    exp.set_tag('test', 'exp_obj_track_resources')
+    _ = [bytearray(1024 * 1024) for _ in range(10)]
+    exp.end_run()
+    assert not exp.running
+
+
+def _log_worker_stats(worker_id, run_proxy):
+    run_proxy.set_tag('worker_{}'.format(worker_id), 'done')
+    run_proxy.log_metrics({'n_rows': 10 * worker_id}, step=worker_id)
+    return worker_id
+
+
+def test_experiment_obj_concurrent_logging():
+    exp = ExperimentRun(TEST_EXP_PATH)
+    exp.set_tag('test', 'exp_obj_concurrent_logging')
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(
+            lambda i: exp.log_params({'param_{}'.format(i): i}), range(100)))
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        assert list(executor.map(
+            _log_worker_stats, range(4), repeat(exp.proxy()))) == list(
+                range(4))
+    exp.end_run()
+    assert not exp.running
+    assert len(exp.params) == 100
+    assert all(exp.tags['worker_{}'.format(i)] == 'done' for i in range(4))
+    history = exp._metric_buffer.history('n_rows')
+    assert sorted((step, value) for step, _, value in history) == [
+        (i, 10 * i) for i in range(4)]
+
+
+def test_experiment_obj_metrics_view():
+    exp = ExperimentRun(TEST_EXP_PATH)
+    exp.set_tag('test', 'exp_obj_metrics_view')
+    exp.log_metric('loss', 0.9, step=0)
+    exp.log_metrics({'loss': 0.5, 'auc': 0.7}, step=1)
+    assert exp.metrics == {'loss': 0.5, 'auc': 0.7}
+    assert exp.metrics['loss'] == 0.5
+    exp.end_run()
+    assert not exp.running
@@ -0,0 +1,153 @@
+"""Testing the git metadata snapshot of the actarius package."""
+
+import os
+import shutil
+import subprocess
+from unittest.mock import patch
+
+import pytest
+
+from actarius.gitinfo import (
+    NOT_FROM_GIT_REPO,
+    git_snapshot,
+    parse_git_config,
+)
+
+COMMIT = 'a' * 40
+PACKED_COMMIT = 'b' * 40
+
+CONFIG = """
+[core]
+\tbare = false
+[remote "origin"]
+\turl = git@github.com:shaypal5/actarius.git  # a comment
+[user]
+\tname = "Some User"
+\temail = some@user.com
+"""
+
+
+def _write(fpath, content):
+    os.makedirs(os.path.dirname(fpath), exist_ok=True)
+    with open(fpath, 'wt') as f:
+        f.write(content)
+
+
+@pytest.fixture
+def repo(tmpdir, monkeypatch):
+    # isolate the snapshot from the global git configuration of the host
+    monkeypatch.setenv('GIT_CONFIG_NOSYSTEM', '1')
+    monkeypatch.setenv('GIT_CONFIG_GLOBAL', str(tmpdir.join('no_config')))
+    repo_dpath = str(tmpdir.mkdir('repo'))
+    git_dpath = os.path.join(repo_dpath, '.git')
+    _write(os.path.join(git_dpath, 'HEAD'), 'ref: refs/heads/feature/x\n')
+    _write(os.path.join(git_dpath, 'refs', 'heads', 'feature', 'x'),
+           COMMIT + '\n')
+    _write(os.path.join(git_dpath, 'packed-refs'), (
+        '# pack-refs with: peeled fully-peeled sorted\n'
+        '{} refs/heads/master\n'
+        '^{}\n'
+    ).format(PACKED_COMMIT, 'c' * 40))
+    _write(os.path.join(git_dpath, 'config'), CONFIG)
+    os.makedirs(os.path.join(repo_dpath, 'sub', 'dir'))
+    return repo_dpath
+
+
+def _no_subprocess(*args, **kwargs):
+    raise AssertionError("A git subprocess was forked")
+
+
+def test_git_snapshot_reads_git_dir_without_subprocesses(repo):
+    with patch('subprocess.check_output', side_effect=_no_subprocess):
+        snapshot = git_snapshot(os.path.join(repo, 'sub', 'dir'))
+    assert snapshot.repo_dpath == repo
+    assert snapshot.as_tags() == {
+        'git_repo': 'actarius',
+        'git_branch': 'feature/x',
+        'git_username': 'Some User',
+        'git_user_email': 'some@user.com',
+        'git_commit_checksum': COMMIT,
+    }
+    with pytest.raises(AttributeError):
+        snapshot.commit = PACKED_COMMIT
+
+
+def test_git_snapshot_is_cached_until_head_changes(repo):
+    snapshot = git_snapshot(repo)
+    assert git_snapshot(repo) is snapshot
+    head_fpath = os.path.join(repo, '.git', 'HEAD')
+    _write(head_fpath, 'ref: refs/heads/master\n')
+    mtime_ns = os.stat(head_fpath).st_mtime_ns + 10 ** 9
+    os.utime(head_fpath, ns=(mtime_ns, mtime_ns))
+    snapshot = git_snapshot(repo)
+    assert snapshot.branch == 'master'
+    assert snapshot.commit == PACKED_COMMIT
+
+
+def test_git_snapshot_of_detached_head(repo):
+    _write(os.path.join(repo, '.git', 'HEAD'), PACKED_COMMIT + '\n')
+    snapshot = git_snapshot(repo)
+    assert snapshot.branch == NOT_FROM_GIT_REPO
+    assert snapshot.commit == PACKED_COMMIT
+
+
+def test_git_snapshot_outside_of_a_repo(tmpdir):
+    snapshot = git_snapshot(str(tmpdir))
+    assert snapshot.repo_dpath is None
+    assert snapshot.commit == NOT_FROM_GIT_REPO
+
+
+def test_parse_git_config():
+    assert parse_git_config(CONFIG) == {
+        'core.bare': 'false',
+        'remote.origin.url': 'git@github.com:shaypal5/actarius.git',
+        'user.name': 'Some User',
+        'user.email': 'some@user.com',
+    }
+
+
+@pytest.mark.skipif(shutil.which('git') is None, reason="git not installed")
+def test_git_snapshot_matches_git(tmpdir):
+    repo_dpath = str(tmpdir)
+    for cmd in (
+        ['init', '-q'],
+        ['config', 'user.name', 'Some User'],
+        ['config', 'user.email', 'some@user.com'],
+        ['commit', '-q', '--allow-empty', '-m', 'first'],
+        ['pack-refs', '--all'],
+        ['commit', '-q', '--allow-empty', '-m', 'second'],
+    ):
+        subprocess.check_call(['git', '-C', repo_dpath] + cmd)
+    commit = subprocess.check_output(
+        ['git', '-C', repo_dpath, 'rev-parse', 'HEAD']).decode().strip()
+    branch = subprocess.check_output(
+        ['git', '-C', repo_dpath, 'rev-parse', '--abbrev-ref', 'HEAD'],
+    ).decode().strip()
+    snapshot = git_snapshot(repo_dpath)
+    assert snapshot.commit == commit
+    assert snapshot.branch == branch
+    assert snapshot.username == 'Some User'
+
+
+@pytest.mark.skipif(shutil.which('git') is None, reason="git not installed")
+def test_git_snapshot_of_worktree(tmpdir):
+    repo_dpath = str(tmpdir.mkdir('repo'))
+    worktree_dpath = str(tmpdir.join('worktree'))
+    for cmd in (
+        ['init', '-q'],
+        ['config', 'user.name', 'Some User'],
+        ['config', 'user.email', 'some@user.com'],
+        ['commit', '-q', '--allow-empty', '-m', 'first'],
+        ['worktree', 'add', '-q', '-b', 'other', worktree_dpath],
+    ):
+        subprocess.check_call(['git', '-C', repo_dpath] + cmd)
+    subprocess.check_call([
+        'git', '-C', worktree_dpath,
+        'commit', '-q', '--allow-empty', '-m', 'second'])
+    commit = subprocess.check_output(
+        ['git', '-C', worktree_dpath, 'rev-parse', 'HEAD']).decode().strip()
+    snapshot = git_snapshot(worktree_dpath)
+    assert snapshot.repo_dpath == worktree_dpath
+    assert snapshot.branch == 'other'
+    assert snapshot.commit == commit
+    assert snapshot.username == 'Some User'
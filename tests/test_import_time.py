@@ -0,0 +1,42 @@
+"""Testing the import time of the actarius package."""
+
+import os
+import sys
+import subprocess
+
+HEAVY_MODULES = ['mlflow', 'git', 'birch', 'databricks_cli', 'pandas']
+
+# actarius is imported from the root of the repository, even if not installed
+REPO_DPATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _run_python(*args):
+    return subprocess.run(
+        [sys.executable, *args],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+        cwd=REPO_DPATH,
+    )
+
+
+def test_import_does_not_load_heavy_dependencies():
+    res = _run_python('-c', (
+        "import sys, actarius; "
+        "print(' '.join(m for m in {!r} if m in sys.modules))"
+    ).format(HEAVY_MODULES))
+    assert res.stdout.strip() == ''
+
+
+def test_import_time_benchmark():
+    res = _run_python('-X', 'importtime', '-c', 'import actarius')
+    # each line is 'import time: self [us] | cumulative | imported package'
+    cumulative_us = None
+    for line in res.stderr.splitlines():
+        fields = [field.strip() for field in line.split('|')]
+        if len(fields) == 3 and fields[2] == 'actarius':
+            cumulative_us = int(fields[1])
+    assert cumulative_us is not None
+    print("import actarius took {:.1f} ms".format(cumulative_us / 1000))
+    assert cumulative_us < 1000000
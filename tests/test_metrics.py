@@ -0,0 +1,44 @@
+"""Testing metric buffering of the actarius package."""
+
+import time
+
+from actarius.metrics import MetricBuffer
+
+
+def test_metric_buffer_keeps_full_history():
+    buffer = MetricBuffer()
+    for step in range(5):
+        buffer.log('loss', 1 / (step + 1), step=step, timestamp=step * 10)
+    buffer.log_dict({'loss': 0.1, 'acc': 0.9}, step=5, timestamp=50)
+    history = buffer.history('loss')
+    assert len(history) == 6
+    assert history[0] == (0, 0, 1.0)
+    assert history[-1] == (5, 50, 0.1)
+    assert buffer.latest() == {'loss': 0.1, 'acc': 0.9}
+    pending = buffer.pending_metrics()
+    assert len(pending) == 7
+    assert buffer.pending_metrics() == []
+    # flushed points are still part of the history
+    assert len(buffer.history('loss')) == 6
+
+
+def test_metric_buffer_flushes_by_count():
+    batches = []
+    buffer = MetricBuffer(flush_fn=batches.append, flush_every=10)
+    for step in range(25):
+        buffer.log('loss', step, step=step)
+    assert [len(batch) for batch in batches] == [10, 10]
+    buffer.flush()
+    assert [len(batch) for batch in batches] == [10, 10, 5]
+    assert [metric.step for metric in batches[-1]] == list(range(20, 25))
+
+
+def test_metric_buffer_flushes_by_interval():
+    batches = []
+    buffer = MetricBuffer(flush_fn=batches.append, flush_interval_sec=0.05)
+    buffer.log('loss', 1)
+    assert batches == []
+    time.sleep(0.06)
+    buffer.log('loss', 2)
+    assert len(batches) == 1
+    assert [metric.value for metric in batches[0]] == [1, 2]
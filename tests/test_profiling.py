@@ -0,0 +1,101 @@
+"""Testing the run profilers of the actarius package."""
+
+import os
+import pstats
+from types import SimpleNamespace
+
+import pytest
+
+from actarius.profiling import (
+    COLLAPSED_FNAME,
+    METRIC_PREFIX,
+    PSTATS_FNAME,
+    STATS_FNAME,
+    collapsed_stacks_from_stats,
+    run_profiler,
+)
+
+
+def _hot_function(n):
+    total = 0
+    for i in range(n):
+        total += i * i
+    return total
+
+
+def _workload():
+    for _ in range(30):
+        _hot_function(20000)
+
+
+def _read_collapsed(dpath):
+    with open(os.path.join(dpath, COLLAPSED_FNAME), 'rt') as f:
+        lines = f.read().splitlines()
+    stacks = {}
+    for line in lines:
+        stack, value = line.rsplit(' ', 1)
+        stacks[stack] = int(value)
+    return stacks
+
+
+def test_cprofile_run_profiler(tmpdir):
+    dpath = str(tmpdir.join('profile'))
+    profiler = run_profiler(profile=True, top_n=2, interval_sec=0.01)
+    profiler.start()
+    _workload()
+    profiler.stop()
+    metrics = profiler.dump(dpath)
+    assert len(metrics) == 2
+    assert all(name.startswith(METRIC_PREFIX) for name in metrics)
+    hottest = max(metrics, key=metrics.get)
+    assert '_hot_function' in hottest
+    stats = pstats.Stats(os.path.join(dpath, PSTATS_FNAME))
+    assert stats.total_calls > 30
+    assert os.path.getsize(os.path.join(dpath, STATS_FNAME)) > 0
+    stacks = _read_collapsed(dpath)
+    assert any(
+        stack.endswith('(_workload);' + stack.rsplit(';', 1)[-1])
+        and '_hot_function' in stack.rsplit(';', 1)[-1]
+        for stack in stacks
+    )
+
+
+def test_collapsed_stacks_of_many_call_paths():
+    # 60 layers of two functions, each calling both functions of the next
+    # layer, make 2 ** 60 call paths
+    n_layers = 60
+    stats = {}
+    for layer in range(n_layers):
+        callers = {}
+        if layer > 0:
+            callers = {
+                ('mod.py', layer - 1, 'f{}'.format(i)): (1, 1, 0.5, 0.5)
+                for i in range(2)
+            }
+        for i in range(2):
+            stats[('mod.py', layer, 'f{}'.format(i))] = (
+                1, 1, 1.0, 1.0, callers)
+    stacks = collapsed_stacks_from_stats(SimpleNamespace(stats=stats))
+    assert len(stacks) == 2 + 4 * (n_layers - 1)
+    assert sum(stacks.values()) == 2 * n_layers * 1000000
+    assert stacks['mod.py:0(f0);mod.py:1(f1)'] == 500000
+
+
+def test_sampling_run_profiler(tmpdir):
+    dpath = str(tmpdir.join('profile'))
+    profiler = run_profiler(profile='sampling', top_n=3, interval_sec=0.001)
+    profiler.start()
+    _workload()
+    profiler.stop()
+    metrics = profiler.dump(dpath)
+    assert profiler.n_samples > 0
+    assert 0 < len(metrics) <= 3
+    assert '_hot_function' in max(metrics, key=metrics.get)
+    stacks = _read_collapsed(dpath)
+    assert sum(stacks.values()) == profiler.n_samples
+    assert not os.path.exists(os.path.join(dpath, PSTATS_FNAME))
+
+
+def test_unknown_profiler():
+    with pytest.raises(ValueError):
+        run_profiler(profile='tracing', top_n=3, interval_sec=0.01)
@@ -0,0 +1,141 @@
+"""Testing artifact serialization of the actarius package."""
+
+import io
+import os
+import pickle
+
+import pytest
+import pandas as pd
+
+from actarius.serialize import (
+    OBJ_COMPRESSION_EXTENSIONS,
+    OUT_OF_BAND_MAGIC,
+    SpooledArtifact,
+    dump_df,
+    dump_obj,
+    load_obj,
+    obj_artifact_name,
+    resolve_df_format,
+    resolve_obj_compression,
+)
+
+from .shared import CustomClass
+
+
+SMALL_DF = pd.DataFrame(
+    data=[[1, 2, 'a'], [2, 4, 'b']],
+    index=[1, 2],
+    columns=['num1', 'num2', 'char']
+)
+
+
+def _has_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+@pytest.mark.parametrize('name, expected_format', [
+    ('some_dataframe.csv', 'csv'),
+    ('some_dataframe.csv.gz', 'csv.gz'),
+    ('some_dataframe.pkl', 'pickle'),
+])
+def test_resolve_df_format_by_extension(name, expected_format):
+    assert resolve_df_format(SMALL_DF, name) == (expected_format, name)
+
+
+def test_resolve_df_format_appends_extension():
+    assert resolve_df_format(SMALL_DF, 'some_dataframe') == (
+        'csv', 'some_dataframe.csv')
+    assert resolve_df_format(SMALL_DF, 'some_dataframe', format='pickle') == (
+        'pickle', 'some_dataframe.pkl')
+
+
+def test_resolve_df_format_by_size():
+    n_rows = 500000
+    large_df = pd.DataFrame({'a': range(n_rows), 'b': range(n_rows)})
+    expected_format = 'parquet' if _has_pyarrow() else 'pickle'
+    assert resolve_df_format(large_df, 'large_df')[0] == expected_format
+
+
+def test_resolve_df_format_rejects_unknown_formats():
+    with pytest.raises(ValueError):
+        resolve_df_format(SMALL_DF, 'some_dataframe', format='xlsx')
+
+
+@pytest.mark.parametrize('df_format, reader', [
+    ('csv', lambda fpath: pd.read_csv(fpath, index_col=0)),
+    ('csv.gz', lambda fpath: pd.read_csv(fpath, index_col=0)),
+    ('pickle', pd.read_pickle),
+])
+def test_dump_df(tmpdir, df_format, reader):
+    _, name = resolve_df_format(SMALL_DF, 'some_dataframe', format=df_format)
+    fpath = os.path.join(str(tmpdir), name)
+    dump_df(SMALL_DF, fpath, df_format)
+    pd.testing.assert_frame_equal(reader(fpath), SMALL_DF)
+
+
+def test_spooled_artifact_spills_when_large(tmpdir):
+    spool = SpooledArtifact(
+        name='obj.bin', max_memory_bytes=10, spill_dpath=str(tmpdir))
+    spool.write(b'12345')
+    assert spool.in_memory
+    assert bytes(spool.getbuffer()) == b'12345'
+    spool.write(b'6789012345')
+    assert not spool.in_memory
+    spool.close()
+    with open(spool.fpath, 'rb') as f:
+        assert f.read() == b'123456789012345'
+    spool.discard()
+    assert not os.path.exists(spool.fpath)
+
+
+def _available_compressions():
+    compressions = [None]
+    for compression in OBJ_COMPRESSION_EXTENSIONS:
+        try:
+            compressions.append(resolve_obj_compression(compression))
+        except ImportError:
+            pass
+    return compressions
+
+
+@pytest.mark.parametrize('compression', _available_compressions())
+@pytest.mark.parametrize('out_of_band', [False, True])
+def test_dump_and_load_obj(tmpdir, compression, out_of_band):
+    data = bytearray(range(256)) * 4096
+    # pickled as NumPy arrays are, through a PickleBuffer
+    obj = {
+        'custom': CustomClass(a=3, b=88),
+        'buffer': pickle.PickleBuffer(data),
+    }
+    name = obj_artifact_name('custom_obj.pkl', compression)
+    fpath = os.path.join(str(tmpdir), name)
+    dump_obj(obj, fpath, compression=compression, out_of_band=out_of_band)
+    loaded = load_obj(fpath)
+    assert loaded['custom'].a == 3
+    assert loaded['custom'].b == 88
+    assert loaded['buffer'] == data
+    if compression is not None:
+        # the buffer is highly repetitive, so it must compress well
+        assert os.path.getsize(fpath) < len(data) / 10
+
+
+def test_out_of_band_buffers_are_not_in_the_pickle_stream():
+    data = bytearray(10 ** 6)
+    file = io.BytesIO()
+    dump_obj({'buffer': pickle.PickleBuffer(data)}, file, out_of_band=True)
+    content = file.getvalue()
+    stream_size = int.from_bytes(
+        content[len(OUT_OF_BAND_MAGIC):len(OUT_OF_BAND_MAGIC) + 8], 'little')
+    assert stream_size < 1000
+    assert load_obj(io.BytesIO(content))['buffer'] == data
+
+
+def test_plain_pickles_stay_loadable_with_pickle(tmpdir):
+    fpath = os.path.join(str(tmpdir), 'custom_obj.pkl')
+    dump_obj(CustomClass(a=3, b=88), fpath)
+    with open(fpath, 'rb') as f:
+        assert pickle.load(f).b == 88
@@ -0,0 +1,145 @@
+"""Testing the pooled HTTP sessions of the actarius package."""
+
+import sys
+import json
+import time
+import inspect
+import threading
+from types import ModuleType
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+import pytest
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from actarius import session
+from actarius.session import (
+    PooledAdapter,
+    install_http_session,
+    pool_connections,
+)
+
+
+class _StubTrackingHandler(BaseHTTPRequestHandler):
+    """Answers every request as the log-batch endpoint of MLflow does."""
+
+    protocol_version = 'HTTP/1.1'  # keep connections alive
+    # send each response in a single segment, as real servers do, to avoid
+    # delayed ACK stalls on kept-alive connections
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.n_connections += 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        body = b'{}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _StubTrackingHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.n_connections = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _log_batches(post, url, n_requests, n_threads):
+    payload = json.dumps({'run_id': 'some_run_id', 'metrics': [
+        {'key': 'loss', 'value': 0.5, 'timestamp': 0, 'step': step}
+        for step in range(10)
+    ]})
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=n_threads) as executor:
+        responses = list(executor.map(
+            lambda _: post(url, data=payload), range(n_requests)))
+    elapsed = time.perf_counter() - start
+    assert all(response.status_code == 200 for response in responses)
+    return elapsed
+
+
+def _mlflow_default_session():
+    # a new session, made as the MLflow client makes its cached ones
+    request_utils = pytest.importorskip('mlflow.utils.request_utils')
+    make_session = inspect.unwrap(request_utils._get_request_session)
+    args = {
+        'max_retries': 0,
+        'backoff_factor': 0,
+        'backoff_jitter': 0,
+        'retry_codes': (429, 503),
+        'raise_on_status': False,
+        'respect_retry_after_header': True,
+    }
+    params = inspect.signature(make_session).parameters
+    return make_session(**{
+        name: value for name, value in args.items() if name in params})
+
+
+def test_pooled_session_benchmark(stub_server):
+    url = 'http://127.0.0.1:{}/api/2.0/mlflow/runs/log-batch'.format(
+        stub_server.server_address[1])
+    # more threads than the 10 connections MLflow keeps alive per host
+    n_requests, n_threads = 800, 24
+    pooled = pool_connections(_mlflow_default_session())
+    pooled_sec = _log_batches(pooled.post, url, n_requests, n_threads)
+    assert stub_server.n_connections <= n_threads
+    default = _mlflow_default_session()
+    default_sec = _log_batches(default.post, url, n_requests, n_threads)
+    # with a generous margin, as timings are noisy on shared hosts
+    assert pooled_sec < 2 * default_sec
+
+
+def test_pooled_adapters_override_timeouts():
+    adapter = PooledAdapter(
+        pool_size=1, connect_timeout_sec=2, read_timeout_sec=3)
+    with patch.object(HTTPAdapter, 'send') as send:
+        adapter.send('request', timeout=120)
+    assert send.call_args[1]['timeout'] == (2, 3)
+
+
+def _mlflow_session(*args):
+    mlflow_session = requests.Session()
+    mlflow_session.mount('https://', HTTPAdapter(
+        max_retries=Retry(total=5, status_forcelist=[429, 503])))
+    return mlflow_session
+
+
+def test_install_http_session():
+    rest_utils = ModuleType('rest_utils')
+    rest_utils._get_request_session = _mlflow_session
+    with patch.object(
+            session, 'MLFLOW_SESSION_MODULES',
+            ['no_such_module', 'rest_utils']), \
+            patch.dict(sys.modules, {'rest_utils': rest_utils}):
+        install_http_session.cache_clear()
+        try:
+            assert install_http_session()
+        finally:
+            install_http_session.cache_clear()
+    pooled = rest_utils._get_request_session(3, 2)
+    adapter = pooled.get_adapter('https://localhost')
+    assert isinstance(adapter, PooledAdapter)
+    # the retry policy of MLflow is kept
+    assert adapter.max_retries.total == 5
+    assert adapter.max_retries.status_forcelist == [429, 503]
+    assert pool_connections(pooled).get_adapter('https://localhost') \
+        is adapter
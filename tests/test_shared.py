@@ -0,0 +1,375 @@
+"""Testing shared code of the actarius package."""
+
+import io
+import os
+import sys
+import errno
+import gzip
+import lzma
+import time
+import zlib
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock, patch
+
+import pytest
+from mlflow.exceptions import MlflowException
+from mlflow.protos.databricks_pb2 import (
+    RESOURCE_ALREADY_EXISTS,
+    RESOURCE_DOES_NOT_EXIST,
+)
+
+from actarius import shared
+from actarius.tagcache import TagCache
+from actarius.shared import (
+    CACHE_DPATH,
+    ArgusArtifactory,
+    DoubleLogger,
+    LogFile,
+    Logger,
+    LogStreamer,
+    MAX_ENTITIES_PER_BATCH,
+    MAX_PARAMS_PER_BATCH,
+    MAX_TAGS_PER_BATCH,
+    log_batch,
+    log_obj_as_text,
+    set_shared_tags,
+    shared_tags,
+    _experiment_id,
+    _with_experiment_id,
+)
+
+
+def test_set_shared_tags_tracking_calls():
+    client = MagicMock()
+    with patch('actarius.shared.tracking_client', return_value=client), \
+            patch('mlflow.set_tag') as set_tag:
+        set_shared_tags(run_id='some_run_id')
+    n_calls = client.log_batch.call_count + set_tag.call_count
+    print("Tracking server calls for shared tags: {}".format(n_calls))
+    assert n_calls == 1
+    kwargs = client.log_batch.call_args[1]
+    assert kwargs['run_id'] == 'some_run_id'
+    assert {tag.key for tag in kwargs['tags']} == set(shared_tags())
+
+
+def test_log_batch_splits_at_server_limits():
+    client = MagicMock()
+    metrics = {'m{}'.format(i): i for i in range(2500)}
+    params = {'p{}'.format(i): i for i in range(150)}
+    tags = {'t{}'.format(i): i for i in range(30)}
+    with patch('actarius.shared.tracking_client', return_value=client):
+        n_requests = log_batch(
+            run_id='some_run_id', tags=tags, params=params, metrics=metrics)
+    assert n_requests == client.log_batch.call_count == 3
+    n_metrics, n_params, n_tags = 0, 0, 0
+    for call in client.log_batch.call_args_list:
+        kwargs = call[1]
+        assert len(kwargs['params']) <= MAX_PARAMS_PER_BATCH
+        assert len(kwargs['tags']) <= MAX_TAGS_PER_BATCH
+        assert sum(map(len, (
+            kwargs['metrics'], kwargs['params'], kwargs['tags'],
+        ))) <= MAX_ENTITIES_PER_BATCH
+        n_metrics += len(kwargs['metrics'])
+        n_params += len(kwargs['params'])
+        n_tags += len(kwargs['tags'])
+    assert (n_metrics, n_params, n_tags) == (2500, 150, 30)
+
+
+def test_artifactory_uploads_each_file_under_its_relative_path(tmpdir):
+    artifacts_dpath = str(tmpdir.mkdir('artifacts'))
+    os.makedirs(os.path.join(artifacts_dpath, 'sub', 'dir'))
+    rel_fpaths = ['a.txt', os.path.join('sub', 'b.txt'),
+                  os.path.join('sub', 'dir', 'c.txt')]
+    for rel_fpath in rel_fpaths:
+        with open(os.path.join(artifacts_dpath, rel_fpath), 'wt') as f:
+            f.write(rel_fpath)
+    repo = MagicMock()
+    with patch('actarius.shared.tracking_client'), \
+            patch('actarius.shared.get_artifact_repository',
+                  return_value=repo):
+        artifactory = ArgusArtifactory(
+            run_id='some_run_id', artifacts_dpath=artifacts_dpath)
+        artifactory.log_artifacts(run_id='some_run_id')
+    uploaded = {call[0] for call in repo.log_artifact.call_args_list}
+    assert uploaded == {
+        (os.path.join(artifacts_dpath, 'a.txt'), None),
+        (os.path.join(artifacts_dpath, 'sub', 'b.txt'), 'sub'),
+        (os.path.join(artifacts_dpath, 'sub', 'dir', 'c.txt'), 'sub/dir'),
+    }
+
+
+class _UnbufferedTee(object):
+    """The tee DoubleLogger used before its file side was buffered."""
+
+    def __init__(self, stream, log_file):
+        self.stream = stream
+        self.log_file = log_file
+
+    def write(self, message):
+        self.log_file.write(message)
+        self.stream.write(message)
+
+    def flush(self):
+        self.log_file.flush()
+        self.stream.flush()
+
+
+def _prints_per_sec(n_prints):
+    # flushing after every line, as the logging module and tqdm do
+    start = time.perf_counter()
+    for i in range(n_prints):
+        print("step", i, "loss", 0.5, flush=True)
+    return n_prints / (time.perf_counter() - start)
+
+
+def test_double_logger_throughput(tmpdir):
+    n_prints = 20000
+    prev_stdout = sys.stdout
+    with open(os.devnull, 'wt') as console:
+        sys.stdout = console
+        try:
+            unbuffered_fpath = str(tmpdir.join('unbuffered_log.txt'))
+            with open(unbuffered_fpath, 'a') as log_file:
+                sys.stdout = _UnbufferedTee(console, log_file)
+                unbuffered_rate = _prints_per_sec(n_prints)
+            sys.stdout = console
+            log_fpath = str(tmpdir.join('log.txt'))
+            logger = DoubleLogger(log_fpath)
+            rate = _prints_per_sec(n_prints)
+            logger.close()
+        finally:
+            sys.stdout = prev_stdout
+    print("Prints per second: {:.0f} with an unbuffered tee, {:.0f} with "
+          "DoubleLogger".format(unbuffered_rate, rate))
+    with open(log_fpath, 'rt') as f:
+        lines = f.read().splitlines()
+    assert len(lines) == n_prints
+    assert lines[-1] == "step {} loss 0.5".format(n_prints - 1)
+
+
+_OPENERS = {
+    None: open,
+    'gzip': gzip.open,
+    'lzma': lzma.open,
+}
+_EXTENSIONS = {
+    None: '',
+    'gzip': '.gz',
+    'lzma': '.xz',
+}
+
+
+@pytest.mark.parametrize('compression', [None, 'gzip'])
+def test_log_streamer_uploads_rolling_parts(tmpdir, compression):
+    uploaded = []
+
+    def _read_part(run_id, fpath, artifact_path):
+        with _OPENERS[compression](fpath, 'rt') as f:
+            uploaded.append((os.path.basename(fpath), artifact_path, f.read()))
+
+    client = MagicMock()
+    client.log_artifact.side_effect = _read_part
+    log_fpath = str(tmpdir.join('log.txt'))
+    prev_stdout = sys.stdout
+    with open(os.devnull, 'wt') as console:
+        sys.stdout = console
+        try:
+            logger = DoubleLogger(log_fpath, compression=compression)
+            streamer = LogStreamer(
+                logger=logger,
+                run_id='some_run_id',
+                chunk_bytes=100,
+                interval_sec=0.05,
+            )
+            with patch('actarius.shared.tracking_client',
+                       return_value=client):
+                streamer.start()
+                for i in range(50):
+                    print("line {}".format(i))
+                    if i % 10 == 0:
+                        time.sleep(0.1)
+                logger.close()
+                streamer.stop()
+        finally:
+            sys.stdout = prev_stdout
+    assert len(uploaded) > 1
+    assert [fname for fname, _, _ in uploaded] == [
+        'log_part_{:04d}.txt{}'.format(i + 1, _EXTENSIONS[compression])
+        for i in range(len(uploaded))
+    ]
+    assert {artifact_path for _, artifact_path, _ in uploaded} == {
+        'log_parts'}
+    assert ''.join(content for _, _, content in uploaded) == ''.join(
+        "line {}\n".format(i) for i in range(50))
+
+
+@pytest.mark.parametrize('compression', [None, 'gzip', 'lzma'])
+def test_log_file_keeps_head_and_tail_when_capped(tmpdir, compression):
+    log_file = LogFile(
+        str(tmpdir.join('log.txt')),
+        buffer_size=1024,
+        compression=compression,
+        max_bytes=4000,
+        n_segments=4,
+    )
+    lines = ["line {:04d}\n".format(i) for i in range(1000)]
+    for line in lines:
+        log_file.write(line)
+    log_file.close()
+    fpaths = log_file.fpaths
+    assert len(fpaths) == 4
+    assert log_file.n_truncated > 0
+    assert all(fpath.endswith(_EXTENSIONS[compression]) for fpath in fpaths)
+    contents = []
+    for fpath in fpaths:
+        with _OPENERS[compression](fpath, 'rt') as f:
+            contents.append(f.read())
+    assert contents[0].startswith(lines[0])
+    assert contents[-1].endswith(lines[-1])
+    assert "truncated" in contents[1]
+    assert sum(map(len, contents)) < 4000 + 4 * len(lines[0]) + 300
+
+
+def _read_flushed(log_file):
+    with open(log_file.fpaths[0], 'rb') as f:
+        data = f.read()
+    if log_file.compression == 'gzip':
+        # the gzip stream is not yet ended, so it can not be read with gzip
+        data = zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(data)
+    return data.decode('utf-8')
+
+
+@pytest.mark.parametrize('compression', [None, 'gzip'])
+def test_console_flushes_reach_the_log_file(tmpdir, compression):
+    log_file = LogFile(
+        str(tmpdir.join('log.txt')),
+        buffer_size=1024 * 1024,
+        compression=compression,
+        flush_interval_sec=3600,
+    )
+    logger = Logger(io.StringIO(), log_file)
+    logger.write("first line\n")
+    logger.flush()
+    assert _read_flushed(log_file) == ""
+    logger.write("second line\n")
+    log_file.flush_interval_sec = 0
+    logger.flush()
+    assert _read_flushed(log_file) == "first line\nsecond line\n"
+    log_file.close()
+
+def _log_small_artifact(memory_dpath):
+    uploaded = []
+
+    def _read_artifact(run_id, fpath):
+        with open(fpath, 'rt') as f:
+            uploaded.append((os.path.dirname(fpath), f.read()))
+
+    client = MagicMock()
+    client.log_artifact.side_effect = _read_artifact
+    with patch('actarius.shared.tracking_client', return_value=client), \
+            patch('actarius.shared.active_run_id', return_value='run_id'), \
+            patch.object(shared, 'MEMORY_DPATH', memory_dpath):
+        log_obj_as_text([1, 3, 5], 'int_list.txt')
+    assert len(uploaded) == 1
+    dpath, content = uploaded[0]
+    assert content == '[1, 3, 5]'
+    assert not os.path.exists(dpath)
+    assert not os.path.exists(os.path.join(CACHE_DPATH, 'int_list.txt'))
+    return os.path.dirname(dpath)
+
+
+def test_small_artifacts_skip_the_cache_dir(tmpdir):
+    memory_dpath = str(tmpdir.mkdir('shm'))
+    assert _log_small_artifact(memory_dpath) == memory_dpath
+
+
+def test_small_artifacts_are_staged_on_disk_without_memory_dir(tmpdir):
+    memory_dpath = str(tmpdir.mkdir('shm'))
+    mkdtemp = tempfile.mkdtemp
+
+    def full_mkdtemp(dir):
+        if dir == memory_dpath:
+            raise OSError(errno.ENOSPC, 'No space left on device')
+        return mkdtemp(dir=dir)
+
+    with patch('actarius.shared.tempfile.mkdtemp', side_effect=full_mkdtemp):
+        assert _log_small_artifact(memory_dpath) == shared.temp_dir()
+    no_dpath = str(tmpdir.join('no_shm'))
+    assert _log_small_artifact(no_dpath) == shared.temp_dir()
+
+
+@pytest.fixture
+def experiment_client():
+    client = MagicMock()
+    client.get_experiment_by_name.side_effect = lambda name: MagicMock(
+        experiment_id='id_of_' + name, lifecycle_stage='active')
+    shared._EXPERIMENT_IDS.clear()
+    yield client
+    shared._EXPERIMENT_IDS.clear()
+
+
+def test_experiment_ids_are_cached(experiment_client, tmpdir):
+    client = experiment_client
+    host_cache = TagCache(str(tmpdir), ttl_sec=60)
+    with patch.object(
+            shared, 'host_experiment_cache', return_value=host_cache):
+        for _ in range(3):
+            assert _experiment_id(client, 'exp_a') == 'id_of_exp_a'
+            assert _experiment_id(client, 'exp_b') == 'id_of_exp_b'
+        assert client.get_experiment_by_name.call_count == 2
+        # ids expire from memory, but other processes find them on disk
+        with patch.object(shared.time, 'monotonic', return_value=1e12):
+            assert _experiment_id(client, 'exp_a') == 'id_of_exp_a'
+        shared._EXPERIMENT_IDS.clear()
+        assert _experiment_id(client, 'exp_b') == 'id_of_exp_b'
+        assert client.get_experiment_by_name.call_count == 2
+
+
+def test_stale_experiment_ids_are_resolved_again(experiment_client):
+    client = experiment_client
+    assert _experiment_id(client, 'exp_a') == 'id_of_exp_a'
+    client.get_experiment_by_name.side_effect = lambda name: MagicMock(
+        experiment_id='new_id_of_' + name, lifecycle_stage='active')
+
+    def create_run(experiment_id):
+        if experiment_id == 'id_of_exp_a':
+            raise MlflowException(
+                "Deleted", error_code=RESOURCE_DOES_NOT_EXIST)
+        return experiment_id
+
+    assert _with_experiment_id(
+        client, 'exp_a', create_run) == 'new_id_of_exp_a'
+    assert _experiment_id(client, 'exp_a') == 'new_id_of_exp_a'
+    assert client.get_experiment_by_name.call_count == 2
+
+
+def test_experiments_are_created_once(experiment_client):
+    client = experiment_client
+    created = []
+    client.get_experiment_by_name.side_effect = lambda name: (
+        MagicMock(experiment_id=created[0], lifecycle_stage='active')
+        if created else None)
+
+    def create_experiment(name):
+        time.sleep(0.05)
+        created.append('id_of_' + name)
+        return created[-1]
+
+    client.create_experiment.side_effect = create_experiment
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        experiment_ids = list(executor.map(
+            lambda _: _experiment_id(client, 'exp_a'), range(8)))
+    assert experiment_ids == ['id_of_exp_a'] * 8
+    assert client.create_experiment.call_count == 1
+
+
+def test_experiments_created_elsewhere_are_looked_up(experiment_client):
+    client = experiment_client
+    client.get_experiment_by_name.side_effect = [
+        None, MagicMock(experiment_id='id_of_exp_a', lifecycle_stage='active'),
+    ]
+    client.create_experiment.side_effect = MlflowException(
+        "Exists", error_code=RESOURCE_ALREADY_EXISTS)
+    assert _experiment_id(client, 'exp_a') == 'id_of_exp_a'
+    assert client.get_experiment_by_name.call_count == 2
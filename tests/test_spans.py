@@ -0,0 +1,91 @@
+"""Testing the timing spans of the actarius package."""
+
+import json
+import time
+import threading
+
+import pytest
+
+from actarius.spans import (
+    METRIC_PREFIX,
+    SpanRecorder,
+)
+
+
+def test_nested_and_repeated_spans():
+    recorder = SpanRecorder()
+    for _ in range(10):
+        with recorder.span('epoch'):
+            with recorder.span('forward'):
+                time.sleep(0.001)
+            with recorder.span('backward'):
+                pass
+    stats = recorder.stats()
+    assert set(stats) == {'epoch', 'epoch/forward', 'epoch/backward'}
+    forward = stats['epoch/forward']
+    assert forward['count'] == 10
+    assert forward['min_sec'] >= 0.001
+    assert (forward['min_sec'] <= forward['p50_sec'] <= forward['p95_sec']
+            <= forward['max_sec'])
+    assert stats['epoch']['total_sec'] >= forward['total_sec']
+    metrics = recorder.metrics()
+    assert metrics[METRIC_PREFIX + 'epoch/forward/count'] == 10
+    assert len(metrics) == 3 * 6
+
+
+def test_span_metric_names_are_sanitized():
+    recorder = SpanRecorder()
+    with recorder.span('load <data>: shard #1'):
+        pass
+    assert set(recorder.metrics()) == {
+        METRIC_PREFIX + 'load _data__ shard _1/' + stat_name
+        for stat_name in [
+            'count', 'total_sec', 'min_sec', 'max_sec', 'p50_sec', 'p95_sec']
+    }
+
+
+def test_span_as_decorator_and_on_exceptions():
+    recorder = SpanRecorder()
+
+    @recorder.span('step')
+    def step(fail):
+        if fail:
+            raise ValueError()
+        return 3
+
+    assert step(False) == 3
+    with pytest.raises(ValueError):
+        step(True)
+    assert recorder.stats()['step']['count'] == 2
+
+
+def test_spans_nest_per_thread():
+    recorder = SpanRecorder()
+
+    def _work():
+        with recorder.span('worker'):
+            pass
+
+    with recorder.span('main'):
+        thread = threading.Thread(target=_work)
+        thread.start()
+        thread.join()
+    assert set(recorder.stats()) == {'main', 'worker'}
+
+
+def test_chrome_trace(tmpdir):
+    recorder = SpanRecorder(max_trace_events=3)
+    for _ in range(5):
+        with recorder.span('load_data'):
+            pass
+    fpath = str(tmpdir.join('trace.json'))
+    recorder.dump_trace(fpath)
+    with open(fpath, 'rt') as f:
+        trace = json.load(f)
+    events = trace['traceEvents']
+    assert len(events) == 3
+    assert recorder.n_dropped_events == 2
+    assert recorder.stats()['load_data']['count'] == 5
+    assert all(event['ph'] == 'X' and event['name'] == 'load_data'
+               for event in events)
+    assert events[0]['ts'] <= events[1]['ts'] <= events[2]['ts']
@@ -0,0 +1,272 @@
+"""Testing the offline spool of the actarius package."""
+
+import os
+import json
+import time
+import socket
+from unittest.mock import MagicMock, patch
+
+import pytest
+from mlflow.entities import Metric
+
+from actarius import shared
+from actarius.cli import main
+from actarius.spool import (
+    JOURNAL_FNAME,
+    LOCK_FNAME,
+    RunSpool,
+    replay_spooled_runs,
+    spooled_runs,
+)
+
+
+def _spool_run(spool_dir, tmpdir, end=True):
+    artifacts_dpath = str(tmpdir.mkdir('artifacts'))
+    os.makedirs(os.path.join(artifacts_dpath, 'sub'))
+    for rel_fpath in ['a.txt', os.path.join('sub', 'b.txt')]:
+        with open(os.path.join(artifacts_dpath, rel_fpath), 'wt') as f:
+            f.write(rel_fpath)
+    log_fpath = str(tmpdir.join('log.txt'))
+    with open(log_fpath, 'wt') as f:
+        f.write("some log line\n")
+    spool = RunSpool.create(
+        experiment_name='/Shared/Tests/actarius_test_basic',
+        run_name='some_run',
+        spool_dir=spool_dir,
+    )
+    spool.log_tags({'key': 'value'})
+    spool.log_params({'a': 3})
+    spool.log_metrics([
+        Metric('loss', 1 / (step + 1), 1000 + step, step)
+        for step in range(5)
+    ])
+    spool.log_artifacts(artifacts_dpath)
+    spool.log_files([log_fpath])
+    if end:
+        spool.end()
+    return spool
+
+
+def test_replay_spooled_run(tmpdir):
+    spool_dir = str(tmpdir.join('spool'))
+    spool = _spool_run(spool_dir, tmpdir)
+    client = MagicMock()
+    client.create_run.return_value.info.run_id = 'remote_run_id'
+    with patch('actarius.spool.tracking_client', return_value=client), \
+            patch('actarius.spool.log_batch') as log_batch, \
+            patch('actarius.spool.log_artifact_files') as log_artifacts:
+        run_ids, failed = replay_spooled_runs(spool_dir=spool_dir)
+    assert (run_ids, failed) == (['remote_run_id'], [])
+    kwargs = log_batch.call_args[1]
+    assert kwargs['tags']['key'] == 'value'
+    assert kwargs['tags']['mlflow.runName'] == 'some_run'
+    assert kwargs['params'] == {'a': '3'}
+    assert [(m.key, m.step) for m in kwargs['metrics']] == [
+        ('loss', step) for step in range(5)]
+    artifact_files = log_artifacts.call_args[0][1]
+    assert sorted(
+        (os.path.basename(fpath), artifact_path)
+        for fpath, artifact_path in artifact_files
+    ) == [('a.txt', None), ('b.txt', 'sub'), ('log.txt', None)]
+    assert client.set_terminated.call_args[1]['status'] == 'FINISHED'
+    assert not os.path.exists(spool.dpath)
+
+
+def test_incomplete_and_failed_replays_stay_spooled(tmpdir):
+    spool_dir = str(tmpdir.join('spool'))
+    spool = _spool_run(spool_dir, tmpdir, end=False)
+    # a line cut short by a crash
+    with open(os.path.join(spool.dpath, JOURNAL_FNAME), 'at') as f:
+        f.write('{"type": "metr')
+    assert not spool.is_ended()
+    client = MagicMock()
+    client.get_experiment_by_name.side_effect = ConnectionError()
+    with patch('actarius.spool.tracking_client', return_value=client), \
+            patch.dict(shared._EXPERIMENT_IDS, clear=True), \
+            patch('actarius.transport.time.sleep'):
+        assert replay_spooled_runs(spool_dir=spool_dir) == ([], [])
+        with pytest.warns(UserWarning):
+            run_ids, failed = replay_spooled_runs(
+                spool_dir=spool_dir, include_incomplete=True)
+    assert (run_ids, failed) == ([], [spool.dpath])
+    assert [s.dpath for s in spooled_runs(spool_dir)] == [spool.dpath]
+    assert os.listdir(spool.dpath).count('replay.lock') == 0
+
+
+def test_failed_replays_resume(tmpdir):
+    spool_dir = str(tmpdir.join('spool'))
+    spool = _spool_run(spool_dir, tmpdir)
+    client = MagicMock()
+    client.create_run.return_value.info.run_id = 'remote_run_id'
+    client.set_terminated.side_effect = [ConnectionError(), None]
+    with patch('actarius.spool.tracking_client', return_value=client), \
+            patch.dict(shared._EXPERIMENT_IDS, clear=True), \
+            patch('actarius.spool.log_batch') as log_batch, \
+            patch('actarius.spool.log_artifact_files'):
+        with pytest.warns(UserWarning):
+            assert replay_spooled_runs(spool_dir=spool_dir) == (
+                [], [spool.dpath])
+        assert replay_spooled_runs(spool_dir=spool_dir) == (
+            ['remote_run_id'], [])
+    assert client.create_run.call_count == 1
+    assert log_batch.call_count == 1
+    assert client.set_terminated.call_count == 2
+
+
+def test_file_store_runs_are_imported_once(tmpdir):
+    spool_dir = str(tmpdir.join('spool'))
+    spool = RunSpool.create(
+        experiment_name='/Shared/Tests/actarius_test_basic',
+        run_name='some_run',
+        spool_dir=spool_dir,
+    )
+    spool.log_file_store_run('local_run_id')
+    spool.end()
+    local_run = (
+        MagicMock(status='FINISHED', end_time=2000),
+        {'mlflow.runName': 'local_name', 'key': 'value'},
+        {'a': '3'},
+        [Metric('loss', 0.5, 1000, step) for step in range(3)],
+        [(str(tmpdir.join('model.txt')), None)],
+    )
+    client = MagicMock()
+    client.create_run.return_value.info.run_id = 'remote_run_id'
+    client.set_terminated.side_effect = [ConnectionError(), None]
+    with patch('actarius.spool.tracking_client', return_value=client), \
+            patch('actarius.spool._read_file_store_run',
+                  return_value=local_run), \
+            patch('actarius.spool.log_batch') as log_batch, \
+            patch('actarius.spool.log_artifact_files') as log_artifacts:
+        with pytest.warns(UserWarning):
+            replay_spooled_runs(spool_dir=spool_dir)
+        assert replay_spooled_runs(spool_dir=spool_dir) == (
+            ['remote_run_id'], [])
+    assert log_batch.call_count == 1
+    kwargs = log_batch.call_args[1]
+    assert kwargs['spool_on_failure'] is False
+    assert kwargs['tags'] == {'mlflow.runName': 'some_run', 'key': 'value'}
+    assert kwargs['params'] == {'a': '3'}
+    assert len(kwargs['metrics']) == 3
+    assert log_artifacts.call_count == 1
+    assert log_artifacts.call_args[1]['spool_on_failure'] is False
+    assert client.set_terminated.call_args[1]['status'] == 'FINISHED'
+
+
+def test_only_failed_replays_are_kept(tmpdir):
+    spool_dir = str(tmpdir.join('spool'))
+    spools = {}
+    # the failing run is replayed first
+    for i, run_name in enumerate(['bad', 'good']):
+        spools[run_name] = RunSpool(
+            os.path.join(spool_dir, '{}_{}'.format(i, run_name)))
+        spools[run_name].append(
+            'run', experiment_name='/Shared/Tests/actarius_test_basic',
+            run_name=run_name, run_id=None, start_time=1000)
+        spools[run_name].end()
+
+    def create_run(experiment_id, start_time, tags):
+        if tags['mlflow.runName'] == 'bad':
+            raise ValueError('bad run')
+        return MagicMock(info=MagicMock(run_id='remote_run_id'))
+
+    client = MagicMock()
+    client.create_run.side_effect = create_run
+    with patch('actarius.spool.tracking_client', return_value=client), \
+            patch('actarius.spool.log_batch'), \
+            patch('actarius.spool.log_artifact_files'), \
+            pytest.warns(UserWarning):
+        run_ids, failed = replay_spooled_runs(spool_dir=spool_dir)
+    assert (run_ids, failed) == (['remote_run_id'], [spools['bad'].dpath])
+    assert [s.dpath for s in spooled_runs(spool_dir)] == [spools['bad'].dpath]
+
+
+def _lock(spool, host, pid, locked_at):
+    with open(os.path.join(spool.dpath, LOCK_FNAME), 'wt') as f:
+        json.dump({'host': host, 'pid': pid, 'time': locked_at}, f)
+
+
+def test_stale_replay_locks_are_broken(tmpdir):
+    spool_dir = str(tmpdir.join('spool'))
+    spool = _spool_run(spool_dir, tmpdir)
+    client = MagicMock()
+    client.create_run.return_value.info.run_id = 'remote_run_id'
+    with patch('actarius.spool.tracking_client', return_value=client), \
+            patch.dict(shared._EXPERIMENT_IDS, clear=True), \
+            patch('actarius.spool.log_batch'), \
+            patch('actarius.spool.log_artifact_files'):
+        # held by a live replay, on this host or on another
+        _lock(spool, socket.gethostname(), os.getpid(), 0)
+        assert replay_spooled_runs(spool_dir=spool_dir) == ([], [])
+        _lock(spool, 'other_host', 1, time.time())
+        assert replay_spooled_runs(spool_dir=spool_dir) == ([], [])
+        # held by a replay of another host for too long
+        _lock(spool, 'other_host', 1, 0)
+        assert replay_spooled_runs(spool_dir=spool_dir) == (
+            ['remote_run_id'], [])
+    assert not os.path.exists(spool.dpath)
+
+
+def test_replay_cli(tmpdir):
+    spool_dir = str(tmpdir.join('spool'))
+    with patch('actarius.spool.replay_spooled_runs',
+               return_value=(['some_run_id'], [])) as replay:
+        assert main(['replay', '--spool-dir', spool_dir, '--keep']) == 0
+    assert replay.call_args[1] == {
+        'spool_dir': spool_dir, 'include_incomplete': False, 'keep': True}
+    assert main([]) == 2
+
+
+def test_experiment_run_is_spooled_when_mlflow_is_unreachable(tmpdir):
+    from mlflow.exceptions import MlflowException
+    from actarius import ExperimentRun
+
+    spool_dir = str(tmpdir.join('spool'))
+    exp = ExperimentRun('/Shared/Tests/actarius_test_basic')
+    exp.log_param('a', 3)
+    exp.log_metric('loss', 0.5, step=1)
+    exp.log_obj_as_text([1, 3, 5], 'int_list.txt')
+    with patch('actarius.exp_obj._experiment_id',
+               side_effect=MlflowException('down')), \
+            patch('actarius.spool.spool_dpath', return_value=spool_dir), \
+            pytest.warns(UserWarning, match='spooled'):
+        exp.end_run(tags={'key': 'value'})
+    assert exp.disabled
+    spools = spooled_runs(spool_dir)
+    assert len(spools) == 1 and spools[0].is_ended()
+    records = spools[0].records()
+    assert [record['type'] for record in records] == [
+        'run', 'tags', 'params', 'metrics', 'artifacts', 'artifacts', 'end']
+    assert records[1]['tags']['key'] == 'value'
+    assert {m[0] for m in records[3]['metrics']} == {'loss', 'runtime_in_sec'}
+
+
+def test_context_run_is_spooled_when_it_fails_to_start(tmpdir):
+    from mlflow.exceptions import MlflowException
+    from actarius import ExperimentRunContext
+
+    spool_dir = str(tmpdir.join('spool'))
+    with patch('actarius.contextmgr._with_experiment_id',
+               side_effect=MlflowException('down')), \
+            patch('actarius.spool.spool_dpath', return_value=spool_dir), \
+            pytest.warns(UserWarning, match='spooled'):
+        with ExperimentRunContext('/Shared/Tests/actarius_test_basic') as exp:
+            pass
+    assert not exp.disabled
+    spools = spooled_runs(spool_dir)
+    assert len(spools) == 1
+
+
+def test_replay_fallback_spool(tmpdir):
+    spool_dir = str(tmpdir.join('spool'))
+    spool = RunSpool.create(run_id='remote_run_id', spool_dir=spool_dir)
+    spool.log_params({'a': 3})
+    spool.end(status=None)
+    client = MagicMock()
+    with patch('actarius.spool.tracking_client', return_value=client), \
+            patch('actarius.spool.log_batch') as log_batch, \
+            patch('actarius.spool.log_artifact_files'):
+        run_ids, failed = replay_spooled_runs(spool_dir=spool_dir)
+    assert (run_ids, failed) == (['remote_run_id'], [])
+    assert log_batch.call_args[1]['params'] == {'a': '3'}
+    assert not client.create_run.called
+    assert not client.set_terminated.called
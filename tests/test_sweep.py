@@ -0,0 +1,110 @@
+"""Testing the bulk run logging of the actarius package."""
+
+import os
+from unittest.mock import MagicMock, patch
+
+import pytest
+from mlflow.entities import Metric
+
+from actarius import RunBatch, shared, transport
+from actarius.spool import spooled_runs
+from actarius.transport import CircuitBreaker
+
+
+TEST_EXP_PATH = "/Shared/Tests/actarius_test_basic"
+
+
+@pytest.fixture
+def client():
+    client = MagicMock()
+    client.get_experiment_by_name.return_value.experiment_id = 'exp_id'
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout_sec=60)
+    with patch('actarius.sweep.tracking_client', return_value=client), \
+            patch('actarius.shared.tracking_client', return_value=client), \
+            patch.object(transport, 'circuit_breaker', return_value=breaker), \
+            patch.object(transport.time, 'sleep'), \
+            patch.dict(shared._EXPERIMENT_IDS, clear=True):
+        yield client
+
+
+def test_run_batch(client, tmpdir):
+    run_ids = iter(range(100))
+    client.create_run.side_effect = lambda **kwargs: MagicMock(
+        info=MagicMock(run_id='run_{}'.format(next(run_ids))))
+    fpath = str(tmpdir.join('model.txt'))
+    with open(fpath, 'wt') as f:
+        f.write('model')
+    batch = RunBatch(TEST_EXP_PATH, parent_run_id='sweep_run_id')
+    for i in range(20):
+        batch.add(
+            params={'alpha': i},
+            metrics={'auc': i / 20},
+            tags={'trial': i},
+            run_name='trial_{}'.format(i),
+            start_time=1000,
+            end_time=2000,
+        )
+    batch.add(
+        metrics=[Metric('loss', 1 / (s + 1), 1000 + s, s) for s in range(5)],
+        artifacts=[fpath],
+        status='FAILED',
+    )
+    assert len(batch) == 21
+    with patch('actarius.sweep.log_artifact_files') as log_artifacts:
+        run_ids = batch.log(max_workers=4)
+    assert len(batch) == 0
+    assert len(set(run_ids)) == 21
+    assert client.get_experiment_by_name.call_count == 1
+    assert client.create_run.call_count == 21
+    assert client.log_batch.call_count == 21
+    kwargs = client.create_run.call_args_list[0][1]
+    assert kwargs['experiment_id'] == 'exp_id'
+    assert kwargs['start_time'] == 1000
+    assert kwargs['tags']['mlflow.parentRunId'] == 'sweep_run_id'
+    statuses = sorted(
+        call[1]['status'] for call in client.set_terminated.call_args_list)
+    assert statuses == ['FAILED'] + ['FINISHED'] * 20
+    assert [args[1] for args, _ in log_artifacts.call_args_list if args[1]] \
+        == [[(fpath, None)]]
+
+
+def test_run_batch_spools_when_offline(client, tmpdir):
+    client.create_run.side_effect = ConnectionError()
+    spool_dir = str(tmpdir.join('spool'))
+    batch = RunBatch(TEST_EXP_PATH)
+    batch.add(
+        params={'alpha': 1}, metrics={'auc': 0.5}, run_name='trial',
+        start_time=1000, end_time=2000)
+    with patch('actarius.spool.spool_dpath', return_value=spool_dir), \
+            pytest.warns(UserWarning, match='1 of 1 runs were spooled'):
+        run_ids = batch.log()
+    assert run_ids == [None]
+    spools = spooled_runs(spool_dir)
+    assert len(spools) == 1 and spools[0].is_ended()
+    records = spools[0].records()
+    record_types = [record['type'] for record in records]
+    assert record_types == ['run', 'tags', 'params', 'metrics', 'end']
+    assert records[0]['start_time'] == 1000
+    assert records[-1]['end_time'] == 2000
+    assert os.path.isdir(spool_dir)
+    assert len(batch) == 0
+
+
+def test_failed_runs_stay_in_batch(client):
+    run_ids = iter(range(100))
+    client.create_run.side_effect = lambda **kwargs: MagicMock(
+        info=MagicMock(run_id='run_{}'.format(next(run_ids))))
+    batch = RunBatch(TEST_EXP_PATH)
+    for i in range(3):
+        batch.add(params={'alpha': i}, run_name='trial_{}'.format(i))
+    with patch('actarius.sweep.log_batch',
+               side_effect=[None, ValueError('bad param'), None, None]) \
+            as log_batch:
+        with pytest.raises(ValueError):
+            batch.log(max_workers=1)
+        assert len(batch) == 1
+        assert batch.log() == ['run_1']
+    assert len(batch) == 0
+    # the run created by the failed attempt is reused
+    assert client.create_run.call_count == 3
+    assert log_batch.call_count == 4
@@ -0,0 +1,39 @@
+"""Testing the on-disk tag cache of the actarius package."""
+
+import os
+import time
+
+from actarius.tagcache import TagCache
+
+
+def test_tag_cache_get_and_put(tmpdir):
+    dpath = str(tmpdir.join('cache'))
+    cache = TagCache(dpath=dpath, ttl_sec=60)
+    assert cache.get('key') is None
+    cache.put('key', {'git_branch': 'master'})
+    assert cache.get('key') == {'git_branch': 'master'}
+    assert cache.get('other_key') is None
+    # another process sees the same entry
+    assert TagCache(dpath=dpath, ttl_sec=60).get('key') == {
+        'git_branch': 'master'}
+
+
+def test_tag_cache_evicts_expired_entries(tmpdir):
+    dpath = str(tmpdir.join('cache'))
+    cache = TagCache(dpath=dpath, ttl_sec=60)
+    cache.put('old_key', {'a': '1'})
+    old_time = time.time() - 120
+    for fname in os.listdir(dpath):
+        os.utime(os.path.join(dpath, fname), (old_time, old_time))
+    assert cache.get('old_key') is None
+    cache.put('new_key', {'b': '2'})
+    assert len(os.listdir(dpath)) == 1
+    assert cache.get('new_key') == {'b': '2'}
+
+
+def test_disabled_tag_cache_writes_nothing(tmpdir):
+    dpath = str(tmpdir.join('cache'))
+    cache = TagCache(dpath=dpath, ttl_sec=0)
+    cache.put('key', {'a': '1'})
+    assert cache.get('key') is None
+    assert not os.path.exists(dpath)
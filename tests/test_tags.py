@@ -0,0 +1,110 @@
+"""Testing the tag collector registry of the actarius package."""
+
+import time
+import threading
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from actarius.tags import (
+    _PROCESS_CACHE,
+    CachePolicy,
+    TagCollector,
+    collect_tags,
+    register_tag_collector,
+    shared_tags,
+    tag_collectors,
+    unregister_tag_collector,
+)
+from actarius.tagcache import TagCache
+
+
+@pytest.fixture(autouse=True)
+def clear_process_cache():
+    _PROCESS_CACHE.clear()
+    yield
+    _PROCESS_CACHE.clear()
+
+
+def test_shared_tags_are_probed_once_per_host(tmpdir):
+    cache = TagCache(dpath=str(tmpdir.join('cache')), ttl_sec=60)
+    snapshot = MagicMock()
+    snapshot.as_tags.return_value = {'git_branch': 'master'}
+    with patch('actarius.tags.host_tag_cache', return_value=cache), \
+            patch('actarius.tags.git_snapshot',
+                  return_value=snapshot) as git_snapshot:
+        tags = shared_tags()
+        # as if in a new process
+        _PROCESS_CACHE.clear()
+        assert shared_tags() == tags
+    assert git_snapshot.call_count == 1
+    assert tags['git_branch'] == 'master'
+    assert 'sagemaker_instance_name' in tags
+
+
+def test_registered_collectors_are_collected():
+    register_tag_collector(
+        name='slurm',
+        collect=lambda: {'slurm_job_id': '17'},
+        cache_policy=CachePolicy.NONE,
+    )
+    try:
+        assert 'slurm' in [c.name for c in tag_collectors()]
+        assert shared_tags()['slurm_job_id'] == '17'
+    finally:
+        unregister_tag_collector('slurm')
+    assert 'slurm_job_id' not in shared_tags()
+
+
+def test_collectors_run_concurrently():
+    def _slow_collector(i):
+        def _collect():
+            time.sleep(0.3)
+            return {'tag_{}'.format(i): str(i)}
+        return TagCollector(
+            name='slow_{}'.format(i),
+            collect=_collect,
+            cache_policy=CachePolicy.NONE,
+        )
+
+    start = time.monotonic()
+    tags = collect_tags([_slow_collector(i) for i in range(5)])
+    duration = time.monotonic() - start
+    print("Collected 5 slow collectors in {:.2f} seconds".format(duration))
+    assert tags == {'tag_{}'.format(i): str(i) for i in range(5)}
+    assert duration < 1.0
+
+
+def test_hanging_and_failing_collectors_are_skipped():
+    release = threading.Event()
+
+    def _fail():
+        raise RuntimeError("no cluster here")
+
+    collectors = [
+        TagCollector('hanging', lambda: release.wait() and {'hanging': '1'},
+                     timeout_sec=0.2, cache_policy=CachePolicy.NONE),
+        TagCollector('failing', _fail, cache_policy=CachePolicy.NONE),
+        TagCollector('quick', lambda: {'quick': '1'},
+                     cache_policy=CachePolicy.NONE),
+    ]
+    start = time.monotonic()
+    with pytest.warns(UserWarning) as record:
+        tags = collect_tags(collectors)
+    release.set()
+    assert time.monotonic() - start < 1.0
+    assert tags == {'quick': '1'}
+    messages = ' '.join(str(warning.message) for warning in record)
+    assert 'hanging' in messages and 'failing' in messages
+
+
+def test_process_cache_policy():
+    collect = MagicMock(return_value={'cuda_version': '12.1'})
+    collector = TagCollector('cuda', collect)
+    assert collect_tags([collector]) == collect_tags([collector])
+    assert collect.call_count == 1
+
+
+def test_unknown_cache_policy():
+    with pytest.raises(ValueError):
+        TagCollector('bad', dict, cache_policy='forever')
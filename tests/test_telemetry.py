@@ -0,0 +1,50 @@
+"""Testing the resource telemetry of the actarius package."""
+
+import time
+
+from actarius.metrics import MetricBuffer
+from actarius.telemetry import (
+    METRIC_PREFIX,
+    ResourceSampler,
+)
+
+
+def test_resource_sampler_logs_step_metrics_and_summary(tmpdir):
+    buffer = MetricBuffer()
+    sampler = ResourceSampler(log_fn=buffer.log_dict, interval_sec=0.02)
+    sampler.start()
+    data = [bytearray(1024 * 1024) for _ in range(20)]
+    with open(str(tmpdir.join('data.bin')), 'wb') as f:
+        for chunk in data:
+            f.write(chunk)
+    start = time.monotonic()
+    while time.monotonic() - start < 0.2:
+        pass  # keep a core busy
+    summary = sampler.stop()
+    assert sampler.n_samples >= 3
+    for name in ['cpu_percent', 'rss_mb', 'read_mb', 'write_mb',
+                 'n_threads']:
+        history = buffer.history(METRIC_PREFIX + name)
+        assert [step for step, _, _ in history] == list(
+            range(len(history)))
+    assert buffer.latest()[METRIC_PREFIX + 'n_threads'] >= 2
+    assert max(
+        value for _, _, value in buffer.history(METRIC_PREFIX + 'cpu_percent')
+    ) > 50
+    assert summary[METRIC_PREFIX + 'peak_rss_mb'] >= 20
+    assert summary[METRIC_PREFIX + 'cpu_sec'] >= 0.1
+
+
+def test_resource_sampler_overhead():
+    sampler = ResourceSampler(log_fn=None, interval_sec=10)
+    sampler.start()
+    n_samples = 1000
+    start = time.perf_counter()
+    for _ in range(n_samples):
+        sampler.sample()
+    sample_sec = (time.perf_counter() - start) / n_samples
+    sampler.stop()
+    overhead_percent = 100 * sample_sec / sampler.interval_sec
+    print("A sample takes {:.1f} us; {:.4f}% overhead at the default "
+          "interval".format(sample_sec * 1e6, overhead_percent))
+    assert overhead_percent < 1
@@ -0,0 +1,131 @@
+"""Testing the resilient transport of the actarius package."""
+
+import errno
+import socket
+from unittest.mock import MagicMock, patch
+
+import pytest
+import requests
+
+from actarius import transport
+from actarius.transport import (
+    CircuitBreaker,
+    CircuitOpenError,
+    backoff_sec,
+    call,
+    is_transient,
+)
+
+
+class TransientError(Exception):
+    error_code = 'TEMPORARILY_UNAVAILABLE'
+
+
+@pytest.fixture
+def breaker():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout_sec=60)
+    with patch('actarius.transport.circuit_breaker', return_value=breaker), \
+            patch('actarius.transport.time.sleep') as sleep:
+        breaker.sleep = sleep
+        yield breaker
+
+
+def test_breaker_opens_and_recovers():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout_sec=60)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    with patch('actarius.transport.time.monotonic', return_value=1e12):
+        # a single probe is allowed once the reset timeout passes
+        assert breaker.allow()
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        assert not breaker.allow()
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+    with patch('actarius.transport.time.monotonic', return_value=2e12):
+        assert breaker.allow()
+        breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow()
+    assert breaker.n_opened == 2
+
+
+def test_only_network_errors_are_transient():
+    assert is_transient(ConnectionResetError())
+    assert is_transient(socket.timeout())
+    assert is_transient(requests.exceptions.ConnectionError())
+    assert is_transient(requests.exceptions.ReadTimeout())
+    assert is_transient(TransientError())
+    assert not is_transient(OSError(errno.ENOSPC, 'No space left on device'))
+    assert not is_transient(FileNotFoundError())
+    assert not is_transient(ValueError())
+
+
+def test_default_mlflow_errors_are_not_transient():
+    from mlflow.exceptions import MlflowException
+    from mlflow.protos.databricks_pb2 import REQUEST_LIMIT_EXCEEDED
+    assert not is_transient(MlflowException('not configured'))
+    assert is_transient(MlflowException(
+        'throttled', error_code=REQUEST_LIMIT_EXCEEDED))
+
+
+def test_call_retries_transient_errors(breaker):
+    fn = MagicMock(side_effect=[ConnectionError(), TransientError(), 'res'])
+    assert call(fn, 1, max_attempts=5, a=2) == 'res'
+    assert fn.call_count == 3
+    fn.assert_called_with(1, a=2)
+    assert breaker.sleep.call_count == 2
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_call_does_not_retry_other_errors(breaker):
+    fn = MagicMock(side_effect=ValueError())
+    with pytest.raises(ValueError):
+        call(fn, max_attempts=5)
+    assert fn.call_count == 1
+    fn = MagicMock(side_effect=ConnectionError())
+    with pytest.raises(ConnectionError):
+        call(fn, idempotent=False, max_attempts=5)
+    assert fn.call_count == 1
+
+
+def test_call_falls_back_once_open(breaker):
+    fn = MagicMock(side_effect=ConnectionError())
+    fallback = MagicMock(return_value='spooled')
+    assert call(fn, max_attempts=5, fallback=fallback) == 'spooled'
+    # the breaker opened after three failures, cutting the retries short
+    assert fn.call_count == 3
+    assert breaker.state == CircuitBreaker.OPEN
+    assert call(fn, fallback=fallback) == 'spooled'
+    assert fn.call_count == 3
+    with pytest.raises(CircuitOpenError):
+        call(fn)
+
+
+def test_backoff_is_jittered_and_capped():
+    with patch.object(transport, 'CFG', {
+        transport.CfgKey.RETRY_BACKOFF_BASE_SEC: 0.5,
+        transport.CfgKey.RETRY_BACKOFF_MAX_SEC: 3,
+    }):
+        waits = [backoff_sec(attempt) for attempt in range(1, 7)]
+        assert all(0 <= wait <= 3 for wait in waits)
+        assert all(backoff_sec(1) <= 0.5 for _ in range(100))
+        assert len({backoff_sec(10) for _ in range(10)}) > 1
+
+
+def test_log_batch_spools_on_failure(breaker):
+    from actarius.shared import log_batch
+    client = MagicMock()
+    client.log_batch.side_effect = ConnectionError()
+    spool = MagicMock()
+    with patch('actarius.shared.tracking_client', return_value=client), \
+            patch('actarius.spool.fallback_spool', return_value=spool) as fs:
+        log_batch('run_id', tags={'key': 'value'}, metrics={'loss': 1})
+        fs.assert_called_with('run_id')
+        tags, params, metrics = spool.log_batch.call_args[0]
+        assert [(tag.key, tag.value) for tag in tags] == [('key', 'value')]
+        assert [metric.key for metric in metrics] == ['loss']
+        with pytest.raises(CircuitOpenError):
+            log_batch('run_id', tags={'a': 1}, spool_on_failure=False)